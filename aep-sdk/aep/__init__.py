@@ -1 +1,35 @@
-# AEP SDK package 
\ No newline at end of file
+# AEP SDK package
+#
+# Public names are resolved lazily on first access, so `import aep` stays cheap and the
+# LangChain integration (aep.callback) is only loaded by code that actually uses it.
+import importlib
+from typing import Any, List
+
+_LAZY_ATTRS = {
+    "AEPLedger": "aep.ledger",
+    "process_shard_id": "aep.ledger",
+    "EventFilter": "aep.query",
+    "SegmentReader": "aep.reader",
+    "LedgerManifest": "aep.manifest",
+    "RetentionPolicy": "aep.retention",
+    "LedgerMaintenance": "aep.retention",
+    "follow": "aep.follow",
+    "compute_stats": "aep.stats",
+    "REGISTRY": "aep.metrics",
+    "AEPCallbackHandler": "aep.callback",
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'aep' has no attribute '{name}'")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value  # Later lookups skip __getattr__.
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -1,16 +1,18 @@
 import time
 import hashlib
+import threading
 import msgpack
 # import os # No longer directly needed for path manipulation here
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Union
-from uuid import UUID
+from uuid import UUID, uuid4
 
 from langchain_core.callbacks.base import BaseCallbackHandler
 from langchain_core.outputs import LLMResult, ChatGenerationChunk, GenerationChunk
 from langchain_core.documents import Document # Added for typing
 
 from .ledger import AEPLedger # Import the new AEPLedger class
+from .metrics import REGISTRY
 
 # DEFAULT_AEP_DIR and DEFAULT_LEDGER_FILE are now managed by AEPLedger
 # or passed to it. Not directly needed here if ledger is injected.
@@ -38,6 +40,136 @@ class AEPCallbackHandler(BaseCallbackHandler):
         self._current_query_id: Optional[str] = None
         self._current_metadata: Optional[Dict[str, Any]] = None
         self._current_run_id_stack: List[UUID] = [] # To track chain hierarchy
+        # Open spans keyed by run_id. Each chain/retriever/LLM run gets a span event
+        # with its start, end and duration once it finishes (see _end_span).
+        self._open_spans: Dict[UUID, Dict[str, Any]] = {}
+        self._spans_lock = threading.Lock()
+        # Wall-clock time of the first streamed token, keyed by LLM run_id (see on_llm_new_token).
+        self._first_token_ts: Dict[UUID, float] = {}
+
+    def _start_span(
+        self,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        name: str,
+        kind: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Open a span for run_id. The trace_id is taken from metadata['query_id'],
+        inherited from the parent span, or falls back to the run_id."""
+        with self._spans_lock:
+            if metadata and "query_id" in metadata:
+                trace_id = str(metadata["query_id"])
+            elif parent_run_id is not None and parent_run_id in self._open_spans:
+                trace_id = self._open_spans[parent_run_id]["trace_id"]
+            else:
+                trace_id = str(run_id)
+            self._open_spans[run_id] = {
+                "name": name,
+                "kind": kind,
+                "trace_id": trace_id,
+                "query_id": str(metadata["query_id"]) if metadata and "query_id" in metadata else None,
+                "parent_run_id": parent_run_id,
+                "start_ts": time.time(),
+                "start_perf": time.perf_counter(),
+            }
+
+    def _open_span(self, run_id: UUID) -> Optional[Dict[str, Any]]:
+        """run_id's open span, or None if it has none. Read it before _end_span removes it."""
+        with self._spans_lock:
+            return self._open_spans.get(run_id)
+
+    def _end_span(self, run_id: UUID, status: str = "ok") -> None:
+        """Close the span for run_id (if one was opened) and log it as a span event."""
+        end_perf = time.perf_counter()
+        with self._spans_lock:
+            span = self._open_spans.pop(run_id, None)
+        if span is None:
+            return
+        duration_s = end_perf - span["start_perf"]
+        self._append_span_event(
+            name=span["name"],
+            kind=span["kind"],
+            start_ts=span["start_ts"],
+            end_ts=span["start_ts"] + duration_s,
+            run_id=run_id,
+            parent_run_id=span["parent_run_id"],
+            trace_id=span["trace_id"],
+            status=status,
+        )
+
+    def record_span(
+        self,
+        name: str,
+        kind: str,
+        start_ts: float,
+        end_ts: float,
+        *,
+        parent_run_id: Optional[UUID] = None,
+        trace_id: Optional[str] = None,
+        run_id: Optional[UUID] = None,
+    ) -> None:
+        """
+        Logs a span for work that LangChain does not report through callbacks
+        (e.g. a direct embedding call inside a graph node).
+
+        Args:
+            name: Span name, e.g. 'embed_query'.
+            kind: Span kind, e.g. 'embedding' or 'retriever'.
+            start_ts: Wall-clock start time (time.time()).
+            end_ts: Wall-clock end time (time.time()).
+            parent_run_id: run_id of the enclosing chain/node, used to nest the span.
+            trace_id: Trace to attach to. Inherited from the parent span if omitted.
+            run_id: Identifier for this span. A new one is generated if omitted.
+        """
+        if trace_id is None:
+            with self._spans_lock:
+                parent = self._open_spans.get(parent_run_id) if parent_run_id is not None else None
+            trace_id = parent["trace_id"] if parent else str(parent_run_id or run_id or "")
+        self._append_span_event(
+            name=name,
+            kind=kind,
+            start_ts=start_ts,
+            end_ts=end_ts,
+            run_id=run_id or uuid4(),
+            parent_run_id=parent_run_id,
+            trace_id=trace_id,
+        )
+
+    def _append_span_event(
+        self,
+        name: str,
+        kind: str,
+        start_ts: float,
+        end_ts: float,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        trace_id: str,
+        status: str = "ok",
+    ) -> None:
+        duration_ms = (end_ts - start_ts) * 1000
+        REGISTRY.histogram(
+            "aep_span_seconds", "Duration of traced chain/retriever/LLM/embedding runs.", span=name, kind=kind
+        ).observe(duration_ms / 1000)
+        self.ledger.append({
+            "id": hashlib.sha256(msgpack.packb({"span": name, "run_id": str(run_id)})).hexdigest(),
+            "ts": end_ts,
+            "focus_ms": int(round(duration_ms)),
+            "trace_id": trace_id,
+            "parent_run_id": str(parent_run_id) if parent_run_id else None,
+            "run_id": str(run_id),
+            "event_type": "span",
+            "event_source": name,
+            "payload": {
+                "name": name,
+                "kind": kind,
+                "start_ts": start_ts,
+                "end_ts": end_ts,
+                "duration_ms": round(duration_ms, 3),
+                "status": status,
+            },
+            "focus_kind": "span",
+        })
 
     # Helper method to safely process inputs/outputs for logging
     def _process_io_for_logging(self, io_data: Any) -> Any:
@@ -114,6 +246,7 @@ class AEPCallbackHandler(BaseCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Record the start time and capture query_id from metadata."""
+        self._start_span(run_id, parent_run_id, _run_name(serialized, kwargs, "llm"), "llm", metadata)
         self._start_time = time.time()
         self._current_metadata = metadata
         if metadata and "query_id" in metadata:
@@ -124,6 +257,18 @@ class AEPCallbackHandler(BaseCallbackHandler):
             # Let's keep it simple: if not in metadata, it's not logged for now.
             self._current_query_id = None
 
+    def on_llm_new_token(
+        self,
+        token: str,
+        *,
+        chunk: Optional[Union[GenerationChunk, ChatGenerationChunk]] = None,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        """Record when a streaming LLM call produced its first token (time-to-first-token)."""
+        with self._spans_lock:
+            self._first_token_ts.setdefault(run_id, time.time())
 
     def on_llm_end(
         self,
@@ -134,46 +279,85 @@ class AEPCallbackHandler(BaseCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Compute latency and log AEP event to MsgPack file on LLM end."""
-        if self._start_time is None:
+        # The run's own span holds its start time and query_id: the handler-wide ones are
+        # overwritten when calls from concurrent requests overlap.
+        span = self._open_span(run_id)
+        self._end_span(run_id)
+        with self._spans_lock:
+            first_token_ts = self._first_token_ts.pop(run_id, None)
+        start_time = span["start_ts"] if span else self._start_time
+        query_id = span["query_id"] if span else self._current_query_id
+        if start_time is None:
             # This can happen if on_llm_error is called before on_llm_end,
             # or if on_llm_start was not called.
             return
 
         end_time = time.time()
-        latency_ms = int((end_time - self._start_time) * 1000)
+        latency_ms = int((end_time - start_time) * 1000)
+        # Only streamed calls report tokens as they arrive; for the others the first token is the whole answer.
+        ttft_ms = int((first_token_ts - start_time) * 1000) if first_token_ts is not None else None
 
         if response.generations and response.generations[0]:
             # Assuming the first generation from the first response is the primary one
             generation = response.generations[0][0]
-            payload_content = generation.text
-            
-            payload = {"role": "assistant", "content": payload_content}
-            
-            # Generate ID based on this payload as per prod.md
-            # id: "<sha256(payload)>" -> refers to the dict, not just content
-            event_id_source = msgpack.packb(payload)
-            event_id = hashlib.sha256(event_id_source).hexdigest()
-
-            aep_event: Dict[str, Any] = {
-                "id": event_id,
-                "ts": end_time,
-                "focus_ms": latency_ms,
-                "payload": payload,
-                "focus_kind": "exec_latency",
-            }
-
-            # Add query_id if captured
-            if self._current_query_id:
-                aep_event["query_id"] = self._current_query_id
-            # Potentially add other metadata fields if specified in future
-            # e.g. run_id, parent_run_id if they are useful for tracing
-
-            self.ledger.append(aep_event) # Use the ledger instance
+            self.record_exec_latency(generation.text, latency_ms, query_id=query_id, ts=end_time, ttft_ms=ttft_ms)
 
         self._start_time = None  # Reset for the next call
         self._current_query_id = None # Reset
         self._current_metadata = None # Reset
 
+    def record_exec_latency(
+        self,
+        content: str,
+        latency_ms: int,
+        *,
+        query_id: Optional[str] = None,
+        cache_hit: bool = False,
+        ts: Optional[float] = None,
+        ttft_ms: Optional[int] = None,
+    ) -> None:
+        """
+        Logs an exec_latency event for an answer. on_llm_end uses it for LLM calls; code that
+        serves an answer without one (e.g. from a response cache) calls it with cache_hit=True.
+
+        Args:
+            content: The answer text.
+            latency_ms: Time taken to produce the answer.
+            query_id: Query the answer belongs to, if known.
+            cache_hit: Marks the event as served from a cache. Hits also get their own id, as
+                       the id is otherwise derived from the answer alone.
+            ts: Event time. Defaults to now.
+            ttft_ms: Time to the first streamed token, for streamed answers. Logged as
+                     'ttft_ms' next to the total latency and exported as aep_llm_ttft_seconds.
+        """
+        payload = {"role": "assistant", "content": content}
+
+        # Generate ID based on this payload as per prod.md
+        # id: "<sha256(payload)>" -> refers to the dict, not just content
+        event_id_source = msgpack.packb({**payload, "cache_hit": True, "query_id": query_id} if cache_hit else payload)
+        event_id = hashlib.sha256(event_id_source).hexdigest()
+
+        aep_event: Dict[str, Any] = {
+            "id": event_id,
+            "ts": ts if ts is not None else time.time(),
+            "focus_ms": latency_ms,
+            "payload": payload,
+            "focus_kind": "exec_latency",
+        }
+
+        # Add query_id if captured
+        if query_id:
+            aep_event["query_id"] = query_id
+        if cache_hit:
+            aep_event["cache_hit"] = True
+        if ttft_ms is not None:
+            aep_event["ttft_ms"] = ttft_ms
+            REGISTRY.histogram(
+                "aep_llm_ttft_seconds", "Time from the start of a streamed LLM call to its first token."
+            ).observe(ttft_ms / 1000)
+
+        self.ledger.append(aep_event) # Use the ledger instance
+
     def on_llm_error(
         self,
         error: Union[Exception, KeyboardInterrupt],
@@ -183,6 +367,9 @@ class AEPCallbackHandler(BaseCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Clean up start time on LLM error."""
+        self._end_span(run_id, status="error")
+        with self._spans_lock:
+            self._first_token_ts.pop(run_id, None)
         self._start_time = None
         self._current_query_id = None
         self._current_metadata = None
@@ -213,6 +400,7 @@ class AEPCallbackHandler(BaseCallbackHandler):
     ) -> None:
         """Log chain start event."""
         self._current_run_id_stack.append(run_id)
+        self._start_span(run_id, parent_run_id, _run_name(serialized, kwargs, "chain"), "chain", metadata)
         # Attempt to get query_id from metadata if it's the start of a root chain call
         current_query_id = None
         if metadata and "query_id" in metadata:
@@ -257,14 +445,17 @@ class AEPCallbackHandler(BaseCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Log chain end event, including outputs."""
+        span = self._open_span(run_id)
+        self._end_span(run_id)
         if self._current_run_id_stack and self._current_run_id_stack[-1] == run_id:
             self._current_run_id_stack.pop()
 
-        # Determine trace_id. If query_id was set in metadata for the root call, it should propagate.
-        # If not, use run_id.
+        # Determine trace_id: the chain's own span knows it. Otherwise, if query_id was set in
+        # metadata for the root call, it should propagate. If not, use run_id.
         current_query_id = self._current_query_id or str(run_id)
         if self._current_metadata and "query_id" in self._current_metadata:
              current_query_id = str(self._current_metadata["query_id"])
+        current_query_id = span["trace_id"] if span else current_query_id
 
 
         # Attempt to get the name of the chain from the serialized structure if possible
@@ -304,12 +495,15 @@ class AEPCallbackHandler(BaseCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Log chain error."""
+        span = self._open_span(run_id)
+        self._end_span(run_id, status="error")
         if self._current_run_id_stack and self._current_run_id_stack[-1] == run_id:
             self._current_run_id_stack.pop()
         
         current_query_id = self._current_query_id or str(run_id)
         if self._current_metadata and "query_id" in self._current_metadata:
              current_query_id = str(self._current_metadata["query_id"])
+        current_query_id = span["trace_id"] if span else current_query_id
 
         self.ledger.append({
             "id": hashlib.sha256(msgpack.packb({"error": str(error), "run_id": str(run_id)})).hexdigest(),
@@ -339,6 +533,7 @@ class AEPCallbackHandler(BaseCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Log retriever start event."""
+        self._start_span(run_id, parent_run_id, _run_name(serialized, kwargs, "retriever"), "retriever", metadata)
         current_query_id = self._current_query_id or str(parent_run_id or run_id) # Try to link to broader trace
         if self._current_metadata and "query_id" in self._current_metadata:
              current_query_id = str(self._current_metadata["query_id"])
@@ -371,6 +566,7 @@ class AEPCallbackHandler(BaseCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Log retriever end event, including retrieved documents (summarized)."""
+        self._end_span(run_id)
         current_query_id = self._current_query_id or str(parent_run_id or run_id)
         if self._current_metadata and "query_id" in self._current_metadata:
              current_query_id = str(self._current_metadata["query_id"])
@@ -389,6 +585,36 @@ class AEPCallbackHandler(BaseCallbackHandler):
             "focus_kind": "retrieval_result"
         })
 
+    def on_retriever_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        """Close the retriever span on error."""
+        self._end_span(run_id, status="error")
+
+def _run_name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any], default: str) -> str:
+    """Best-effort run name: LangGraph passes node names via kwargs['name'], serialized may be None."""
+    if kwargs.get("name"):
+        return str(kwargs["name"])
+    if serialized:
+        return str(serialized.get("name") or (serialized.get("id") or [default])[-1])
+    return default
+
+def aep_handlers_from_config(config: Optional[Dict[str, Any]]) -> List["AEPCallbackHandler"]:
+    """
+    Returns the AEPCallbackHandlers attached to a RunnableConfig, so graph nodes can
+    record spans (e.g. embedding calls) that LangChain does not report itself.
+    """
+    if not config:
+        return []
+    callbacks = config.get("callbacks")
+    handlers = getattr(callbacks, "handlers", callbacks) or []
+    return [h for h in handlers if isinstance(h, AEPCallbackHandler)]
+
 # Helper function to shorten serialized representation if it's too long
 def shorten_serialized(serialized_obj: Dict[str, Any], max_len: int = 500) -> Dict[str, Any]:
     try:
@@ -6,6 +6,9 @@ import gzip # For writing merged gzipped output
 import msgpack # For packing merged events
 
 from .ledger import AEPLedger, DEFAULT_AEP_DIR, DEFAULT_LEDGER_NAME
+from .query import EventFilter, project
+# follow, retention and stats are imported by the commands that use them, so
+# `aep --help` and the simple commands start without loading them (see test_import_time).
 
 def print_event(event, as_json=False):
     if as_json:
@@ -32,6 +35,12 @@ def print_event(event, as_json=False):
 def handle_inspect(args):
     ledger_base = Path(args.ledger_base_path).resolve()
     ledger = AEPLedger(ledger_base_path=ledger_base, ledger_name=args.ledger_name)
+    try:
+        event_filter = EventFilter.from_where(args.where or [])
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    fields = [field.strip() for field in args.fields.split(",") if field.strip()] if args.fields else None
     print(f"Inspecting ledger: '{args.ledger_name}' in directory: {ledger_base}")
     files_to_inspect = []
     if args.file:
@@ -44,12 +53,15 @@ def handle_inspect(args):
         files_to_inspect.append(file_to_inspect)
         print(f"Targeting specific file: {file_to_inspect}")
     else:
-        files_to_inspect = ledger.get_all_ledger_files(include_current=not args.archived_only)
-        if args.current_only:
-            if ledger.current_ledger_file.exists():
-                files_to_inspect = [ledger.current_ledger_file]
-            else:
-                files_to_inspect = []
+        if not args.current_only:
+            # Segments whose recorded time range misses the filter are never opened.
+            segments = ledger.segments()
+            kept = [segment for segment in segments if event_filter.may_match_segment(segment)]
+            if len(kept) < len(segments):
+                print(f"Pruned {len(segments) - len(kept)} segment(s) outside the --where time range.")
+            files_to_inspect = [ledger_base / segment["file"] for segment in kept]
+        if not args.archived_only:
+            files_to_inspect.extend(ledger.get_current_ledger_files())
         if not files_to_inspect:
             print("No ledger files found to inspect.")
             return 0
@@ -59,32 +71,205 @@ def handle_inspect(args):
     total_events_inspected = 0
     for file_path in files_to_inspect:
         print(f"\n--- Events from: {file_path.name} ---")
-        events = ledger.read_events(file_path)
-        if not events:
-            print("(No events in this file or file is empty/corrupted)")
-            continue
-        for i, event in enumerate(events):
+        events_in_file = 0
+        # Filtering happens while decoding, and --limit stops reading as soon as it is reached.
+        for event in ledger.iter_events(file_path, event_filter=None if event_filter.is_empty else event_filter):
             if args.limit is not None and total_events_inspected >= args.limit:
                 print(f"Reached inspection limit of {args.limit} events.")
                 return 0
-            print_event(event, as_json=args.json)
+            if fields:
+                print(json.dumps(project(event, fields), indent=2 if args.json else None, default=str))
+            else:
+                print_event(event, as_json=args.json)
+            events_in_file += 1
             total_events_inspected += 1
-        if not args.json:
-             print(f"(Found {len(events)} events in {file_path.name})")
+        if not events_in_file:
+            print("(No matching events in this file or file is empty/corrupted)")
+        elif not args.json:
+             print(f"(Found {events_in_file} events in {file_path.name})")
     print(f"\nTotal events inspected across all targeted files: {total_events_inspected}")
     return 0
 
+def _collect_trace_spans(ledger, trace_id):
+    spans = []
+    span_filter = EventFilter(event_type="span", trace_id=trace_id)
+    for file_path in ledger.get_all_ledger_files(include_current=True):
+        spans.extend(ledger.iter_events(file_path, event_filter=span_filter))
+    return spans
+
+def print_trace_waterfall(trace_id, spans, width=40):
+    """Prints spans as an indented tree with a waterfall bar per span."""
+    by_run_id = {span.get("run_id"): span for span in spans}
+    children = {}
+    roots = []
+    for span in spans:
+        parent = span.get("parent_run_id")
+        if parent in by_run_id:
+            children.setdefault(parent, []).append(span)
+        else:
+            roots.append(span)
+    start_key = lambda span: span["payload"]["start_ts"]
+    trace_start = min(span["payload"]["start_ts"] for span in spans)
+    trace_end = max(span["payload"]["end_ts"] for span in spans)
+    total_ms = max((trace_end - trace_start) * 1000, 1e-3)
+
+    print(f"Trace {trace_id}: {len(spans)} span(s), {total_ms:.1f} ms")
+    print(f"{'span':<44} {'kind':<10} {'start(ms)':>10} {'dur(ms)':>10}")
+
+    def _print(span, depth):
+        payload = span["payload"]
+        offset_ms = (payload["start_ts"] - trace_start) * 1000
+        duration_ms = payload["duration_ms"]
+        bar_start = int(offset_ms / total_ms * width)
+        bar_len = max(1, int(round(duration_ms / total_ms * width)))
+        bar = " " * bar_start + "#" * min(bar_len, width - bar_start)
+        label = ("  " * depth + payload["name"])[:44]
+        status = "" if payload.get("status", "ok") == "ok" else f" [{payload['status']}]"
+        print(f"{label:<44} {payload['kind']:<10} {offset_ms:>10.1f} {duration_ms:>10.1f} |{bar:<{width}}|{status}")
+        for child in sorted(children.get(span.get("run_id"), []), key=start_key):
+            _print(child, depth + 1)
+
+    for root in sorted(roots, key=start_key):
+        _print(root, 0)
+
+def handle_trace(args):
+    ledger_base = Path(args.ledger_base_path).resolve()
+    ledger = AEPLedger(ledger_base_path=ledger_base, ledger_name=args.ledger_name)
+    spans = _collect_trace_spans(ledger, args.trace_id)
+    if not spans:
+        print(f"No span events found for trace '{args.trace_id}' in ledger '{args.ledger_name}'.", file=sys.stderr)
+        return 1
+    if args.json:
+        spans.sort(key=lambda span: span["payload"]["start_ts"])
+        print(json.dumps(spans, indent=2, default=str))
+    else:
+        print_trace_waterfall(args.trace_id, spans)
+    return 0
+
+def _event_filter_from_args(args):
+    return EventFilter(
+        focus_kind=args.focus_kind,
+        event_type=args.event_type,
+        trace_id=args.trace_id,
+        session_id=args.session_id,
+    )
+
+def handle_tail(args):
+    from .follow import follow
+    ledger_base = Path(args.ledger_base_path).resolve()
+    ledger = AEPLedger(ledger_base_path=ledger_base, ledger_name=args.ledger_name)
+    event_filter = _event_filter_from_args(args)
+    if not args.follow:
+        matching = [
+            event
+            for file_path in ledger.get_current_ledger_files()
+            for event in ledger.read_events(file_path)
+            if event_filter.matches(event)
+        ]
+        for event in matching[-args.lines:] if args.lines else []:
+            print_event(event, as_json=args.json)
+        return 0
+    try:
+        for event in follow(ledger, event_filter=event_filter, from_start=args.from_start):
+            print_event(event, as_json=args.json)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def _format_ms(value):
+    return "-" if value is None else f"{value:.1f}"
+
+def handle_stats(args):
+    from .stats import STATS_QUANTILES, compute_stats, stats_report
+    ledger_base = Path(args.ledger_base_path).resolve()
+    ledger = AEPLedger(ledger_base_path=ledger_base, ledger_name=args.ledger_name)
+    where = args.where or []
+    try:
+        event_filter = EventFilter.from_where(where)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    group_by = [field.strip() for field in args.group_by.split(",") if field.strip()] or ["focus_kind"]
+    # Same selection as get_all_ledger_files, minus segments the --where time range rules out.
+    segments = ledger.segments()
+    kept = [segment for segment in segments if event_filter.may_match_segment(segment)]
+    files = [ledger_base / segment["file"] for segment in kept] + ledger.get_current_ledger_files()
+    if not files:
+        print("No ledger files found.")
+        return 0
+
+    stats = compute_stats(ledger, files, group_by=group_by, value_field=args.value, where=where, workers=args.workers)
+    report = stats_report(stats, group_by, args.value)
+    if args.json:
+        report["files"] = len(files)
+        report["pruned_segments"] = len(segments) - len(kept)
+        print(json.dumps(report, indent=2, default=str))
+        return 0
+
+    print(f"Ledger '{args.ledger_name}': {report['events']} events in {len(files)} file(s)")
+    if len(kept) < len(segments):
+        print(f"Pruned {len(segments) - len(kept)} segment(s) outside the --where time range.")
+    group_label = ",".join(group_by)
+    header = f"{group_label:<28} {'count':>8} {'mean':>10}" + "".join(f" {'p' + str(int(q * 100)):>10}" for q in STATS_QUANTILES) + f" {'max':>10}"
+    print(f"\n{args.value} by {group_label}:")
+    print(header)
+    for row in report["groups"]:
+        label = ",".join(str(row[field]) for field in group_by)
+        quantiles = "".join(f" {_format_ms(row['p' + str(int(q * 100))]):>10}" for q in STATS_QUANTILES)
+        print(f"{label:<28} {row['count']:>8} {_format_ms(row['mean']):>10}{quantiles} {_format_ms(row['max']):>10}")
+
+    throughput = report["throughput"]
+    if throughput:
+        print(f"\nThroughput: {throughput['events_per_s']:.2f} events/s over {throughput['span_s']:.1f}s")
+        quantiles = ", ".join(f"{name}={_format_ms(value)}" for name, value in throughput["inter_arrival_ms"].items())
+        print(f"Inter-arrival (ms): {quantiles}")
+        if throughput["interleaved_files"]:
+            print(f"  ({throughput['interleaved_files']} file(s) overlap others in time; "
+                  "gaps across their boundaries are not counted)")
+    return 0
+
 def handle_list_ledgers(args):
     ledger_base = Path(args.ledger_base_path).resolve()
     ledger = AEPLedger(ledger_base_path=ledger_base, ledger_name=args.ledger_name)
     print(f"Listing files for ledger: '{args.ledger_name}' in directory: {ledger_base}")
-    ledger_files = ledger.get_all_ledger_files(include_current=True)
-    if not ledger_files:
+    segments = ledger.segments()
+    current_files = ledger.get_current_ledger_files()
+    if not segments and not current_files:
         print("No ledger files found.")
         return 0
-    for f_path in ledger_files:
-        status = " (current)" if f_path == ledger.current_ledger_file else " (archived)"
-        print(f"  - {f_path.name}{status} (Size: {f_path.stat().st_size} bytes)")
+    # Archived segment sizes and counts come from the manifest; no per-file stat() needed.
+    for segment in segments:
+        events = f", Events: {segment['events']}" if segment.get("events") is not None else ""
+        print(f"  - {segment['file']} (archived, seq {segment['seq']}) (Size: {segment['bytes']} bytes{events})")
+    for f_path in current_files:
+        print(f"  - {f_path.name} (current) (Size: {f_path.stat().st_size} bytes)")
+    return 0
+
+def handle_maintain(args):
+    from .retention import RetentionPolicy, run_maintenance
+    ledger_base = Path(args.ledger_base_path).resolve()
+    ledger = AEPLedger(ledger_base_path=ledger_base, ledger_name=args.ledger_name)
+    policy = RetentionPolicy(
+        max_age_s=args.max_age_days * 86400 if args.max_age_days is not None else None,
+        max_total_bytes=int(args.max_total_mb * 1024 * 1024) if args.max_total_mb is not None else None,
+        max_segments=args.max_segments,
+        cold_dir=args.cold_dir,
+        compact=args.compact,
+        downsample_after_s=args.downsample_after_days * 86400 if args.downsample_after_days is not None else None,
+        downsample_keep_every=args.downsample_keep_every,
+    )
+    if not policy.enabled:
+        print("Nothing to do: set a retention limit and/or --compact.", file=sys.stderr)
+        return 1
+    result = run_maintenance(ledger, policy, dry_run=args.dry_run)
+    prefix = "Would " if args.dry_run else ""
+    verb_compact = "compact runs starting at" if args.dry_run else "Compacted into"
+    for path in result["compacted"]:
+        print(f"{prefix}{verb_compact}: {path.name}")
+    for path in result["dropped"]:
+        print(f"{prefix}{'drop' if args.dry_run else 'Dropped'}: {path.name}")
+    print(f"{len(result['compacted'])} compacted segment(s), {len(result['dropped'])} dropped segment(s).")
     return 0
 
 def handle_merge(args):
@@ -178,7 +363,7 @@ def main():
     inspect_parser.add_argument(
         "--current-only", 
         action="store_true", 
-        help="Only inspect the current, active ledger file."
+        help="Only inspect the current, active ledger file(s) of every shard."
     )
     inspect_parser.add_argument(
         "--archived-only", 
@@ -196,12 +381,75 @@ def main():
         action="store_true", 
         help="Output events in JSON format."
     )
+    inspect_parser.add_argument(
+        "--where",
+        action="append",
+        default=None,
+        help="Filter events, e.g. focus_kind=span, event_type=chain_start, trace_id=<id>, session_id=<id>, "
+             "'ts>=2025-06-01T00:00:00', 'focus_ms>500'. Repeat to combine (AND)."
+    )
+    inspect_parser.add_argument(
+        "--fields",
+        default=None,
+        help="Comma-separated fields to output, e.g. id,ts,focus_ms,payload.doc_source."
+    )
     inspect_parser.set_defaults(func=handle_inspect)
 
     # --- List command (simple alias/alternative to inspect for just listing files) ---
     list_parser = subparsers.add_parser("list", help="List ledger files.")
     list_parser.set_defaults(func=handle_list_ledgers)
     
+    # --- Trace command ---
+    trace_parser = subparsers.add_parser("trace", help="Show the span waterfall (per-node latency) for a trace.")
+    trace_parser.add_argument("trace_id", help="Trace ID to show (the query_id passed in the run metadata).")
+    trace_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output the span events in JSON format."
+    )
+    trace_parser.set_defaults(func=handle_trace)
+
+    # --- Tail command ---
+    tail_parser = subparsers.add_parser("tail", help="Show the latest events, or follow new ones as they are written.")
+    tail_parser.add_argument("-f", "--follow", action="store_true", help="Keep printing new events as they are appended (Ctrl-C to stop).")
+    tail_parser.add_argument("-n", "--lines", type=int, default=10, help="Number of latest events to show without --follow. Default: 10")
+    tail_parser.add_argument("--from-start", action="store_true", help="With --follow, start with the events already in the current files.")
+    tail_parser.add_argument("--focus-kind", default=None, help="Only show events with this focus_kind.")
+    tail_parser.add_argument("--event-type", default=None, help="Only show events with this event_type.")
+    tail_parser.add_argument("--trace-id", default=None, help="Only show events of this trace (trace_id or query_id).")
+    tail_parser.add_argument("--session-id", default=None, help="Only show events with this session_id.")
+    tail_parser.add_argument("--json", action="store_true", help="Output events in JSON format.")
+    tail_parser.set_defaults(func=handle_tail)
+
+    # --- Stats command ---
+    stats_parser = subparsers.add_parser("stats", help="Latency/focus histograms and throughput computed from ledger files.")
+    stats_parser.add_argument("--group-by", default="focus_kind", help="Comma-separated event fields to group by (dotted paths allowed). Default: focus_kind")
+    stats_parser.add_argument("--value", default="focus_ms", help="Numeric field summarized per group. Default: focus_ms")
+    stats_parser.add_argument(
+        "--where", action="append", default=None,
+        help="Only aggregate events matching this filter (repeatable, ANDed), e.g. 'event_type=focus' or 'ts>=2025-06-01'."
+    )
+    stats_parser.add_argument("--workers", type=int, default=0, help="Worker processes for reading files in parallel; 0 picks automatically, 1 disables. Default: 0")
+    stats_parser.add_argument("--json", action="store_true", help="Output the report as JSON.")
+    stats_parser.set_defaults(func=handle_stats)
+
+    # --- Maintain command ---
+    maintain_parser = subparsers.add_parser("maintain", help="Apply retention limits and compact small archived segments.")
+    maintain_parser.add_argument("--max-age-days", type=float, default=None, help="Drop archives older than this many days.")
+    maintain_parser.add_argument("--max-total-mb", type=float, default=None, help="Drop the oldest archives until the rest fit in this size.")
+    maintain_parser.add_argument("--max-segments", type=int, default=None, help="Keep at most this many archives.")
+    maintain_parser.add_argument("--cold-dir", default=None, help="Move dropped archives to this directory instead of deleting them.")
+    maintain_parser.add_argument("--compact", action="store_true", help="Merge runs of small archives into larger segments.")
+    maintain_parser.add_argument(
+        "--downsample-after-days",
+        type=float,
+        default=None,
+        help="While compacting, keep only a sample of chain_start/chain_output events older than this."
+    )
+    maintain_parser.add_argument("--downsample-keep-every", type=int, default=10, help="Keep one trace in N when downsampling. Default: 10")
+    maintain_parser.add_argument("--dry-run", action="store_true", help="Only report what would be compacted or dropped.")
+    maintain_parser.set_defaults(func=handle_maintain)
+
     # --- Merge command (New) ---
     merge_parser = subparsers.add_parser("merge", help="Merge multiple ledger files into a single output file.")
     merge_parser.add_argument(
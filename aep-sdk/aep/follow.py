@@ -0,0 +1,189 @@
+import ctypes
+import ctypes.util
+import gzip
+import os
+import select
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import msgpack
+
+from . import framing
+from .ledger import AEPLedger
+from .log import get_logger
+from .query import EventFilter
+from .reader import SegmentReader
+
+logger = get_logger(__name__)
+
+POLL_INTERVAL_S = 0.25
+# With inotify the wait ends as soon as something in the ledger directory changes;
+# this only bounds how long a missed notification can delay us.
+INOTIFY_MAX_WAIT_S = 2.0
+
+
+class _InotifyWatcher:
+    """Waits for changes in a directory using Linux inotify through ctypes (no extra dependency)."""
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+
+    def __init__(self, directory: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self._fd, os.fsencode(str(directory)), mask) < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float) -> None:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self._fd, 64 * 1024):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def _make_watcher(directory: Path) -> Optional[_InotifyWatcher]:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return _InotifyWatcher(directory)
+    except (OSError, AttributeError) as e:
+        logger.info("inotify unavailable (%s); polling every %.2fs", e, POLL_INTERVAL_S)
+        return None
+
+
+def _iter_archive_events(archive_path: Path, start: int) -> Iterator[Dict[str, Any]]:
+    """Events of an archived segment from byte `start` of its uncompressed contents."""
+    with gzip.open(archive_path, "rb") as f:
+        data = f.read()
+    if framing.is_framed(data):
+        for _, payload in framing.iter_frames(data, start=max(start, len(framing.FILE_MAGIC))):
+            yield msgpack.unpackb(payload, raw=False)
+    else:
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(data[start:])
+        yield from unpacker
+
+
+def _shard_of(ledger: AEPLedger, current_file: Path) -> Optional[str]:
+    shared_name = f"{ledger.ledger_name}.aep.current"
+    if current_file.name == shared_name:
+        return None
+    return current_file.name[len(f"{ledger.ledger_name}.aep."):-len(".current")]
+
+
+def _read_current(current_file: Path, start: int) -> Optional[tuple]:
+    """Returns (events, end offset) of the complete events after `start`, or None if there are none."""
+    import portalocker
+    try:
+        # A shared lock keeps us from reading in the middle of a rotation (which holds the
+        # exclusive lock from archiving through truncation). Appends are only delayed briefly.
+        with portalocker.Lock(current_file, "rb", timeout=5,
+                              flags=portalocker.LockFlags.SHARED | portalocker.LockFlags.NON_BLOCKING):
+            with SegmentReader(current_file) as reader:
+                if reader.size <= start:
+                    return None
+                events = [event for _, event in reader.iter_events(start=start or None)]
+                return events, reader.end_offset
+    except FileNotFoundError:
+        return None
+
+
+def follow(
+    ledger: AEPLedger,
+    event_filter: Optional[EventFilter] = None,
+    from_start: bool = False,
+    stop_event: Optional[threading.Event] = None,
+    idle_timeout_s: Optional[float] = None,
+    use_inotify: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yields events as they are appended to the ledger's current files (every shard), in
+    write order per file.
+
+    Each current file is read incrementally from the byte offset reached so far; nothing
+    is re-decoded. When a file is rotated, the events appended between the last read and
+    the rotation are read from the new archive (its contents are the rotated file
+    byte-for-byte), and following continues from the start of the truncated current file.
+
+    Args:
+        ledger: The ledger to follow.
+        event_filter: Only yield events it matches.
+        from_start: Start with the events already in the current files instead of only new ones.
+        stop_event: Stop once this event is set.
+        idle_timeout_s: Stop after this many seconds without new events. Defaults to None (never).
+        use_inotify: Wait for changes with inotify where available instead of polling.
+    """
+    event_filter = event_filter or EventFilter()
+    offsets: Dict[Optional[str], int] = {}  # Shard (None = shared file) -> byte offset read up to.
+    for current_file in ledger.get_current_ledger_files():
+        result = None if from_start else _read_current(current_file, 0)
+        offsets[_shard_of(ledger, current_file)] = result[1] if result else 0
+    last_seq = ledger.manifest.max_seq
+    watcher = _make_watcher(ledger.ledger_base_path) if use_inotify else None
+    last_event_at = time.monotonic()
+    try:
+        while stop_event is None or not stop_event.is_set():
+            seq_before = ledger.manifest.max_seq
+            progressed = False
+            pending: List[Dict[str, Any]] = []
+
+            # Catch up on rotations: new archives hold the tail we had not read yet.
+            if seq_before != last_seq:
+                for segment in ledger.manifest.segments():
+                    if segment["seq"] <= last_seq:
+                        continue
+                    shard = segment.get("shard")
+                    start = offsets.get(shard, 0)
+                    try:
+                        pending.extend(_iter_archive_events(ledger.ledger_base_path / segment["file"], start))
+                    except FileNotFoundError:
+                        logger.warning("Archive %s was removed before it could be followed", segment["file"])
+                    offsets[shard] = 0
+                last_seq = seq_before
+
+            for current_file in ledger.get_current_ledger_files():
+                shard = _shard_of(ledger, current_file)
+                result = _read_current(current_file, offsets.setdefault(shard, 0))
+                if result is None:
+                    continue
+                if ledger.manifest.max_seq != seq_before:
+                    # Rotated while we were reading; what we read may straddle the rotation.
+                    # The next pass reads it from the archive instead.
+                    break
+                events, offsets[shard] = result
+                pending.extend(events)
+
+            for event in pending:
+                progressed = True
+                if event_filter.matches(event):
+                    yield event
+            if progressed:
+                last_event_at = time.monotonic()
+            elif idle_timeout_s is not None and time.monotonic() - last_event_at >= idle_timeout_s:
+                return
+            else:
+                wait_s = POLL_INTERVAL_S if watcher is None else INOTIFY_MAX_WAIT_S
+                if idle_timeout_s is not None:
+                    wait_s = min(wait_s, max(0.0, idle_timeout_s - (time.monotonic() - last_event_at)))
+                if watcher is None:
+                    time.sleep(wait_s)
+                else:
+                    watcher.wait(wait_s)
+    finally:
+        if watcher is not None:
+            watcher.close()
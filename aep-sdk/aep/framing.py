@@ -0,0 +1,136 @@
+import mmap
+import struct
+import zlib
+from typing import Iterator, Optional, Tuple, Union
+
+# Framed ledger files start with FILE_MAGIC and then hold a sequence of frames:
+#
+#   SYNC_MARKER (2 bytes) | payload length (u32 LE) | CRC32 of payload (u32 LE) | payload
+#
+# where the payload is one MsgPack-encoded event. 0xc1 is the one byte MsgPack never uses,
+# so a framed file can never be mistaken for a legacy (raw MsgPack) one and vice versa.
+FILE_MAGIC = b"\xc1AEPF\x01\r\n"
+SYNC_MARKER = b"\xc1\xfa"
+_FRAME_HEADER = struct.Struct("<2sII")
+FRAME_HEADER_SIZE = _FRAME_HEADER.size
+MAX_FRAME_PAYLOAD_BYTES = 64 * 1024 * 1024  # Larger lengths are treated as corruption.
+
+Buffer = Union[bytes, bytearray, mmap.mmap]  # Anything with find/rfind and the buffer protocol.
+
+
+def is_framed(prefix: bytes) -> bool:
+    """True if `prefix` (the first bytes of a ledger file) is the framed-format header."""
+    return bytes(prefix[:len(FILE_MAGIC)]) == FILE_MAGIC
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """Wraps one MsgPack payload in a frame header."""
+    return _FRAME_HEADER.pack(SYNC_MARKER, len(payload), zlib.crc32(payload)) + payload
+
+
+def frame_at(buf: memoryview, pos: int) -> Optional[Tuple[memoryview, int]]:
+    """Returns (payload, end offset) if a complete, checksum-valid frame starts at pos."""
+    payload_start = pos + FRAME_HEADER_SIZE
+    if payload_start > len(buf):
+        return None
+    sync, length, crc = _FRAME_HEADER.unpack_from(buf, pos)
+    if sync != SYNC_MARKER or length > MAX_FRAME_PAYLOAD_BYTES:
+        return None
+    end = payload_start + length
+    if end > len(buf):
+        return None
+    payload = buf[payload_start:end]
+    if zlib.crc32(payload) != crc:
+        return None
+    return payload, end
+
+
+def _is_incomplete_tail(buf: memoryview, pos: int) -> bool:
+    """True if the bytes from pos to the end look like the start of a frame still being written."""
+    remaining = len(buf) - pos
+    if remaining < FRAME_HEADER_SIZE:
+        head = bytes(buf[pos:pos + len(SYNC_MARKER)])
+        return SYNC_MARKER.startswith(head)
+    sync, length, _ = _FRAME_HEADER.unpack_from(buf, pos)
+    return sync == SYNC_MARKER and length <= MAX_FRAME_PAYLOAD_BYTES and FRAME_HEADER_SIZE + length > remaining
+
+
+class FrameScanStats:
+    """Counts what a frame scan had to skip."""
+
+    def __init__(self):
+        self.frames = 0
+        self.corrupt_regions = 0
+        self.skipped_bytes = 0
+        self.end_offset = 0  # Just past the last valid frame; where an incremental reader resumes.
+        self.incomplete_tail_bytes = 0  # A frame still being written (or torn), not counted as corrupt.
+        self.undecodable_frames = 0  # Checksum-valid frames whose payload is not valid MsgPack.
+
+    @property
+    def damaged(self) -> bool:
+        """True if the scan skipped or stopped short of any bytes."""
+        return bool(self.corrupt_regions or self.incomplete_tail_bytes or self.undecodable_frames)
+
+    def __repr__(self) -> str:
+        return (f"FrameScanStats(frames={self.frames}, corrupt_regions={self.corrupt_regions}, "
+                f"skipped_bytes={self.skipped_bytes}, end_offset={self.end_offset}, "
+                f"incomplete_tail_bytes={self.incomplete_tail_bytes}, undecodable_frames={self.undecodable_frames})")
+
+
+def iter_frames(data: Buffer, start: int = len(FILE_MAGIC),
+                stats: Optional[FrameScanStats] = None) -> Iterator[Tuple[int, memoryview]]:
+    """
+    Yields (offset, payload) for every valid frame in `data`, beginning at `start`.
+
+    A frame with a bad header, length or checksum is skipped by searching forward for the
+    next sync marker that starts a valid frame, so one corrupt or torn frame costs only
+    the events inside it. A partial frame at the very end (still being appended) ends the
+    scan without counting as corruption. Payloads are zero-copy views into `data`.
+    """
+    buf = memoryview(data)
+    pos = start
+    if stats is not None:
+        stats.end_offset = start
+    while pos < len(buf):
+        frame = frame_at(buf, pos)
+        if frame is not None:
+            payload, end = frame
+            if stats is not None:
+                stats.frames += 1
+                stats.end_offset = end
+            yield pos, payload
+            pos = end
+            continue
+        if _is_incomplete_tail(buf, pos):
+            if stats is not None:
+                stats.incomplete_tail_bytes = len(buf) - pos
+            break
+        # Resynchronize: try every later sync marker until one starts a valid frame.
+        bad_start = pos
+        pos = data.find(SYNC_MARKER, pos + 1)
+        while pos != -1 and frame_at(buf, pos) is None and not _is_incomplete_tail(buf, pos):
+            pos = data.find(SYNC_MARKER, pos + 1)
+        if pos == -1:
+            pos = len(buf)
+        if stats is not None:
+            stats.corrupt_regions += 1
+            stats.skipped_bytes += pos - bad_start
+            stats.end_offset = pos
+
+
+def last_frame_end(data: Buffer, start: int = 0) -> Optional[int]:
+    """
+    Returns the end offset of the last valid frame that starts at or after `start`, or None.
+
+    Scans backwards from the end of `data`, so finding the end of a file's last good frame
+    costs time proportional to the torn tail, not to the file.
+    """
+    buf = memoryview(data)
+    pos = data.rfind(SYNC_MARKER, start)
+    while pos != -1:
+        frame = frame_at(buf, pos)
+        if frame is not None:
+            return frame[1]
+        # Next candidate must start strictly before pos.
+        pos = data.rfind(SYNC_MARKER, start, pos + len(SYNC_MARKER) - 1)
+    return None
@@ -1,20 +1,66 @@
 import msgpack
+import atexit
 import gzip
 import os
+import threading
+import weakref
 from pathlib import Path
 import time
-from datetime import datetime, timezone
-from typing import Any, Dict, Union, Optional, List
-import portalocker
-import sys
+from typing import Any, Dict, Iterator, Union, Optional, List, Tuple
+
+from . import framing
+from .log import get_logger
+from .manifest import LedgerManifest
+from .query import EventFilter
+from .reader import SegmentReader, decode_frames
+from .metrics import REGISTRY
+
+logger = get_logger(__name__)
 
 DEFAULT_AEP_DIR = Path.home() / ".aep"
 DEFAULT_LEDGER_NAME = "default"
 DEFAULT_MAX_FILE_SIZE_BYTES = 1 * 1024 * 1024  # 1MB
+DEFAULT_BATCH_SIZE = 64
+# 'fsync': every append is fsynced (survives power loss).
+# 'flush': every append reaches the OS but is not fsynced (survives a process crash).
+# 'batch': appends are buffered in memory and written + fsynced together every
+#          batch_size events, on flush() or on close(); a crash loses the unwritten batch.
+DURABILITY_MODES = ("fsync", "flush", "batch")
+RECOVERY_WINDOW_BYTES = 64 * 1024
+
+# Open 'batch' ledgers. One atexit hook flushes them all; the set does not keep them alive.
+_batch_ledgers: "weakref.WeakSet[AEPLedger]" = weakref.WeakSet()
+
+def _close_batch_ledgers() -> None:
+    for ledger in list(_batch_ledgers):
+        ledger.close()
+
+atexit.register(_close_batch_ledgers)
+
+def process_shard_id() -> str:
+    """Shard name for the calling process, for AEPLedger(shard=...) in multi-worker deployments."""
+    return f"pid{os.getpid()}"
 
 class AEPLedger:
     """
     Handles writing AEP events to a rotating, gzipped MsgPack ledger.
+
+    Several processes may write to the same ledger. Appends and rotation both happen under
+    an exclusive lock on the current file, and rotation archives the file and truncates it
+    in place (it is never unlinked), so concurrent writers cannot lose events. For write
+    throughput that scales with the number of processes, give each writer its own `shard`:
+    every shard has its own current file and readers merge all of them.
+
+    Archived segments are named '<ledger_name>.aep.<seq>[.<shard>].msgpack.gz' and recorded
+    in the ledger's manifest (see LedgerManifest), which is what listing and readers use.
+    Only writers create the directory and the manifest: the first rotation or shard
+    registration bootstraps it from a one-time directory scan, and until then readers scan
+    the directory themselves without writing anything.
+
+    With `framed=True`, new files use the length-prefixed, CRC-checked format from
+    aep.framing: a torn write loses at most the event being written, and a corrupt frame
+    only the events inside it. Readers handle both formats; the format of each file is
+    fixed when it is created.
     """
 
     def __init__(
@@ -22,6 +68,10 @@ class AEPLedger:
         ledger_base_path: Union[str, Path] = DEFAULT_AEP_DIR,
         ledger_name: str = DEFAULT_LEDGER_NAME,
         max_file_size_bytes: int = DEFAULT_MAX_FILE_SIZE_BYTES,
+        shard: Optional[str] = None,
+        framed: bool = False,
+        durability: str = "fsync",
+        batch_size: int = DEFAULT_BATCH_SIZE,
     ):
         """
         Initializes the AEPLedger.
@@ -33,105 +83,376 @@ class AEPLedger:
                          Defaults to 'default'.
             max_file_size_bytes: Maximum size for an active ledger file before rotation.
                                  Defaults to 1MB.
+            shard: Optional shard name (e.g. process_shard_id() or a worker index). Writes go
+                   to '<ledger_name>.aep.<shard>.current' instead of the shared current file.
+                   Defaults to None (shared current file).
+            framed: Write new files in the framed, checksummed format. Defaults to False.
+            durability: One of DURABILITY_MODES. Defaults to 'fsync'.
+            batch_size: Events buffered per write in 'batch' mode. Defaults to 64.
         """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}, got {durability!r}")
         self.ledger_base_path = Path(ledger_base_path)
         self.ledger_name = ledger_name
         self.max_file_size_bytes = max_file_size_bytes
+        self.shard = shard
+        self.framed = framed
+        self.durability = durability
+        self.batch_size = batch_size
+        self._pending: List[bytes] = []
+        self._pending_lock = threading.Lock()
 
-        self.ledger_base_path.mkdir(parents=True, exist_ok=True)
-        self.current_ledger_file = self.ledger_base_path / f"{self.ledger_name}.aep.current"
+        if shard:
+            self.current_ledger_file = self.ledger_base_path / f"{self.ledger_name}.aep.{shard}.current"
+        else:
+            self.current_ledger_file = self.ledger_base_path / f"{self.ledger_name}.aep.current"
+        self.manifest = LedgerManifest(self.ledger_base_path, self.ledger_name)
 
-    def _rotate_if_needed(self) -> None:
-        """
-        Checks if the current ledger file exceeds the maximum size and rotates it.
-        """
-        if not self.current_ledger_file.exists():
-            return
+        self._append_seconds = REGISTRY.histogram(
+            "aep_ledger_append_seconds", "Time spent in AEPLedger.append (incl. lock, rotation check and fsync).",
+            ledger=self.ledger_name)
+        self._fsync_seconds = REGISTRY.histogram(
+            "aep_ledger_fsync_seconds", "Time spent in os.fsync per append.", ledger=self.ledger_name)
+        self._rotation_seconds = REGISTRY.histogram(
+            "aep_ledger_rotation_seconds", "Time spent gzipping and rotating the current ledger file.",
+            ledger=self.ledger_name)
+
+        if shard:
+            self._ensure_manifest()
+            self.manifest.register_shard(shard)
+        # A torn tail left by a crash is truncated before this instance's first write (see
+        # _write_payloads), so readers never lock or modify the current file.
+        self._recovered = False
+        if durability == "batch":
+            _batch_ledgers.add(self)
 
-        current_size = self.current_ledger_file.stat().st_size
-        if current_size >= self.max_file_size_bytes:
-            timestamp_str = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-            archive_file_name = f"{self.ledger_name}.aep.{timestamp_str}.msgpack.gz"
-            archive_file_path = self.ledger_base_path / archive_file_name
+    def _archive_path(self, seq: int) -> Path:
+        shard_suffix = f".{self.shard}" if self.shard else ""
+        return self.ledger_base_path / f"{self.ledger_name}.aep.{seq:010d}{shard_suffix}.msgpack.gz"
 
+    @staticmethod
+    def summarize(data: bytes) -> Tuple[int, Optional[float], Optional[float]]:
+        """Returns (event count, min ts, max ts) of an uncompressed ledger file's contents."""
+        if framing.is_framed(data):
+            events = (msgpack.unpackb(payload, raw=False) for _, payload in framing.iter_frames(data))
+        else:
+            unpacker = msgpack.Unpacker(raw=False)
+            unpacker.feed(data)
+            events = unpacker
+        count, min_ts, max_ts = 0, None, None
+        for event in events:
+            count += 1
+            ts = event.get("ts") if isinstance(event, dict) else None
+            if isinstance(ts, (int, float)):
+                min_ts = ts if min_ts is None else min(min_ts, ts)
+                max_ts = ts if max_ts is None else max(max_ts, ts)
+        return count, min_ts, max_ts
+
+    def _scan_directory(self) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Segments and shards found on disk, for a ledger without a manifest. Reads only."""
+        segments = []
+        # Pre-manifest archive names sort chronologically.
+        for seq, archive_path in enumerate(sorted(self.ledger_base_path.glob(f"{self.ledger_name}.aep.*.msgpack.gz")), 1):
             try:
-                with open(self.current_ledger_file, "rb") as f_in, gzip.open(archive_file_path, "wb") as f_out:
-                    f_out.write(f_in.read())
-                
-                # Remove the old current file after successful gzipping
-                self.current_ledger_file.unlink()
+                with gzip.open(archive_path, "rb") as f:
+                    events, min_ts, max_ts = self.summarize(f.read())
             except Exception as e:
-                # Handle errors during rotation, e.g., log them.
-                # For now, print to stderr. A more robust app might use logging.
-                print(f"Error during ledger rotation: {e}")
-                # Avoid deleting current_ledger_file if archiving failed to prevent data loss.
-                # The file will be re-checked and re-tried on next append.
+                logger.warning("Could not summarize %s: %s", archive_path, e)
+                events, min_ts, max_ts = None, None, None
+            segments.append(self._segment_record(seq, archive_path, events, min_ts, max_ts))
+        return segments, self._shards_on_disk()
+
+    def _shards_on_disk(self) -> List[str]:
+        return [path.name[len(f"{self.ledger_name}.aep."):-len(".current")]
+                for path in sorted(self.ledger_base_path.glob(f"{self.ledger_name}.aep.*.current"))]
+
+    def _ensure_manifest(self) -> None:
+        """Creates the manifest on a writer's first use, recording any archives and shards already on disk."""
+        if self.manifest.exists():
+            return
+        self.ledger_base_path.mkdir(parents=True, exist_ok=True)
+        with self.manifest.lock():
+            if self.manifest.exists():
                 return
+            segments, shards = self._scan_directory()
+            self.manifest.commit(add=segments, shards=shards, locked=True)
+            if segments:
+                logger.info("Bootstrapped manifest for ledger '%s' with %d segment(s)", self.ledger_name, len(segments))
+
+    @staticmethod
+    def _segment_record(seq: int, archive_path: Path, events: Optional[int],
+                        min_ts: Optional[float], max_ts: Optional[float], shard: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "seq": seq,
+            "file": archive_path.name,
+            "shard": shard,
+            "bytes": archive_path.stat().st_size,
+            "events": events,
+            "min_ts": min_ts,
+            "max_ts": max_ts,
+            "created": time.time(),
+        }
+
+    def segments(self) -> List[Dict[str, Any]]:
+        """
+        Archived segments from the manifest (seq, file, bytes, events, min_ts, max_ts), oldest first.
+        Without a manifest, they are summarized from a directory scan and nothing is written.
+        """
+        if self.manifest.exists():
+            return self.manifest.segments()
+        return self._scan_directory()[0]
+
+    def _rotate_locked(self, locked_file) -> None:
+        """
+        Archives the current ledger file and truncates it in place.
+        Must be called while holding the exclusive lock on the current file (see append).
+        """
+        rotation_start = time.perf_counter()
+        tmp_archive_path = self.ledger_base_path / f"{self.current_ledger_file.name}.rotating.tmp"
+        try:
+            self._ensure_manifest()
+            with open(self.current_ledger_file, "rb") as f_in:
+                data = f_in.read()
+            events, min_ts, max_ts = self.summarize(data)
+            with open(tmp_archive_path, "wb") as f_raw:
+                with gzip.GzipFile(fileobj=f_raw, mode="wb") as f_out:
+                    f_out.write(data)
+                f_raw.flush()
+                os.fsync(f_raw.fileno())
+            # The sequence number is allocated, the archive named and the manifest updated
+            # under one hold of the manifest lock, so concurrent rotations never collide.
+            with self.manifest.lock():
+                seq = self.manifest.next_seq()
+                archive_file_path = self._archive_path(seq)
+                os.replace(tmp_archive_path, archive_file_path)
+                self.manifest.commit(add=[self._segment_record(seq, archive_file_path, events, min_ts, max_ts, self.shard)],
+                                     locked=True)
+            # Only truncate once the archive is durable and listed. Writers waiting on the lock keep
+            # their handle to the same (now empty) file, so nothing is written to an unlinked inode.
+            locked_file.truncate(0)
+            self._rotation_seconds.observe(time.perf_counter() - rotation_start)
+        except Exception as e:
+            logger.error("Error during ledger rotation of %s: %s", self.current_ledger_file, e)
+            # The current file is left untouched so no events are lost;
+            # rotation is retried on the next append.
+            tmp_archive_path.unlink(missing_ok=True)
 
     def append(self, event: Dict[str, Any]) -> None:
         """
         Appends a single AEP event to the current ledger file.
         Rotates the ledger if it exceeds the configured size.
         Uses file locking to prevent corruption from multiple writers.
+        In 'batch' durability mode the event is buffered until the batch is full.
 
         Args:
             event: The AEP event dictionary to append.
         """
-        # Rotate must happen *before* acquiring the lock on current_ledger_file,
-        # especially if rotation renames/deletes current_ledger_file.
-        # However, _rotate_if_needed itself reads stat() and then renames/gzips.
-        # This means rotation itself needs to be atomic or careful about the current file.
-        # For now, let's assume _rotate_if_needed is quick and issues are rare.
-        # A more robust rotation might lock a meta-file or use a temporary name for new current.
-        self._rotate_if_needed() 
-        
+        append_start = time.perf_counter()
         try:
-            # Lock the current ledger file for append operations.
-            # Using "ab" mode implies we want to append if it exists, or create if not.
-            # portalocker.Lock expects the file to exist for some lock types on some OS,
-            # but "ab" mode within the with statement should handle creation.
-            with portalocker.Lock(self.current_ledger_file, "ab", timeout=5) as f: # Increased timeout
-                msgpack.pack(event, f)
+            payload = msgpack.packb(event)
+            if self.durability == "batch":
+                with self._pending_lock:
+                    self._pending.append(payload)
+                    if len(self._pending) < self.batch_size:
+                        return
+                    payloads, self._pending = self._pending, []
+                self._write_payloads(payloads)
+            else:
+                self._write_payloads([payload])
+        except Exception as e:
+            logger.error("Error appending to ledger %s: %s", self.current_ledger_file, e)
+        finally:
+            self._append_seconds.observe(time.perf_counter() - append_start)
+
+    def flush(self) -> None:
+        """Writes any events buffered in 'batch' mode. A no-op in the other modes."""
+        with self._pending_lock:
+            payloads, self._pending = self._pending, []
+        if payloads:
+            self._write_payloads(payloads)
+
+    def close(self) -> None:
+        """Flushes buffered events. The ledger can still be appended to afterwards."""
+        self.flush()
+
+    def __del__(self):
+        # A 'batch' ledger dropped without close() still writes its buffered events.
+        if getattr(self, "_pending", None):
+            self.flush()
+
+    def _write_payloads(self, payloads: List[bytes]) -> None:
+        """Writes already-packed events with a single locked write."""
+        # Imported on first write: portalocker takes ~60ms to import, which read-only
+        # users of this module (the CLI, readers) should not pay.
+        import portalocker
+        self.ledger_base_path.mkdir(parents=True, exist_ok=True)
+        try:
+            # The size check, rotation and write all happen under the same exclusive lock,
+            # so two processes can never rotate the same file at once.
+            with portalocker.Lock(self.current_ledger_file, "a+b", timeout=5) as f: # Increased timeout
+                if not self._recovered:
+                    self._recover_locked(f)
+                    self._recovered = True
+                size = os.fstat(f.fileno()).st_size
+                if size >= self.max_file_size_bytes:
+                    self._rotate_locked(f)
+                    size = 0
+                # Keep each file in one format, whatever this writer was configured with.
+                if size == 0:
+                    file_is_framed = self.framed
+                else:
+                    file_is_framed = framing.is_framed(os.pread(f.fileno(), len(framing.FILE_MAGIC), 0))
+                if file_is_framed:
+                    data = b"".join(framing.encode_frame(payload) for payload in payloads)
+                    if size == 0:
+                        data = framing.FILE_MAGIC + data
+                else:
+                    data = b"".join(payloads)
+                f.write(data)
                 f.flush() # Ensure data is written to OS buffers
-                os.fsync(f.fileno()) # Ensure data is written to disk. TODO: For high-volume, consider batching/async writes.
+                if self.durability != "flush":
+                    fsync_start = time.perf_counter()
+                    os.fsync(f.fileno()) # Ensure data is written to disk
+                    self._fsync_seconds.observe(time.perf_counter() - fsync_start)
         except portalocker.exceptions.LockException as le:
-            print(f"Error acquiring lock for {self.current_ledger_file}: {le}", file=sys.stderr)
+            logger.error("Error acquiring lock for %s: %s", self.current_ledger_file, le)
             # Optionally, implement a retry mechanism or specific error handling
         except Exception as e:
-            print(f"Error appending to ledger {self.current_ledger_file}: {e}", file=sys.stderr)
+            logger.error("Error appending to ledger %s: %s", self.current_ledger_file, e)
+
+    def recover(self) -> int:
+        """
+        Truncates a torn tail (an incomplete or corrupt last frame left by a crash) from this
+        ledger's framed current file. Only the tail is read, so this is cheap; legacy
+        (unframed) files are left alone. Writers do this before their first write.
+
+        Returns:
+            The number of bytes truncated.
+        """
+        import portalocker
+        if not self.current_ledger_file.exists():
+            return 0
+        try:
+            with portalocker.Lock(self.current_ledger_file, "a+b", timeout=5) as f:
+                truncated = self._recover_locked(f)
+                self._recovered = True
+                return truncated
+        except portalocker.exceptions.LockException as le:
+            logger.error("Error acquiring lock for %s: %s", self.current_ledger_file, le)
+        except Exception as e:
+            logger.error("Error recovering ledger %s: %s", self.current_ledger_file, e)
+        return 0
+
+    def _recover_locked(self, locked_file) -> int:
+        """recover() for a caller already holding the exclusive lock on the current file."""
+        header_size = len(framing.FILE_MAGIC)
+        f = locked_file
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or not framing.is_framed(os.pread(f.fileno(), header_size, 0)):
+            return 0
+        window = RECOVERY_WINDOW_BYTES
+        while True:
+            window_start = max(header_size, size - window)
+            frame_end = framing.last_frame_end(os.pread(f.fileno(), size - window_start, window_start))
+            if frame_end is not None:
+                good_size = window_start + frame_end
+                break
+            if window_start == header_size:
+                good_size = header_size
+                break
+            window *= 2  # The last good frame is larger than the window; look further back.
+        if good_size < size:
+            f.truncate(good_size)
+            logger.warning("Truncated %d torn bytes from %s", size - good_size, self.current_ledger_file)
+        return size - good_size
 
     def read_events(self, file_path: Path) -> List[Dict[str, Any]]:
-        """Reads all MsgPack events from a given ledger file (gzipped or plain)."""
-        events = []
+        """Reads all MsgPack events from a given ledger file (gzipped or plain, framed or legacy)."""
+        return list(self.iter_events(file_path))
+
+    def iter_events(self, file_path: Path, event_filter: Optional[EventFilter] = None,
+                    strict: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the events of a ledger file that match `event_filter` (all events if None).
+        In framed files, events that cannot match an equality filter are skipped before
+        they are decoded. Read errors are logged and end the iteration, unless `strict`:
+        then they are raised, and so is a corrupt, torn or undecodable part of the file
+        (ValueError, after the readable events), so callers can tell a partial read apart.
+        """
+        needles = event_filter.needles() if event_filter is not None else ()
         try:
             if file_path.suffix == ".gz":
                 with gzip.open(file_path, "rb") as f:
-                    unpacker = msgpack.Unpacker(f, raw=False)
-                    for event in unpacker:
-                        events.append(event)
+                    header = f.read(len(framing.FILE_MAGIC))
+                    stats = framing.FrameScanStats()
+                    if framing.is_framed(header):
+                        events = (event for _, event in decode_frames(
+                            header + f.read(), stats=stats, needles=needles, source=file_path))
+                    else:
+                        events = self._iter_unframed_stream(f, header, file_path, strict=strict)
+                    for event in events:
+                        if event_filter is None or event_filter.matches(event):
+                            yield event
             else:
-                with open(file_path, "rb") as f:
-                    unpacker = msgpack.Unpacker(f, raw=False)
-                    for event in unpacker:
-                        events.append(event)
+                # Uncompressed files are read through an mmap (zero-copy for framed files).
+                with SegmentReader(file_path) as reader:
+                    for _, event in reader.iter_events(needles=needles):
+                        if event_filter is None or event_filter.matches(event):
+                            yield event
+                    stats = reader.stats
+                    if strict and not reader.framed and reader.end_offset < reader.size:
+                        raise ValueError(f"Truncated event at offset {reader.end_offset} in {file_path}")
+            if strict and stats.damaged:
+                raise ValueError(f"Damaged ledger file {file_path}: {stats!r}")
         except FileNotFoundError:
-            print(f"Ledger file not found: {file_path}")
+            if strict:
+                raise
+            logger.warning("Ledger file not found: %s", file_path)
         except Exception as e:
-            print(f"Error reading ledger file {file_path}: {e}")
-        return events
+            if strict:
+                raise
+            logger.warning("Error reading ledger file %s: %s", file_path, e)
+
+    @staticmethod
+    def _iter_unframed_stream(f, header: bytes, file_path: Path, strict: bool = False) -> Iterator[Dict[str, Any]]:
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(header)
+        fed = len(header)
+        yield from unpacker
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            unpacker.feed(chunk)
+            fed += len(chunk)
+            yield from unpacker
+        if strict and unpacker.tell() < fed:
+            raise ValueError(f"Truncated event at offset {unpacker.tell()} in {file_path}")
+
+    def get_current_ledger_files(self) -> List[Path]:
+        """Gets the current (uncompressed) files of every shard of this ledger, including the shared one."""
+        current_files = []
+        shared_current = self.ledger_base_path / f"{self.ledger_name}.aep.current"
+        if shared_current.exists():
+            current_files.append(shared_current)
+        shards = self.manifest.shards() if self.manifest.exists() else self._shards_on_disk()
+        for shard in sorted(shards):
+            shard_current = self.ledger_base_path / f"{self.ledger_name}.aep.{shard}.current"
+            if shard_current.exists():
+                current_files.append(shard_current)
+        return current_files
 
     def get_all_ledger_files(self, include_current: bool = True) -> List[Path]:
-        """Gets a list of all ledger files (archived and optionally current)."""
-        archived_files = sorted(self.ledger_base_path.glob(f"{self.ledger_name}.aep.*.msgpack.gz"))
-        all_files = list(archived_files)
-        if include_current and self.current_ledger_file.exists():
-            all_files.append(self.current_ledger_file)
+        """Gets a list of all ledger files (archived, oldest first, and optionally the current files of all shards)."""
+        all_files = [self.ledger_base_path / segment["file"] for segment in self.segments()]
+        if include_current:
+            all_files.extend(self.get_current_ledger_files())
         return all_files
 
     def __repr__(self) -> str:
         return (
             f"AEPLedger(ledger_base_path='{self.ledger_base_path}', "
             f"ledger_name='{self.ledger_name}', "
+            f"shard={self.shard!r}, "
+            f"framed={self.framed}, "
+            f"durability='{self.durability}', "
             f"current_file='{self.current_ledger_file}')"
         )
 
@@ -0,0 +1,198 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and is
+# emitted as a structured field.
+_STANDARD_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+DEFAULT_LOG_LEVEL = os.environ.get("AEP_LOG_LEVEL", "INFO")
+DEFAULT_LOG_FORMAT = os.environ.get("AEP_LOG_FORMAT", "text")  # 'text' or 'json'
+DEFAULT_QUEUE_SIZE = 10_000
+DEFAULT_RATE_LIMIT_INTERVAL_S = 10.0
+DEFAULT_RATE_LIMIT_BURST = 5
+
+# Loggers configured by configure_logging(). Modules log via get_logger(__name__).
+CONFIGURED_LOGGERS = ("aep", "backend", "analysis")
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns a stdlib logger. Pass arguments lazily (logger.debug("x=%s", x)) so nothing
+    is formatted when the level is disabled.
+    """
+    return logging.getLogger(name)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` records per call site (file and line) every `interval_s`.
+    The first record after a suppressed stretch carries a `suppressed` count.
+    """
+
+    def __init__(self, interval_s: float = DEFAULT_RATE_LIMIT_INTERVAL_S, burst: int = DEFAULT_RATE_LIMIT_BURST):
+        super().__init__()
+        self.interval_s = interval_s
+        self.burst = burst
+        # call site -> [window_start, emitted_in_window, suppressed_in_window]
+        self._sites: Dict[Tuple[str, int], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.interval_s:
+                suppressed = int(site[2]) if site else 0
+                self._sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if site[1] < self.burst:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Human-readable format with `extra=` fields appended as key=value pairs."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extras = " ".join(
+            f"{key}={value}" for key, value in record.__dict__.items()
+            if key not in _STANDARD_RECORD_ATTRS and not key.startswith("_")
+        )
+        return f"{line} {extras}" if extras else line
+
+
+# Across every configure_logging() call, so the total never goes down.
+_dropped_records = REGISTRY.counter("aep_log_dropped_total", "Log records dropped because the queue was full.")
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records without formatting them (the listener thread formats and writes),
+    and drops records instead of blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            _dropped_records.inc()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_atexit_registered = False
+# Level, handlers and propagate flag of each configured logger before configure_logging(),
+# put back by shutdown_logging() so later records are not sent to a stopped queue.
+_saved_logger_state: Dict[str, Tuple[int, List[logging.Handler], bool]] = {}
+
+
+def configure_logging(
+    level: str = DEFAULT_LOG_LEVEL,
+    log_format: str = DEFAULT_LOG_FORMAT,
+    stream=None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    rate_limit_interval_s: float = DEFAULT_RATE_LIMIT_INTERVAL_S,
+    rate_limit_burst: int = DEFAULT_RATE_LIMIT_BURST,
+) -> logging.handlers.QueueListener:
+    """
+    Routes the aep/backend/analysis loggers through a bounded queue to a background
+    writer thread, with per-call-site rate limiting. Safe to call more than once;
+    the previous listener is stopped and replaced.
+
+    Args:
+        level: Log level name for the configured loggers. Defaults to $AEP_LOG_LEVEL or INFO.
+        log_format: 'json' for one JSON object per line, 'text' for key=value lines.
+        stream: Output stream for the writer thread. Defaults to sys.stderr.
+        queue_size: Maximum queued records; further records are dropped, not blocked on.
+        rate_limit_interval_s: Window for per-call-site rate limiting.
+        rate_limit_burst: Records allowed per call site per window.
+
+    Returns:
+        The started QueueListener.
+    """
+    global _listener, _queue_handler, _atexit_registered
+    shutdown_logging()
+    if not _atexit_registered:
+        # The listener thread is a daemon; flush whatever is queued when the process exits.
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    output_handler = logging.StreamHandler(stream or sys.stderr)
+    output_handler.setFormatter(StructuredFormatter() if log_format == "json" else KeyValueFormatter())
+
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(RateLimitFilter(rate_limit_interval_s, rate_limit_burst))
+    for name in CONFIGURED_LOGGERS:
+        logger = logging.getLogger(name)
+        _saved_logger_state[name] = (logger.level, list(logger.handlers), logger.propagate)
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+        logger.handlers = [_queue_handler]
+        logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output_handler, respect_handler_level=True)
+    _listener.start()
+    REGISTRY.gauge("aep_log_queue_depth", "Log records waiting for the writer thread.", fn=log_queue.qsize)
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """
+    Flushes queued records, stops the writer thread started by configure_logging() and gives
+    the configured loggers back the handlers and settings they had before it.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for name, (level, handlers, propagate) in _saved_logger_state.items():
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        logger.handlers = handlers
+        logger.propagate = propagate
+    _saved_logger_state.clear()
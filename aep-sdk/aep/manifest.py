@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    import portalocker
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+MANIFEST_VERSION = 1
+# Rewrite the manifest as a single snapshot record once it has this many records.
+CHECKPOINT_AFTER_RECORDS = 1000
+
+
+class LedgerManifest:
+    """
+    Append-only list of a ledger's archived segments, stored as JSON lines in
+    '<ledger_name>.aep.manifest'.
+
+    Every record is one line, written with a single write() while holding the exclusive
+    lock on '<ledger_name>.aep.manifest.lock':
+
+        {"v": 1, "max_seq": 7, "add": [<segment>, ...], "remove": ["<file name>", ...], "shards": [...]}
+
+    A segment is {"seq", "file", "shard", "bytes", "events", "min_ts", "max_ts", "created"}. Segments
+    are ordered by seq, and max_seq only grows, so sequence numbers are never reused.
+    Because adds and removes land in one record, a reader never sees a half-applied
+    compaction. Readers apply only the bytes appended since their last read, so listing
+    segments costs one stat() when nothing has changed.
+    """
+
+    def __init__(self, ledger_base_path: Path, ledger_name: str):
+        self.ledger_base_path = Path(ledger_base_path)
+        self.ledger_name = ledger_name
+        self.path = self.ledger_base_path / f"{ledger_name}.aep.manifest"
+        # A separate lock file, because checkpoint() replaces the manifest file itself.
+        self.lock_path = self.ledger_base_path / f"{ledger_name}.aep.manifest.lock"
+        self._segments: Dict[str, Dict[str, Any]] = {}
+        self._shards: List[str] = []
+        self._max_seq = 0
+        self._records = 0
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._cache_lock = threading.Lock()
+
+    # --- Reading ---
+
+    def _reset(self) -> None:
+        self._segments, self._shards = {}, []
+        self._max_seq = self._records = self._offset = 0
+        self._inode = None
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        for file_name in record.get("remove", ()):
+            self._segments.pop(file_name, None)
+        for segment in record.get("add", ()):
+            self._segments[segment["file"]] = segment
+        for shard in record.get("shards", ()):
+            if shard not in self._shards:
+                self._shards.append(shard)
+        self._max_seq = max(self._max_seq, record.get("max_seq", 0))
+        self._records += 1
+
+    def _refresh(self) -> bool:
+        """Applies records appended since the last refresh. Returns False if there is no manifest yet."""
+        with self._cache_lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset()
+                return False
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                self._reset()  # Rewritten by checkpoint(); start over.
+                self._inode = st.st_ino
+            if st.st_size == self._offset:
+                return st.st_size > 0
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                new_bytes = f.read(st.st_size - self._offset)
+            # Only consume complete lines; a writer may be mid-append.
+            complete = new_bytes[:new_bytes.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning("Skipping malformed manifest record in %s: %s", self.path, e)
+            self._offset += len(complete)
+            return self._offset > 0
+
+    def exists(self) -> bool:
+        return self._refresh()
+
+    def segments(self) -> List[Dict[str, Any]]:
+        """Live segments, oldest (lowest seq) first."""
+        self._refresh()
+        return sorted(self._segments.values(), key=lambda segment: segment["seq"])
+
+    def shards(self) -> List[str]:
+        self._refresh()
+        return list(self._shards)
+
+    @property
+    def max_seq(self) -> int:
+        self._refresh()
+        return self._max_seq
+
+    # --- Writing ---
+
+    def lock(self) -> "portalocker.Lock":
+        """Exclusive lock on the manifest. Seq allocation and commits must happen while holding it."""
+        import portalocker
+        return portalocker.Lock(self.lock_path, "a", timeout=10)
+
+    def next_seq(self) -> int:
+        """The next unused sequence number. Call while holding lock() and commit it in the same hold."""
+        self._refresh()
+        return self._max_seq + 1
+
+    def commit(self, add: Iterable[Dict[str, Any]] = (), remove: Iterable[str] = (),
+               shards: Iterable[str] = (), locked: bool = False) -> None:
+        """
+        Appends one record. Pass locked=True when the caller already holds lock();
+        otherwise the lock is taken here.
+        """
+        add = list(add)
+        self._refresh()
+        max_seq = max([self._max_seq] + [segment["seq"] for segment in add])
+        record = {"v": MANIFEST_VERSION, "max_seq": max_seq, "ts": time.time()}
+        if add:
+            record["add"] = add
+        if remove:
+            record["remove"] = list(remove)
+        if shards:
+            record["shards"] = list(shards)
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        if locked:
+            self._write(line)
+        else:
+            with self.lock():
+                self._write(line)
+
+    def _write(self, line: bytes) -> None:
+        with open(self.path, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._refresh()
+
+    def register_shard(self, shard: str) -> None:
+        if shard not in self.shards():
+            self.commit(shards=[shard])
+
+    def checkpoint(self) -> bool:
+        """
+        Rewrites the manifest as a single snapshot record once it has grown past
+        CHECKPOINT_AFTER_RECORDS records. Returns True if it was rewritten.
+        """
+        with self.lock():
+            self._refresh()
+            if self._records < CHECKPOINT_AFTER_RECORDS:
+                return False
+            record = {"v": MANIFEST_VERSION, "max_seq": self._max_seq, "ts": time.time(),
+                      "add": self.segments(), "shards": list(self._shards)}
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write((json.dumps(record, separators=(",", ":")) + "\n").encode())
+                f.flush()
+                os.fsync(f.fileno())
+            # Readers notice the new inode and reload.
+            os.replace(tmp_path, self.path)
+        return True
+
+    def __repr__(self) -> str:
+        return f"LedgerManifest(path='{self.path}')"
@@ -0,0 +1,268 @@
+import math
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Log-bucketed histograms: bucket i covers (2**((i-1)/SUBBUCKETS), 2**(i/SUBBUCKETS)] relative
+# to MIN_EXP, so every recorded value is known to within ~9% (2**(1/8)) regardless of scale.
+SUBBUCKETS_PER_OCTAVE = 8
+MIN_EXP = -20  # ~1 microsecond when recording seconds
+MAX_EXP = 40   # ~1e12, wide enough for focus_ms values
+_NUM_BUCKETS = (MAX_EXP - MIN_EXP) * SUBBUCKETS_PER_OCTAVE + 2  # + underflow and overflow buckets
+
+# Bucket bounds exported to Prometheus (seconds): powers of two from ~61us to 64s.
+PROMETHEUS_EXPORT_EXPS = range(-14, 7)
+
+
+def _bucket_index(value: float) -> int:
+    if value <= 2.0 ** MIN_EXP:
+        return 0
+    index = math.ceil((math.log2(value) - MIN_EXP) * SUBBUCKETS_PER_OCTAVE)
+    return min(index, _NUM_BUCKETS - 1)
+
+
+def _bucket_upper_bound(index: int) -> float:
+    if index >= _NUM_BUCKETS - 1:
+        return math.inf
+    return 2.0 ** (MIN_EXP + index / SUBBUCKETS_PER_OCTAVE)
+
+
+class Histogram:
+    """
+    A fixed-size, log-bucketed histogram. Recording is O(1) and memory is constant,
+    and two histograms can be merged, so it also serves as a quantile sketch.
+    """
+
+    def __init__(self, name: str = "", help_text: str = "", labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = dict(labels or {})
+        self._counts: List[int] = [0] * _NUM_BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = _bucket_index(value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def merge(self, other: "Histogram") -> None:
+        with self._lock:
+            for i, c in enumerate(other._counts):
+                if c:
+                    self._counts[i] += c
+            self.count += other.count
+            self.sum += other.sum
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns an approximate q-quantile (0 <= q <= 1), or None if the histogram is empty."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, c in enumerate(self._counts):
+            seen += c
+            if c and seen >= rank:
+                # Geometric midpoint of the bucket, clamped to the observed range.
+                upper = _bucket_upper_bound(index)
+                lower = _bucket_upper_bound(index - 1) if index > 0 else 0.0
+                estimate = math.sqrt(lower * upper) if lower > 0 and upper != math.inf else upper
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def cumulative_counts(self, upper_bounds) -> List[Tuple[float, int]]:
+        """Returns (le, cumulative count) pairs for the given bucket upper bounds."""
+        result = []
+        running = 0
+        index = 0
+        for le in upper_bounds:
+            while index < _NUM_BUCKETS and _bucket_upper_bound(index) <= le:
+                running += self._counts[index]
+                index += 1
+            result.append((le, running))
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact, mergeable representation (only non-empty buckets are kept)."""
+        return {
+            "buckets": {i: c for i, c in enumerate(self._counts) if c},
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Histogram":
+        hist = cls()
+        for i, c in data["buckets"].items():
+            hist._counts[int(i)] = c
+        hist.count = data["count"]
+        hist.sum = data["sum"]
+        if data["count"]:
+            hist.min = data["min"]
+            hist.max = data["max"]
+        return hist
+
+    def __repr__(self) -> str:
+        return f"Histogram(name='{self.name}', labels={self.labels}, count={self.count})"
+
+
+class Gauge:
+    """A gauge that is either set explicitly or read from a callback at scrape time."""
+
+    def __init__(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None,
+                 fn: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = dict(labels or {})
+        self.fn = fn
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    @property
+    def value(self) -> float:
+        if self.fn is not None:
+            try:
+                return float(self.fn())
+            except Exception:
+                return math.nan
+        return self._value
+
+
+class Counter:
+    """A monotonically increasing total (Prometheus counter), either incremented or read from a callback."""
+
+    def __init__(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None,
+                 fn: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = dict(labels or {})
+        self.fn = fn
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError(f"Counter {self.name} can only increase, got {amount}")
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        if self.fn is not None:
+            try:
+                return float(self.fn())
+            except Exception:
+                return math.nan
+        return self._value
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = sorted(labels.items())
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in items) + "}"
+
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """Holds named histograms, gauges and counters and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._gauges: Dict[Tuple[str, Tuple], Gauge] = {}
+        self._counters: Dict[Tuple[str, Tuple], Counter] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str = "", **labels: str) -> Histogram:
+        key = (name, _label_key(labels))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, Histogram(name, help_text, labels))
+        return hist
+
+    def gauge(self, name: str, help_text: str = "", fn: Optional[Callable[[], float]] = None, **labels: str) -> Gauge:
+        key = (name, _label_key(labels))
+        gauge = self._gauges.get(key)
+        if gauge is None:
+            with self._lock:
+                gauge = self._gauges.setdefault(key, Gauge(name, help_text, labels, fn))
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def counter(self, name: str, help_text: str = "", fn: Optional[Callable[[], float]] = None, **labels: str) -> Counter:
+        """A counter; by convention its name ends in '_total'."""
+        key = (name, _label_key(labels))
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, Counter(name, help_text, labels, fn))
+        if fn is not None:
+            counter.fn = fn
+        return counter
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        upper_bounds = [2.0 ** exp for exp in PROMETHEUS_EXPORT_EXPS] + [math.inf]
+        seen_names = set()
+        for (name, _), hist in sorted(self._histograms.items(), key=lambda item: item[0]):
+            if name not in seen_names:
+                seen_names.add(name)
+                if hist.help_text:
+                    lines.append(f"# HELP {name} {hist.help_text}")
+                lines.append(f"# TYPE {name} histogram")
+            for le, cumulative in hist.cumulative_counts(upper_bounds):
+                lines.append(f"{name}_bucket{_format_labels(hist.labels, ('le', _format_value(le)))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(hist.labels)} {_format_value(hist.sum)}")
+            lines.append(f"{name}_count{_format_labels(hist.labels)} {hist.count}")
+        for metric_type, metrics in (("gauge", self._gauges), ("counter", self._counters)):
+            for (name, _), metric in sorted(metrics.items(), key=lambda item: item[0]):
+                if name not in seen_names:
+                    seen_names.add(name)
+                    if metric.help_text:
+                        lines.append(f"# HELP {name} {metric.help_text}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name}{_format_labels(metric.labels)} {_format_value(metric.value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by AEPLedger, AEPCallbackHandler and the backend's /metrics endpoint.
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,148 @@
+import operator
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import msgpack
+
+# Fields that can be filtered with --where, and how.
+EQUALITY_FIELDS = ("focus_kind", "event_type", "trace_id", "session_id")
+RANGE_FIELDS = ("ts", "focus_ms")
+_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+_WHERE_RE = re.compile(r"^\s*([A-Za-z_]+)\s*(!=|>=|<=|=|>|<)\s*(.+?)\s*$")
+
+
+def event_trace_id(event: Dict[str, Any]) -> Optional[str]:
+    """Span events carry trace_id; other callback events carry the query_id it is derived from."""
+    return event.get("trace_id") or event.get("query_id")
+
+
+def _parse_ts(value: str) -> float:
+    """Epoch seconds, or an ISO 8601 date/time (UTC if no offset is given)."""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+class EventFilter:
+    """
+    Filters on the top-level event fields used to slice ledgers: equality on focus_kind,
+    event_type, trace_id and session_id, and comparisons on ts and focus_ms.
+    A filter left as None matches everything.
+    """
+
+    def __init__(
+        self,
+        focus_kind: Optional[str] = None,
+        event_type: Optional[str] = None,
+        trace_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        comparisons: Sequence[Tuple[str, str, float]] = (),
+    ):
+        """
+        Args:
+            comparisons: (field, operator, value) triples on RANGE_FIELDS,
+                         e.g. ("ts", ">=", 1700000000.0) or ("focus_ms", ">", 500).
+        """
+        self.focus_kind = focus_kind
+        self.event_type = event_type
+        self.trace_id = trace_id
+        self.session_id = session_id
+        self.comparisons = list(comparisons)
+
+    @classmethod
+    def from_where(cls, expressions: Sequence[str]) -> "EventFilter":
+        """
+        Builds a filter from expressions like 'focus_kind=span', 'ts>=2025-06-01T00:00:00',
+        'focus_ms>500'. All expressions must hold (AND).
+
+        Raises:
+            ValueError: for an unknown field, operator or value.
+        """
+        event_filter = cls()
+        for expression in expressions:
+            match = _WHERE_RE.match(expression)
+            if not match:
+                raise ValueError(f"Cannot parse filter '{expression}'; expected <field><op><value>.")
+            field, op, value = match.groups()
+            if field in EQUALITY_FIELDS:
+                if op != "=":
+                    raise ValueError(f"Only '=' is supported for '{field}'.")
+                setattr(event_filter, field, value)
+            elif field in RANGE_FIELDS:
+                number = _parse_ts(value) if field == "ts" else float(value)
+                event_filter.comparisons.append((field, op, number))
+            else:
+                raise ValueError(f"Unknown filter field '{field}'. "
+                                 f"Supported: {', '.join(EQUALITY_FIELDS + RANGE_FIELDS)}.")
+        return event_filter
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.comparisons and all(
+            value is None for value in (self.focus_kind, self.event_type, self.trace_id, self.session_id))
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self.focus_kind is not None and event.get("focus_kind") != self.focus_kind:
+            return False
+        if self.event_type is not None and event.get("event_type") != self.event_type:
+            return False
+        if self.trace_id is not None and event_trace_id(event) != self.trace_id:
+            return False
+        if self.session_id is not None and event.get("session_id") != self.session_id:
+            return False
+        for field, op, value in self.comparisons:
+            actual = event.get(field)
+            if not isinstance(actual, (int, float)) or not _OPERATORS[op](actual, value):
+                return False
+        return True
+
+    def needles(self) -> List[bytes]:
+        """
+        Byte strings every matching event's encoded MsgPack must contain: the packed value of
+        each equality filter. Lets readers skip framed events without decoding them.
+        """
+        return [msgpack.packb(value) for value in (self.focus_kind, self.event_type, self.trace_id, self.session_id)
+                if value is not None]
+
+    def may_match_segment(self, segment: Dict[str, Any]) -> bool:
+        """False if the segment's recorded ts range (from the manifest) rules out every match."""
+        min_ts, max_ts = segment.get("min_ts"), segment.get("max_ts")
+        if min_ts is None or max_ts is None:
+            return True
+        for field, op, value in self.comparisons:
+            if field != "ts":
+                continue
+            if op in (">", ">=") and not _OPERATORS[op](max_ts, value):
+                return False
+            if op in ("<", "<=") and not _OPERATORS[op](min_ts, value):
+                return False
+            if op == "=" and not min_ts <= value <= max_ts:
+                return False
+        return True
+
+    def __repr__(self) -> str:
+        return (f"EventFilter(focus_kind={self.focus_kind!r}, event_type={self.event_type!r}, "
+                f"trace_id={self.trace_id!r}, session_id={self.session_id!r}, comparisons={self.comparisons!r})")
+
+
+def project(event: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """Keeps only `fields` of an event; dotted names reach into nested dicts (e.g. 'payload.doc_source')."""
+    projected: Dict[str, Any] = {}
+    for field in fields:
+        value: Any = event
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        projected[field] = value
+    return projected
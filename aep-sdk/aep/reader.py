@@ -0,0 +1,148 @@
+import mmap
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import msgpack
+
+from . import framing
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+
+def decode_frames(data: framing.Buffer, start: int = len(framing.FILE_MAGIC),
+                  stats: Optional[framing.FrameScanStats] = None, needles: Sequence[bytes] = (),
+                  source: Any = "") -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Decodes the framed events in `data`, yielding (offset, event).
+
+    Frames whose payload does not contain every byte string in `needles` are skipped
+    without being decoded (see EventFilter.needles); the search runs directly on `data`.
+    """
+    frames = framing.iter_frames(data, start=start, stats=stats)
+    try:
+        for offset, payload in frames:
+            payload_start = offset + framing.FRAME_HEADER_SIZE
+            payload_end = payload_start + len(payload)
+            try:
+                if any(data.find(needle, payload_start, payload_end) == -1 for needle in needles):
+                    continue
+                event = msgpack.unpackb(payload, raw=False)
+            except Exception as e:
+                logger.warning("Skipping undecodable frame at offset %d in %s: %s", offset, source, e)
+                if stats is not None:
+                    stats.undecodable_frames += 1
+                continue
+            finally:
+                payload.release()
+            yield offset, event
+    finally:
+        # Drop the generator's view of `data` so an mmap can be closed.
+        frames.close()
+    if stats is not None and stats.corrupt_regions:
+        logger.warning("Skipped %d corrupt region(s) (%d bytes) in %s",
+                       stats.corrupt_regions, stats.skipped_bytes, source)
+
+
+class SegmentReader:
+    """
+    Reads an uncompressed ledger file (a '.current' file or an uncompressed merge output)
+    through a read-only mmap.
+
+    Framed payloads are decoded straight from memoryview slices of the mapping, with no
+    intermediate copies. Every event is reported with its byte offset, so callers can
+    keep an index for random access (event_at) or resume from end_offset after the file
+    has grown. The mapping covers the file as it was when the reader was
+    opened; open a new reader to see later appends.
+
+    Use as a context manager, or call close().
+    """
+
+    def __init__(self, file_path: Union[str, Path]):
+        self.file_path = Path(file_path)
+        self._file = open(self.file_path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        # mmap cannot map an empty file.
+        self._map: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.framed = self._map is not None and framing.is_framed(self._map[:len(framing.FILE_MAGIC)])
+        self.end_offset = 0  # Just past the last complete event seen by iter_events.
+        self.stats = framing.FrameScanStats()
+
+    def iter_events(self, start: Optional[int] = None,
+                    needles: Sequence[bytes] = ()) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Yields (offset, event) for every complete event at or after `start` (default: the first
+        event). A partially written event at the end of the file is not yielded; end_offset
+        then points at its start. In framed files, events not containing all `needles` are
+        skipped undecoded; legacy files ignore `needles`, so callers must still filter.
+        """
+        if self._map is None:
+            return
+        if self.framed:
+            try:
+                yield from decode_frames(self._map, len(framing.FILE_MAGIC) if start is None else start,
+                                         stats=self.stats, needles=needles, source=self.file_path)
+            finally:
+                self.end_offset = self.stats.end_offset
+        else:
+            yield from self._iter_legacy(0 if start is None else start)
+
+    def _iter_legacy(self, start: int) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        # Raw MsgPack has no boundaries to slice on, so the Unpacker buffers the bytes once.
+        unpacker = msgpack.Unpacker(raw=False)
+        with memoryview(self._map) as view:
+            unpacker.feed(view[start:])
+        self.end_offset = start
+        offset = start
+        for event in unpacker:
+            yield offset, event
+            offset = start + unpacker.tell()
+            self.end_offset = offset
+
+    def offsets(self) -> List[int]:
+        """Byte offsets of every event, for random access via event_at()."""
+        return [offset for offset, _ in self.iter_events()]
+
+    def event_at(self, offset: int) -> Dict[str, Any]:
+        """Decodes the single event starting at `offset` (as reported by iter_events/offsets)."""
+        if self._map is None or offset >= self.size:
+            raise IndexError(f"No event at offset {offset} in {self.file_path}")
+        if self.framed:
+            with memoryview(self._map) as view:
+                frame = framing.frame_at(view, offset)
+                if frame is None:
+                    raise ValueError(f"No valid frame at offset {offset} in {self.file_path}")
+                payload, _ = frame
+                try:
+                    return msgpack.unpackb(payload, raw=False)
+                finally:
+                    payload.release()
+        # Feed only as much as the event needs.
+        unpacker = msgpack.Unpacker(raw=False)
+        chunk_size = 4096
+        with memoryview(self._map) as view:
+            while True:
+                unpacker.feed(view[offset:offset + chunk_size])
+                offset += chunk_size
+                try:
+                    return unpacker.unpack()
+                except msgpack.OutOfData:
+                    if offset >= self.size:
+                        raise ValueError(f"Truncated event in {self.file_path}")
+                    chunk_size *= 2
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> "SegmentReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"SegmentReader(file_path='{self.file_path}', size={self.size}, framed={self.framed})"
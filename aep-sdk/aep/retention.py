@@ -0,0 +1,328 @@
+import gzip
+import hashlib
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+
+import msgpack
+
+if TYPE_CHECKING:
+    import portalocker
+
+from . import framing
+from .ledger import AEPLedger
+from .log import get_logger
+from .query import event_trace_id
+
+logger = get_logger(__name__)
+
+DEFAULT_COMPACT_TARGET_BYTES = 16 * 1024 * 1024  # Compressed size of a compacted segment.
+DEFAULT_COMPACT_MIN_SEGMENTS = 4
+DEFAULT_DOWNSAMPLE_EVENT_TYPES = ("chain_start", "chain_output")  # chain_error is always kept.
+DEFAULT_MAINTENANCE_INTERVAL_S = 300.0
+COMPACTED_SUFFIX = "compacted"
+
+
+class RetentionPolicy:
+    """
+    Which archived segments a ledger keeps, and how small segments are consolidated.
+    Current files are never touched. Every limit is optional; None disables it.
+    """
+
+    def __init__(
+        self,
+        max_age_s: Optional[float] = None,
+        max_total_bytes: Optional[int] = None,
+        max_segments: Optional[int] = None,
+        cold_dir: Optional[Union[str, Path]] = None,
+        compact: bool = False,
+        compact_target_bytes: int = DEFAULT_COMPACT_TARGET_BYTES,
+        compact_min_segments: int = DEFAULT_COMPACT_MIN_SEGMENTS,
+        downsample_after_s: Optional[float] = None,
+        downsample_keep_every: int = 10,
+        downsample_event_types=DEFAULT_DOWNSAMPLE_EVENT_TYPES,
+    ):
+        """
+        Args:
+            max_age_s: Drop archives whose newest event is more than this many seconds old.
+            max_total_bytes: Drop the oldest archives until the rest fit in this many bytes.
+            max_segments: Keep at most this many archives.
+            cold_dir: Move dropped archives here (a cheaper storage tier) instead of deleting them.
+            compact: Merge runs of small archives into segments of about compact_target_bytes.
+            compact_target_bytes: Compressed size a compacted segment is filled up to.
+            compact_min_segments: Only compact runs of at least this many archives.
+            downsample_after_s: During compaction, thin out events of downsample_event_types
+                                older than this. Whole traces (by trace_id) are kept or dropped
+                                together, and kept events carry a `sample_weight`.
+            downsample_keep_every: Keep one trace in this many when downsampling.
+            downsample_event_types: Event types eligible for downsampling.
+        """
+        self.max_age_s = max_age_s
+        self.max_total_bytes = max_total_bytes
+        self.max_segments = max_segments
+        self.cold_dir = Path(cold_dir) if cold_dir else None
+        self.compact = compact
+        self.compact_target_bytes = compact_target_bytes
+        self.compact_min_segments = compact_min_segments
+        self.downsample_after_s = downsample_after_s
+        self.downsample_keep_every = downsample_keep_every
+        self.downsample_event_types = tuple(downsample_event_types)
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        """Builds a policy from AEP_RETENTION_* / AEP_COMPACT* environment variables."""
+        def _float(name: str) -> Optional[float]:
+            value = os.environ.get(name)
+            return float(value) if value else None
+
+        max_age_days = _float("AEP_RETENTION_MAX_AGE_DAYS")
+        max_total_mb = _float("AEP_RETENTION_MAX_TOTAL_MB")
+        max_segments = _float("AEP_RETENTION_MAX_SEGMENTS")
+        downsample_after_days = _float("AEP_COMPACT_DOWNSAMPLE_AFTER_DAYS")
+        return cls(
+            max_age_s=max_age_days * 86400 if max_age_days is not None else None,
+            max_total_bytes=int(max_total_mb * 1024 * 1024) if max_total_mb is not None else None,
+            max_segments=int(max_segments) if max_segments is not None else None,
+            cold_dir=os.environ.get("AEP_RETENTION_COLD_DIR") or None,
+            compact=os.environ.get("AEP_COMPACT") == "1",
+            downsample_after_s=downsample_after_days * 86400 if downsample_after_days is not None else None,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.compact or any(
+            limit is not None for limit in (self.max_age_s, self.max_total_bytes, self.max_segments))
+
+    def __repr__(self) -> str:
+        return (f"RetentionPolicy(max_age_s={self.max_age_s}, max_total_bytes={self.max_total_bytes}, "
+                f"max_segments={self.max_segments}, cold_dir={self.cold_dir}, compact={self.compact})")
+
+
+def _maintenance_lock(ledger: AEPLedger) -> "portalocker.Lock":
+    """One maintenance pass per ledger at a time, across processes. Writers never take this lock."""
+    import portalocker
+    lock_path = ledger.ledger_base_path / f"{ledger.ledger_name}.aep.maintenance.lock"
+    return portalocker.Lock(lock_path, "a", timeout=0, fail_when_locked=True)
+
+
+def _drop_segment(path: Path, policy: RetentionPolicy) -> None:
+    if policy.cold_dir is not None:
+        policy.cold_dir.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(path), str(policy.cold_dir / path.name))
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _segment_age_ts(segment: Dict[str, Any]) -> float:
+    """Newest event in the segment; falls back to when the segment was recorded."""
+    return segment["max_ts"] if segment.get("max_ts") is not None else segment["created"]
+
+
+def apply_retention(ledger: AEPLedger, policy: RetentionPolicy, now: Optional[float] = None,
+                    dry_run: bool = False) -> List[Path]:
+    """
+    Drops (or moves to policy.cold_dir) the archived segments that fall outside the policy's
+    age, total-size and count limits, oldest first. Segments leave the manifest before their
+    files are removed, so readers never plan reads of missing files.
+
+    Returns:
+        The segments that were (or, with dry_run, would be) dropped.
+    """
+    now = time.time() if now is None else now
+    if not dry_run:
+        ledger._ensure_manifest()  # Removals must land in a manifest that lists the other segments.
+    segments = ledger.segments()
+
+    dropped = []
+    total_bytes = sum(segment["bytes"] for segment in segments)
+    remaining = len(segments)
+    for segment in segments:
+        too_old = policy.max_age_s is not None and now - _segment_age_ts(segment) > policy.max_age_s
+        too_big = policy.max_total_bytes is not None and total_bytes > policy.max_total_bytes
+        too_many = policy.max_segments is not None and remaining > policy.max_segments
+        if not (too_old or too_big or too_many):
+            break
+        dropped.append(ledger.ledger_base_path / segment["file"])
+        total_bytes -= segment["bytes"]
+        remaining -= 1
+    if dropped and not dry_run:
+        ledger.manifest.commit(remove=[path.name for path in dropped])
+        for path in dropped:
+            _drop_segment(path, policy)
+    if dropped:
+        logger.info("Retention %s %d segment(s) of ledger '%s'",
+                    "would drop" if dry_run else "dropped", len(dropped), ledger.ledger_name)
+    return dropped
+
+
+def _keep_when_downsampling(event: Dict[str, Any], keep_every: int) -> bool:
+    trace_key = str(event_trace_id(event) or event.get("id"))
+    return int(hashlib.sha1(trace_key.encode()).hexdigest()[:8], 16) % keep_every == 0
+
+
+def _downsample(events: List[Dict[str, Any]], policy: RetentionPolicy, now: float) -> List[Dict[str, Any]]:
+    cutoff = now - policy.downsample_after_s
+    kept = []
+    for event in events:
+        if (event.get("event_type") in policy.downsample_event_types
+                and isinstance(event.get("ts"), (int, float)) and event["ts"] < cutoff):
+            if not _keep_when_downsampling(event, policy.downsample_keep_every):
+                continue
+            event = dict(event, sample_weight=event.get("sample_weight", 1) * policy.downsample_keep_every)
+        kept.append(event)
+    return kept
+
+
+def _compaction_runs(segments: List[Dict[str, Any]], policy: RetentionPolicy) -> List[List[Dict[str, Any]]]:
+    """Groups consecutive small segments into runs whose total size stays under the target."""
+    runs, run, run_bytes = [], [], 0
+    for segment in segments:
+        size = segment["bytes"]
+        if size >= policy.compact_target_bytes:
+            runs.append(run)
+            run, run_bytes = [], 0
+            continue
+        if run and run_bytes + size > policy.compact_target_bytes:
+            runs.append(run)
+            run, run_bytes = [], 0
+        run.append(segment)
+        run_bytes += size
+    runs.append(run)
+    return [run for run in runs if len(run) >= policy.compact_min_segments]
+
+
+def _write_compacted_segment(ledger: AEPLedger, seq: int, events: List[Dict[str, Any]]) -> Path:
+    segment_path = ledger.ledger_base_path / f"{ledger.ledger_name}.aep.{seq:010d}.{COMPACTED_SUFFIX}.msgpack.gz"
+    tmp_path = segment_path.with_name(segment_path.name + ".tmp")
+    with open(tmp_path, "wb") as f_raw:
+        with gzip.GzipFile(fileobj=f_raw, mode="wb") as f_out:
+            f_out.write(framing.FILE_MAGIC)
+            for event in events:
+                f_out.write(framing.encode_frame(msgpack.packb(event)))
+        f_raw.flush()
+        os.fsync(f_raw.fileno())
+    os.replace(tmp_path, segment_path)
+    return segment_path
+
+
+def _read_run(ledger: AEPLedger, run: List[Dict[str, Any]], source_paths: List[Path]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Every event of a run's segments, or None if any segment cannot be read in full or holds
+    fewer events than the manifest recorded for it. The run is then left as it is.
+    """
+    events = []
+    for segment, path in zip(run, source_paths):
+        try:
+            segment_events = list(ledger.iter_events(path, strict=True))
+        except Exception as e:
+            logger.error("Not compacting %d segments of ledger '%s': %s is unreadable: %s",
+                         len(run), ledger.ledger_name, path.name, e)
+            return None
+        if segment.get("events") is not None and len(segment_events) < segment["events"]:
+            logger.error("Not compacting %d segments of ledger '%s': read %d of the %d events in %s",
+                         len(run), ledger.ledger_name, len(segment_events), segment["events"], path.name)
+            return None
+        events.extend(segment_events)
+    return events
+
+
+def compact(ledger: AEPLedger, policy: RetentionPolicy, now: Optional[float] = None,
+            dry_run: bool = False) -> List[Path]:
+    """
+    Merges runs of small segments into larger, time-ordered, framed segments, optionally
+    downsampling old chain_* events. A compacted segment takes the seq of the first segment it
+    replaces, so it stays in place in the ledger's order. Sources are read strictly, and a run
+    with a damaged or short segment is skipped. The compacted segment is durable before one
+    manifest record swaps it in for its sources, and only then are the sources deleted.
+
+    Returns:
+        The compacted segments that were (or, with dry_run, would be) written.
+    """
+    now = time.time() if now is None else now
+    if not dry_run:
+        ledger._ensure_manifest()
+    written = []
+    for run in _compaction_runs(ledger.segments(), policy):
+        first_seq = run[0]["seq"]
+        if dry_run:
+            written.append(ledger.ledger_base_path / run[0]["file"])
+            continue
+        source_paths = [ledger.ledger_base_path / segment["file"] for segment in run]
+        events = _read_run(ledger, run, source_paths)
+        if events is None:
+            continue
+        events.sort(key=lambda event: event.get("ts") if isinstance(event.get("ts"), (int, float)) else 0)
+        if policy.downsample_after_s is not None:
+            events = _downsample(events, policy, now)
+        segment_path = _write_compacted_segment(ledger, first_seq, events)
+        timestamps = [event["ts"] for event in events if isinstance(event.get("ts"), (int, float))]
+        record = ledger._segment_record(first_seq, segment_path, len(events),
+                                        min(timestamps, default=None), max(timestamps, default=None))
+        ledger.manifest.commit(add=[record], remove=[segment["file"] for segment in run])
+        for path in source_paths:
+            if path != segment_path:
+                path.unlink(missing_ok=True)
+        logger.info("Compacted %d segments into %s (%d events)", len(run), segment_path.name, len(events))
+        written.append(segment_path)
+    return written
+
+
+def run_maintenance(ledger: AEPLedger, policy: RetentionPolicy, now: Optional[float] = None,
+                    dry_run: bool = False) -> Dict[str, List[Path]]:
+    """
+    One maintenance pass: compaction (if enabled), then retention. Skipped if another
+    process is already maintaining this ledger.
+    """
+    import portalocker
+    result: Dict[str, List[Path]] = {"compacted": [], "dropped": []}
+    if not ledger.ledger_base_path.is_dir():
+        return result  # Nothing to maintain; don't create the directory for the lock file.
+    try:
+        with _maintenance_lock(ledger):
+            if policy.compact:
+                result["compacted"] = compact(ledger, policy, now=now, dry_run=dry_run)
+            result["dropped"] = apply_retention(ledger, policy, now=now, dry_run=dry_run)
+            if not dry_run:
+                ledger.manifest.checkpoint()
+    except portalocker.exceptions.AlreadyLocked:
+        logger.info("Maintenance of ledger '%s' is already running elsewhere; skipping.", ledger.ledger_name)
+    return result
+
+
+class LedgerMaintenance:
+    """Runs run_maintenance() for a set of ledgers on a background daemon thread."""
+
+    def __init__(self, ledgers: List[AEPLedger], policy: RetentionPolicy,
+                 interval_s: float = DEFAULT_MAINTENANCE_INTERVAL_S):
+        self.ledgers = list(ledgers)
+        self.policy = policy
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> None:
+        for ledger in self.ledgers:
+            try:
+                run_maintenance(ledger, self.policy)
+            except Exception as e:
+                logger.error("Maintenance of ledger '%s' failed: %s", ledger.ledger_name, e)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.run_once()
+
+    def start(self) -> "LedgerMaintenance":
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="aep-ledger-maintenance", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,224 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .ledger import AEPLedger
+from .metrics import Histogram
+from .query import EventFilter, project
+
+STATS_QUANTILES = (0.5, 0.9, 0.99)
+# Below this much input, a process pool costs more than it saves.
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+MAX_AUTO_WORKERS = 8
+
+GroupKey = Tuple[Any, ...]
+
+
+class GroupStats:
+    """Count, sum and a mergeable histogram sketch of one group's values (constant memory)."""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.histogram = Histogram()
+
+    def observe(self, value: Optional[float]) -> None:
+        self.count += 1
+        if value is not None:
+            self.sum += value
+            self.histogram.observe(value)
+
+    def merge(self, other: "GroupStats") -> None:
+        self.count += other.count
+        self.sum += other.sum
+        self.histogram.merge(other.histogram)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "sum": self.sum, "histogram": self.histogram.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GroupStats":
+        stats = cls()
+        stats.count = data["count"]
+        stats.sum = data["sum"]
+        stats.histogram = Histogram.from_dict(data["histogram"])
+        return stats
+
+
+class LedgerStats:
+    """
+    Partial or merged aggregates over the selected ledger events: per-group value statistics
+    plus event counts, time range and inter-arrival times. Partials computed per file (possibly
+    in different processes) combine with merge_partials(), which also adds the gaps between
+    consecutive files. Files whose time ranges overlap (e.g. shards written at the same time)
+    only contribute their own gaps; `interleaved_files` counts them.
+    """
+
+    def __init__(self):
+        self.groups: Dict[GroupKey, GroupStats] = {}
+        self.events = 0
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.inter_arrival_ms = Histogram()
+        self.interleaved_files = 0
+
+    def merge(self, other: "LedgerStats") -> None:
+        for key, group in other.groups.items():
+            self.groups.setdefault(key, GroupStats()).merge(group)
+        self.events += other.events
+        for ts in (other.first_ts, other.last_ts):
+            if ts is not None:
+                self.first_ts = ts if self.first_ts is None else min(self.first_ts, ts)
+                self.last_ts = ts if self.last_ts is None else max(self.last_ts, ts)
+        self.inter_arrival_ms.merge(other.inter_arrival_ms)
+        self.interleaved_files += other.interleaved_files
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Picklable/JSON-able form used to ship partials between processes."""
+        return {
+            "groups": [[list(key), group.to_dict()] for key, group in self.groups.items()],
+            "events": self.events,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "inter_arrival_ms": self.inter_arrival_ms.to_dict(),
+            "interleaved_files": self.interleaved_files,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LedgerStats":
+        stats = cls()
+        stats.groups = {tuple(key): GroupStats.from_dict(group) for key, group in data["groups"]}
+        stats.events = data["events"]
+        stats.first_ts = data["first_ts"]
+        stats.last_ts = data["last_ts"]
+        stats.inter_arrival_ms = Histogram.from_dict(data["inter_arrival_ms"])
+        stats.interleaved_files = data.get("interleaved_files", 0)
+        return stats
+
+
+def merge_partials(partials: Sequence[LedgerStats]) -> LedgerStats:
+    """
+    Merges per-file partials in time order, observing the gap between each file's first event
+    and the latest event of the files before it. A file starting before that event overlaps
+    them, so the gaps across its boundary are unknown and it is counted in interleaved_files.
+    """
+    total = LedgerStats()
+    latest_ts = None
+    for partial in sorted(partials, key=lambda stats: (stats.first_ts is None, stats.first_ts or 0.0)):
+        total.merge(partial)
+        if partial.first_ts is None:
+            continue
+        if latest_ts is not None:
+            if partial.first_ts >= latest_ts:
+                total.inter_arrival_ms.observe((partial.first_ts - latest_ts) * 1000)
+            else:
+                total.interleaved_files += 1
+        latest_ts = partial.last_ts if latest_ts is None else max(latest_ts, partial.last_ts)
+    return total
+
+
+def _group_value(value: Any) -> Any:
+    if value is None:
+        return "unknown"
+    return value if isinstance(value, (str, int, float, bool)) else str(value)
+
+
+def aggregate_file(ledger: AEPLedger, file_path: Path, group_by: Sequence[str], value_field: str,
+                   event_filter: Optional[EventFilter] = None) -> LedgerStats:
+    """One streaming pass over a ledger file; the filter is pushed down into the read."""
+    stats = LedgerStats()
+    prev_ts = None
+    for event in ledger.iter_events(file_path, event_filter=event_filter):
+        stats.events += 1
+        ts = event.get("ts")
+        if isinstance(ts, (int, float)):
+            if prev_ts is not None and ts >= prev_ts:
+                stats.inter_arrival_ms.observe((ts - prev_ts) * 1000)
+            prev_ts = ts
+            stats.first_ts = ts if stats.first_ts is None else min(stats.first_ts, ts)
+            stats.last_ts = ts if stats.last_ts is None else max(stats.last_ts, ts)
+        projected = project(event, list(group_by) + [value_field])
+        key = tuple(_group_value(projected[field]) for field in group_by)
+        value = projected[value_field]
+        stats.groups.setdefault(key, GroupStats()).observe(value if isinstance(value, (int, float)) else None)
+    return stats
+
+
+# Per-worker-process cache, so each worker constructs its reader ledger once.
+_worker_ledgers: Dict[Tuple[str, str], AEPLedger] = {}
+
+
+def _aggregate_file_worker(ledger_base_path: str, ledger_name: str, file_path: str, group_by: Sequence[str],
+                           value_field: str, where: Sequence[str]) -> Dict[str, Any]:
+    key = (ledger_base_path, ledger_name)
+    if key not in _worker_ledgers:
+        _worker_ledgers[key] = AEPLedger(ledger_base_path=ledger_base_path, ledger_name=ledger_name)
+    event_filter = EventFilter.from_where(where) if where else None
+    return aggregate_file(_worker_ledgers[key], Path(file_path), group_by, value_field, event_filter).to_dict()
+
+
+def _auto_workers(files: Sequence[Path]) -> int:
+    total_bytes = sum(path.stat().st_size for path in files if path.exists())
+    if len(files) < 2 or total_bytes < PARALLEL_MIN_BYTES:
+        return 1
+    return max(1, min(len(files), os.cpu_count() or 1, MAX_AUTO_WORKERS))
+
+
+def compute_stats(ledger: AEPLedger, files: Sequence[Path], group_by: Sequence[str] = ("focus_kind",),
+                  value_field: str = "focus_ms", where: Sequence[str] = (), workers: int = 0) -> LedgerStats:
+    """
+    Aggregates `files` in one pass each, in parallel across files when worthwhile.
+
+    Args:
+        group_by: Event fields (dotted paths allowed) to group by.
+        value_field: Numeric field whose distribution is summarized per group.
+        where: --where expressions (see EventFilter.from_where) selecting the events to group.
+        workers: Worker processes; 0 picks automatically, 1 runs in this process.
+    """
+    event_filter = EventFilter.from_where(where) if where else None
+    workers = workers or _auto_workers(files)
+    if workers <= 1:
+        return merge_partials([aggregate_file(ledger, file_path, group_by, value_field, event_filter)
+                               for file_path in files])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_aggregate_file_worker, str(ledger.ledger_base_path), ledger.ledger_name, str(file_path),
+                        list(group_by), value_field, list(where))
+            for file_path in files
+        ]
+        return merge_partials([LedgerStats.from_dict(future.result()) for future in futures])
+
+
+def stats_report(stats: LedgerStats, group_by: Sequence[str], value_field: str) -> Dict[str, Any]:
+    """JSON-ready summary with approximate quantiles per group."""
+    groups = []
+    for key, group in sorted(stats.groups.items(), key=lambda item: tuple(map(str, item[0]))):
+        hist = group.histogram
+        row = {field: value for field, value in zip(group_by, key)}
+        row.update({
+            "count": group.count,
+            "sum": group.sum,
+            "mean": group.sum / hist.count if hist.count else None,
+            "min": hist.min if hist.count else None,
+            "max": hist.max if hist.count else None,
+        })
+        row.update({f"p{int(q * 100)}": hist.quantile(q) for q in STATS_QUANTILES})
+        groups.append(row)
+    throughput = None
+    if stats.first_ts is not None and stats.last_ts > stats.first_ts:
+        span_s = stats.last_ts - stats.first_ts
+        throughput = {
+            "events_per_s": stats.events / span_s,
+            "span_s": span_s,
+            "inter_arrival_ms": {f"p{int(q * 100)}": stats.inter_arrival_ms.quantile(q) for q in STATS_QUANTILES},
+            # Files overlapping others in time; gaps across their boundaries are not in inter_arrival_ms.
+            "interleaved_files": stats.interleaved_files,
+        }
+    return {
+        "events": stats.events,
+        "group_by": list(group_by),
+        "value": value_field,
+        "groups": groups,
+        "throughput": throughput,
+    }
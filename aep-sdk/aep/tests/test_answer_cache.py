@@ -0,0 +1,54 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+
+from backend.answer_cache import SemanticAnswerCache
+
+class TestSemanticAnswerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_answer_cache_"))
+        self.path = self.test_dir / "answers.msgpack"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_01_similar_and_exact_lookups(self):
+        cache = SemanticAnswerCache(self.path)
+        cache.store("what is aep", [1.0, 0.0, 0.0], "fp", "dense answer", "what is aep")
+        cache.store("aep ledger", None, "fp", "lexical answer", "aep ledger")
+        self.assertEqual(cache.lookup([0.99, 0.05, 0.0], "fp"), "dense answer")
+        self.assertIsNone(cache.lookup([0.99, 0.05, 0.0], "other fp"))
+        self.assertIsNone(cache.lookup([0.0, 1.0, 0.0], "fp"))
+        self.assertEqual(cache.lookup(None, "fp", "aep ledger"), "lexical answer")
+        self.assertIsNone(cache.lookup(None, "fp", "aep ledgers"))
+        cache.close()
+
+        reloaded = SemanticAnswerCache(self.path)
+        self.assertEqual(len(reloaded), 2)
+        self.assertEqual(reloaded.lookup(None, "fp", "aep ledger"), "lexical answer")
+        reloaded.close()
+
+    def test_02_workers_sharing_a_file(self):
+        first, second = SemanticAnswerCache(self.path), SemanticAnswerCache(self.path)
+        first.store("q1", [1.0, 0.0], "fp", "answer 1")
+        second.store("q2", [0.0, 1.0], "fp", "answer 2")
+        reloaded = SemanticAnswerCache(self.path)
+        self.assertEqual(reloaded.lookup([1.0, 0.0], "fp"), "answer 1")
+        self.assertEqual(reloaded.lookup([0.0, 1.0], "fp"), "answer 2")
+        reloaded.close()
+
+        # Compaction in one worker replaces the file; the other's later appends must land in the new one.
+        first.max_entries = 2
+        for i in range(4):
+            first.store(f"first {i}", [1.0, float(i)], "fp", f"first answer {i}")
+        second.store("q3", [-1.0, 0.0], "fp", "answer 3")
+        first.close()
+        second.close()
+        reloaded = SemanticAnswerCache(self.path)
+        self.assertEqual(reloaded.lookup([-1.0, 0.0], "fp"), "answer 3")
+        reloaded.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -148,5 +148,102 @@ class TestAEPCallbackHandler(unittest.TestCase):
         self.assertIsNone(handler._current_metadata)
         self.mock_ledger.append.assert_not_called() # No event logged on error
 
+class TestAEPCallbackSpans(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_ledger = MagicMock(spec=AEPLedger)
+        self.handler = AEPCallbackHandler(ledger=self.mock_ledger)
+
+    def _span_events(self):
+        events = [call[0][0] for call in self.mock_ledger.append.call_args_list]
+        return [event for event in events if event.get("event_type") == "span"]
+
+    def test_01_chain_span_has_duration_and_trace(self):
+        root_id, node_id = uuid4(), uuid4()
+        metadata = {"query_id": "q_span"}
+        self.handler.on_chain_start(None, {"question": "q"}, run_id=root_id, metadata=metadata, name="LangGraph")
+        self.handler.on_chain_start(None, {"question": "q"}, run_id=node_id, parent_run_id=root_id, name="retrieve")
+        time.sleep(0.02)
+        self.handler.on_chain_end({"answer": ""}, run_id=node_id, parent_run_id=root_id)
+        self.handler.on_chain_end({"answer": ""}, run_id=root_id)
+
+        spans = self._span_events()
+        self.assertEqual([span["event_source"] for span in spans], ["retrieve", "LangGraph"])
+        node_span = spans[0]
+        self.assertEqual(node_span["trace_id"], "q_span")  # Inherited from the root span
+        self.assertEqual(node_span["parent_run_id"], str(root_id))
+        self.assertEqual(node_span["payload"]["kind"], "chain")
+        self.assertGreaterEqual(node_span["payload"]["duration_ms"], 15)
+        self.assertAlmostEqual(
+            node_span["payload"]["end_ts"] - node_span["payload"]["start_ts"],
+            node_span["payload"]["duration_ms"] / 1000,
+            places=3,
+        )
+        self.assertEqual(self.handler._open_spans, {})
+
+    def test_02_error_closes_span(self):
+        run_id = uuid4()
+        self.handler.on_retriever_start({"name": "faiss"}, "q", run_id=run_id, metadata={"query_id": "q_err"})
+        self.handler.on_retriever_error(Exception("boom"), run_id=run_id)
+        spans = self._span_events()
+        self.assertEqual(len(spans), 1)
+        self.assertEqual(spans[0]["payload"]["status"], "error")
+        self.assertEqual(spans[0]["event_source"], "faiss")
+
+    def test_03_record_span_nests_under_open_parent(self):
+        node_id = uuid4()
+        self.handler.on_chain_start(None, {}, run_id=node_id, metadata={"query_id": "q_embed"}, name="retrieve")
+        now = time.time()
+        self.handler.record_span("embed_query", "embedding", now - 0.05, now, parent_run_id=node_id)
+        span = self._span_events()[0]
+        self.assertEqual(span["trace_id"], "q_embed")
+        self.assertEqual(span["parent_run_id"], str(node_id))
+        self.assertEqual(span["focus_ms"], 50)
+
+    def test_04_record_exec_latency_marks_cache_hit(self):
+        self.handler.record_exec_latency("cached answer", 3, query_id="q_hit", cache_hit=True)
+        self.handler.record_exec_latency("cached answer", 800, query_id="q_llm")
+        hit, generated = [call[0][0] for call in self.mock_ledger.append.call_args_list]
+        self.assertEqual(hit["focus_kind"], "exec_latency")
+        self.assertTrue(hit["cache_hit"])
+        self.assertEqual(hit["query_id"], "q_hit")
+        self.assertEqual(hit["payload"], {"role": "assistant", "content": "cached answer"})
+        self.assertNotIn("cache_hit", generated)
+        self.assertNotEqual(hit["id"], generated["id"])
+
+    def test_05_streamed_llm_call_records_ttft(self):
+        run_id = uuid4()
+        self.handler.on_llm_start({}, [], run_id=run_id, metadata={"query_id": "q_stream"})
+        self.handler._open_spans[run_id]["start_ts"] -= 0.5  # Simulate a call started 500ms ago
+        self.handler.on_llm_new_token("Hello", run_id=run_id)
+        self.handler.on_llm_new_token(" world", run_id=run_id)
+        time.sleep(0.05)
+        self.handler.on_llm_end(LLMResult(generations=[[Generation(text="Hello world")]]), run_id=run_id)
+        event = next(call[0][0] for call in self.mock_ledger.append.call_args_list
+                     if call[0][0]["focus_kind"] == "exec_latency")
+        self.assertEqual(event["query_id"], "q_stream")
+        self.assertGreaterEqual(event["ttft_ms"], 490)
+        self.assertGreaterEqual(event["focus_ms"], event["ttft_ms"] + 40)
+        self.assertEqual(self.handler._first_token_ts, {})
+
+    def test_06_interleaved_streamed_calls_keep_their_own_timing(self):
+        slow_id, fast_id = uuid4(), uuid4()
+        self.handler.on_llm_start({}, [], run_id=slow_id, metadata={"query_id": "q_slow"})
+        self.handler._open_spans[slow_id]["start_ts"] -= 0.5  # Started 500ms ago
+        self.handler.on_llm_start({}, [], run_id=fast_id, metadata={"query_id": "q_fast"})
+        self.handler.on_llm_new_token("a", run_id=fast_id)
+        self.handler.on_llm_new_token("b", run_id=slow_id)
+        time.sleep(0.02)
+        self.handler.on_llm_end(LLMResult(generations=[[Generation(text="fast")]]), run_id=fast_id)
+        self.handler.on_llm_end(LLMResult(generations=[[Generation(text="slow")]]), run_id=slow_id)
+        events = {call[0][0]["query_id"]: call[0][0] for call in self.mock_ledger.append.call_args_list
+                  if call[0][0]["focus_kind"] == "exec_latency"}
+        self.assertEqual(events["q_fast"]["payload"]["content"], "fast")
+        self.assertLess(events["q_fast"]["ttft_ms"], 100)
+        self.assertLess(events["q_fast"]["focus_ms"], 100)
+        self.assertEqual(events["q_slow"]["payload"]["content"], "slow")
+        self.assertGreaterEqual(events["q_slow"]["ttft_ms"], 490)
+        self.assertGreaterEqual(events["q_slow"]["focus_ms"], 510)
+
 if __name__ == '__main__':
     unittest.main()
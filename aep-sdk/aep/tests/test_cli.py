@@ -104,7 +104,87 @@ class TestAepCLI(unittest.TestCase):
         self.assertTrue(all(merged_events_read[i]["ts"] <= merged_events_read[i+1]["ts"] 
                           for i in range(len(merged_events_read)-1)))
 
-    # TODO: Add tests for 'inspect' and 'list' commands
+    def test_trace_waterfall(self):
+        ledger = AEPLedger(ledger_base_path=self.ledger_base, ledger_name="traces")
+        root = {"run_id": "r0", "parent_run_id": None, "name": "LangGraph", "start": 100.0, "end": 101.0}
+        child = {"run_id": "r1", "parent_run_id": "r0", "name": "generate", "start": 100.2, "end": 100.9}
+        other = {"run_id": "r2", "parent_run_id": None, "name": "LangGraph", "start": 200.0, "end": 201.0}
+        for span, trace_id in ((root, "T1"), (child, "T1"), (other, "T2")):
+            ledger.append({
+                "id": span["run_id"], "ts": span["end"], "trace_id": trace_id,
+                "run_id": span["run_id"], "parent_run_id": span["parent_run_id"],
+                "event_type": "span", "focus_kind": "span",
+                "payload": {"name": span["name"], "kind": "chain", "start_ts": span["start"],
+                            "end_ts": span["end"], "duration_ms": (span["end"] - span["start"]) * 1000},
+            })
+
+        result = self._run_cli_cmd([
+            "--ledger-base-path", str(self.ledger_base), "--ledger-name", "traces", "trace", "T1",
+        ])
+        self.assertEqual(result["exit_code"], 0)
+        output = "".join(call[0][0] for call in result["stdout"])
+        self.assertIn("Trace T1: 2 span(s)", output)
+        self.assertIn("  generate", output)  # Child indented under its parent
+
+        missing = self._run_cli_cmd([
+            "--ledger-base-path", str(self.ledger_base), "--ledger-name", "traces", "trace", "nope",
+        ])
+        self.assertEqual(missing["exit_code"], 1)
+
+    def test_stats_focus_histograms(self):
+        ledger = AEPLedger(ledger_base_path=self.ledger_base, ledger_name="statslog")
+        for i in range(10):
+            ledger.append({"id": f"e{i}", "ts": 1000.0 + i, "focus_ms": 100 * (i + 1), "focus_kind": "human_dwell"})
+        ledger.append({"id": "llm", "ts": 1010.0, "focus_ms": 42, "focus_kind": "exec_latency"})
+
+        result = self._run_cli_cmd([
+            "--ledger-base-path", str(self.ledger_base), "--ledger-name", "statslog", "stats",
+        ])
+        self.assertEqual(result["exit_code"], 0)
+        output = "".join(call[0][0] for call in result["stdout"])
+        self.assertIn("11 events", output)
+        self.assertRegex(output, r"human_dwell\s+10\s+550\.0")
+        self.assertRegex(output, r"exec_latency\s+1\s+42\.0")
+        self.assertIn("Throughput: 1.10 events/s", output)
+
+    def test_stats_group_by_where_json(self):
+        ledger = AEPLedger(ledger_base_path=self.ledger_base, ledger_name="statsjson", max_file_size_bytes=150, framed=True)
+        for i in range(20):
+            ledger.append({"id": f"e{i}", "ts": 1000.0 + i, "focus_ms": 10, "focus_kind": "span",
+                           "event_type": "tool" if i % 2 else "llm"})
+
+        result = self._run_cli_cmd([
+            "--ledger-base-path", str(self.ledger_base), "--ledger-name", "statsjson", "stats",
+            "--group-by", "event_type", "--where", "ts>=1010", "--json",
+        ])
+        self.assertEqual(result["exit_code"], 0)
+        report = json.loads("".join(call[0][0] for call in result["stdout"]))
+        self.assertEqual(report["events"], 10)
+        self.assertGreater(report["pruned_segments"], 0)
+        self.assertEqual({row["event_type"]: row["count"] for row in report["groups"]}, {"llm": 5, "tool": 5})
+
+    def test_inspect_where_and_fields(self):
+        ledger = AEPLedger(ledger_base_path=self.ledger_base, ledger_name="wherelog", max_file_size_bytes=150, framed=True)
+        for i in range(20):
+            ledger.append({"id": f"e{i}", "ts": 1000.0 + i, "focus_ms": i * 10,
+                           "focus_kind": "span" if i % 2 else "human_dwell", "payload": {"doc_source": f"d{i}"}})
+
+        result = self._run_cli_cmd([
+            "--ledger-base-path", str(self.ledger_base), "--ledger-name", "wherelog", "inspect",
+            "--where", "focus_kind=span", "--where", "ts>=1015", "--fields", "id,payload.doc_source",
+        ])
+        self.assertEqual(result["exit_code"], 0)
+        output = "".join(call[0][0] for call in result["stdout"])
+        self.assertIn("Pruned", output)
+        projected = [json.loads(line) for line in output.splitlines() if line.startswith("{")]
+        self.assertEqual(projected, [{"id": f"e{i}", "payload.doc_source": f"d{i}"} for i in (15, 17, 19)])
+
+        bad = self._run_cli_cmd([
+            "--ledger-base-path", str(self.ledger_base), "--ledger-name", "wherelog", "inspect", "--where", "color=red",
+        ])
+        self.assertEqual(bad["exit_code"], 2)
+
+    # TODO: Add tests for 'list' command
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,39 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+
+from backend.rag_chain import DocIdMap
+
+class TestDocIdMap(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_doc_ids_"))
+        self.path = self.test_dir / "doc-ids.msgpack"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_01_ids_survive_added_and_removed_documents(self):
+        self.assertEqual(DocIdMap(self.path).assign(["a.md", "b.md", "c.md"]), [0, 1, 2])
+        # A new build: "a.md" removed, "aa.md" added ahead of the others in walk order.
+        self.assertEqual(DocIdMap(self.path).assign(["aa.md", "b.md", "c.md"]), [3, 1, 2])
+        self.assertEqual(DocIdMap(self.path).assign(["a.md", "c.md"]), [0, 2])
+
+    def test_02_processes_sharing_a_file(self):
+        first, second = DocIdMap(self.path), DocIdMap(self.path)
+        self.assertEqual(first.assign(["a.md"]), [0])
+        self.assertEqual(second.assign(["b.md", "a.md"]), [1, 0])
+        self.assertEqual(first.assign(["b.md", "c.md"]), [1, 2])
+
+    def test_03_torn_tail(self):
+        DocIdMap(self.path).assign(["a.md", "b.md"])
+        intact_size = self.path.stat().st_size
+        with open(self.path, "ab") as f:
+            f.write(b"\x82\xa1s\xa4c.m")  # A record cut off mid-write.
+        self.assertEqual(DocIdMap(self.path).assign(["b.md"]), [1])
+        self.assertEqual(self.path.stat().st_size, intact_size)
+        self.assertEqual(DocIdMap(self.path).assign(["c.md", "a.md"]), [2, 0])
+
+if __name__ == '__main__':
+    unittest.main()
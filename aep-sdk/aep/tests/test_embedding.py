@@ -0,0 +1,137 @@
+import unittest
+import tempfile
+import shutil
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from backend.fakes import HashingEmbeddings
+from backend.rag_chain import EMBED_MIN_BATCH_TOKEN_BUDGET, EmbeddingScheduler, _EmbeddingCheckpoint
+
+class FlakyEmbeddings(HashingEmbeddings):
+    """Fails the calls whose (0-based) numbers are in `fail_calls`, or every call from `fail_from` on."""
+
+    def __init__(self, fail_calls=(), fail_from=None):
+        super().__init__(dim=16)
+        self.fail_calls = set(fail_calls)
+        self.fail_from = fail_from
+        self.calls = 0
+        self.embedded_texts = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            call, self.calls = self.calls, self.calls + 1
+        if call in self.fail_calls or (self.fail_from is not None and call >= self.fail_from):
+            raise ConnectionError(f"call {call} failed")
+        with self._lock:
+            self.embedded_texts.extend(texts)
+        return super().embed_documents(texts)
+
+@patch("backend.rag_chain.EMBED_RETRY_BASE_DELAY_S", 0.0)
+class TestEmbeddingScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_aep_embedding_"))
+        self.checkpoint_path = self.test_dir / "embeddings.ckpt"
+        # 40 chars ~ 10 estimated tokens each, so a 40-token budget packs 4 chunks per batch.
+        self.chunks = [(f"chunk {i:03d} " + "x" * 30, {"i": i}) for i in range(40)]
+        self.expected = HashingEmbeddings(dim=16).embed_documents([text for text, _ in self.chunks])
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _scheduler(self, embeddings, **kwargs):
+        kwargs.setdefault("max_concurrency", 1)
+        return EmbeddingScheduler(embeddings, batch_token_budget=40, checkpoint_path=self.checkpoint_path, **kwargs)
+
+    def _embed_all(self, scheduler):
+        chunks, vectors = [], []
+        for batch, batch_vectors in scheduler.embed(self.chunks):
+            chunks.extend(batch)
+            vectors.extend(batch_vectors)
+        return chunks, vectors
+
+    def test_01_failed_batch_is_retried(self):
+        embeddings = FlakyEmbeddings(fail_calls={2, 3})
+        scheduler = self._scheduler(embeddings, max_concurrency=2)
+        chunks, vectors = self._embed_all(scheduler)
+        self.assertEqual(chunks, self.chunks)
+        self.assertEqual(vectors, self.expected)
+        self.assertEqual(embeddings.calls, 10 + 2)
+        self.assertEqual(scheduler.batch_token_budget, 40)  # Halving never raises a budget below the floor.
+        self.assertEqual(sorted(embeddings.embedded_texts), sorted(text for text, _ in self.chunks))
+
+    def test_02_retries_run_out(self):
+        embeddings = FlakyEmbeddings(fail_from=0)
+        with self.assertRaises(ConnectionError):
+            self._embed_all(self._scheduler(embeddings, max_retries=2))
+        self.assertEqual(embeddings.calls % 3, 0)  # Each submitted batch made all three attempts.
+        self.assertTrue(self.checkpoint_path.exists())  # Kept for the next attempt.
+
+    def test_03_budget_halves_on_failure_and_grows_back(self):
+        scheduler = EmbeddingScheduler(HashingEmbeddings(dim=16), batch_token_budget=8_000)
+        scheduler._adapt(False)
+        self.assertEqual(scheduler.batch_token_budget, 4_000)
+        for _ in range(3):
+            scheduler._adapt(False)
+        self.assertEqual(scheduler.batch_token_budget, EMBED_MIN_BATCH_TOKEN_BUDGET)
+        for _ in range(9):
+            scheduler._adapt(True)
+        self.assertEqual(scheduler.batch_token_budget, EMBED_MIN_BATCH_TOKEN_BUDGET)
+        scheduler._adapt(True)
+        self.assertEqual(scheduler.batch_token_budget, 1_500)
+        for _ in range(100):
+            scheduler._adapt(True)
+        self.assertEqual(scheduler.batch_token_budget, 8_000)  # Never beyond the configured budget.
+
+        # A failure resets the run of successes.
+        scheduler._adapt(False)
+        for _ in range(9):
+            scheduler._adapt(True)
+        scheduler._adapt(False)
+        scheduler._adapt(True)
+        self.assertEqual(scheduler.batch_token_budget, 2_000)
+
+    def test_04_resume_reuses_checkpointed_vectors_and_removes_the_file(self):
+        # Batches 0-3 finish; batch 4 fails for good and interrupts the build.
+        interrupted = self._scheduler(FlakyEmbeddings(fail_from=4), max_retries=0)
+        with self.assertRaises(ConnectionError):
+            self._embed_all(interrupted)
+        self.assertTrue(self.checkpoint_path.exists())
+        self.assertEqual(len(_EmbeddingCheckpoint(self.checkpoint_path).vectors), 16)
+
+        embeddings = FlakyEmbeddings()
+        resumed = self._scheduler(embeddings)
+        chunks, vectors = self._embed_all(resumed)
+        self.assertEqual(chunks, self.chunks)
+        np.testing.assert_allclose(vectors, self.expected, rtol=1e-6)  # Checkpointed vectors are float32.
+        self.assertEqual(resumed.reused_chunks, 16)
+        self.assertEqual(resumed.embedded_chunks, 24)
+        self.assertEqual(embeddings.embedded_texts, [text for text, _ in self.chunks[16:]])
+        self.assertFalse(self.checkpoint_path.exists())
+
+    def test_05_torn_checkpoint_tail(self):
+        checkpoint = _EmbeddingCheckpoint(self.checkpoint_path)
+        checkpoint.save([text for text, _ in self.chunks[:4]], self.expected[:4])
+        checkpoint.close(completed=False)
+        intact_size = self.checkpoint_path.stat().st_size
+        with open(self.checkpoint_path, "ab") as f:
+            f.write(b"\x82\xa1k\xd9\x40abc")  # A record cut off mid-write.
+
+        checkpoint = _EmbeddingCheckpoint(self.checkpoint_path)
+        self.assertEqual(len(checkpoint.vectors), 4)
+        self.assertEqual(self.checkpoint_path.stat().st_size, intact_size)
+        # Records appended after the torn one are still read back.
+        checkpoint.save([text for text, _ in self.chunks[4:8]], self.expected[4:8])
+        checkpoint.close(completed=False)
+        checkpoint = _EmbeddingCheckpoint(self.checkpoint_path)
+        self.assertEqual(len(checkpoint.vectors), 8)
+        np.testing.assert_allclose(checkpoint.vectors[_EmbeddingCheckpoint.key(self.chunks[5][0])], self.expected[5], rtol=1e-6)
+        checkpoint.close(completed=True)
+        self.assertFalse(self.checkpoint_path.exists())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import tempfile
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from aep.follow import follow
+from aep.ledger import AEPLedger
+from aep.query import EventFilter
+
+class TestFollow(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_aep_follow_"))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _collect(self, ledger, **kwargs):
+        collected = []
+        stop = threading.Event()
+
+        def _run():
+            for event in follow(ledger, stop_event=stop, idle_timeout_s=1.0, **kwargs):
+                collected.append(event)
+        thread = threading.Thread(target=_run)
+        thread.start()
+        return collected, stop, thread
+
+    def test_01_follows_across_rotations(self):
+        for framed in (False, True):
+            ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name=f"f{int(framed)}",
+                               max_file_size_bytes=300, framed=framed)
+            ledger.append({"id": "before", "focus_kind": "span"})
+            collected, stop, thread = self._collect(ledger)
+            time.sleep(0.1)
+            for i in range(60):
+                ledger.append({"id": f"event_{i}", "focus_kind": "span", "data": "x" * 20})
+                if i % 7 == 0:
+                    time.sleep(0.02)
+            self.assertGreater(len(ledger.segments()), 3)
+            deadline = time.time() + 5
+            while len(collected) < 60 and time.time() < deadline:
+                time.sleep(0.05)
+            stop.set()
+            thread.join(5)
+            self.assertEqual([e["id"] for e in collected], [f"event_{i}" for i in range(60)])
+
+    def test_02_filters_and_from_start(self):
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name="f", shard="a")
+        ledger.append({"id": "1", "event_type": "span", "trace_id": "t1"})
+        ledger.append({"id": "2", "event_type": "chain_start", "query_id": "t1"})
+        ledger.append({"id": "3", "event_type": "span", "trace_id": "t2"})
+        events = list(follow(ledger, event_filter=EventFilter(trace_id="t1"), from_start=True, idle_timeout_s=0.2))
+        self.assertEqual([e["id"] for e in events], ["1", "2"])
+        events = list(follow(ledger, event_filter=EventFilter(event_type="span"), from_start=True,
+                             idle_timeout_s=0.2, use_inotify=False))
+        self.assertEqual([e["id"] for e in events], ["1", "3"])
+
+if __name__ == '__main__':
+    unittest.main()
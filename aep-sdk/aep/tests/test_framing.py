@@ -0,0 +1,37 @@
+import unittest
+import msgpack
+
+from aep.framing import FILE_MAGIC, FrameScanStats, encode_frame, is_framed, iter_frames, last_frame_end
+
+class TestFraming(unittest.TestCase):
+
+    def _file(self, count: int) -> bytes:
+        return FILE_MAGIC + b"".join(encode_frame(msgpack.packb({"id": i})) for i in range(count))
+
+    def _ids(self, data: bytes, stats=None):
+        return [msgpack.unpackb(payload)["id"] for _, payload in iter_frames(data, stats=stats)]
+
+    def test_01_round_trip(self):
+        data = self._file(5)
+        self.assertTrue(is_framed(data))
+        self.assertFalse(is_framed(msgpack.packb({"id": 0})))
+        self.assertEqual(self._ids(data), [0, 1, 2, 3, 4])
+
+    def test_02_resynchronizes_past_corrupt_frame(self):
+        data = bytearray(self._file(5))
+        frame_size = len(encode_frame(msgpack.packb({"id": 0})))
+        data[len(FILE_MAGIC) + frame_size * 2 + 12] ^= 0xFF  # Flip a payload byte of frame 2.
+        stats = FrameScanStats()
+        self.assertEqual(self._ids(bytes(data), stats), [0, 1, 3, 4])
+        self.assertEqual(stats.corrupt_regions, 1)
+        self.assertEqual(stats.skipped_bytes, frame_size)
+
+    def test_03_last_frame_end_ignores_torn_tail(self):
+        data = self._file(3)
+        torn = data + encode_frame(msgpack.packb({"id": 3}))[:-2]
+        self.assertEqual(last_frame_end(data), len(data))
+        self.assertEqual(last_frame_end(torn), len(data))
+        self.assertIsNone(last_frame_end(FILE_MAGIC + b"\xc1\xfa\x05"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import tempfile
+import shutil
+import subprocess
+import sys
+import time
+import gzip
+from pathlib import Path
+
+import msgpack
+
+from aep import framing
+from aep.ledger import AEPLedger
+
+SDK_ROOT = Path(__file__).resolve().parents[2]
+# Modules the CLI and ledger must never load at import time.
+HEAVY_MODULES = ("langchain", "langchain_core", "langsmith", "langgraph", "pandas", "numpy", "pydantic",
+                 "portalocker", "multiprocessing", "concurrent.futures", "ctypes")
+# Budget for `aep --help` / `aep list` on top of a bare interpreter start.
+CLI_BUDGET_S = 0.1
+RUNS = 5
+
+def _run(args):
+    subprocess.run([sys.executable, *args], cwd=SDK_ROOT, check=True, capture_output=True)
+
+def _best_time(args):
+    best = float("inf")
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        _run(args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _snapshot(directory: Path):
+    return {path.name: (path.stat().st_size, path.stat().st_mtime_ns) for path in directory.iterdir()}
+
+class TestImportTime(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_aep_import_"))
+        # A ledger with a manifest, archives and a current file ending in a torn frame.
+        self.ledger_dir = self.test_dir / "ledger"
+        ledger = AEPLedger(ledger_base_path=self.ledger_dir, ledger_name="default", max_file_size_bytes=300, framed=True)
+        for i in range(20):
+            ledger.append({"id": f"event_{i}", "ts": 1000.0 + i, "data": "x" * 20})
+        with open(ledger.current_ledger_file, "ab") as f:
+            f.write(framing.encode_frame(msgpack.packb({"id": "torn"}))[:-3])
+        # A ledger from before manifests: archives and a shard's current file only.
+        self.legacy_dir = self.test_dir / "legacy"
+        self.legacy_dir.mkdir()
+        for name, ts in (("default.aep.20250101T000000Z.msgpack.gz", 1.0), ("default.aep.20250102T000000Z.msgpack.gz", 2.0)):
+            with gzip.open(self.legacy_dir / name, "wb") as f:
+                msgpack.pack({"id": name, "ts": ts}, f)
+        with open(self.legacy_dir / "default.aep.pid42.current", "wb") as f:
+            msgpack.pack({"id": "current", "ts": 3.0}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_01_cli_and_ledger_stay_light(self):
+        code = (
+            "import sys, aep, aep.cli, aep.ledger, aep.reader\n"
+            "aep.AEPLedger\n"
+            f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+            "assert not heavy, heavy\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code], cwd=SDK_ROOT, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_02_callback_is_loaded_lazily(self):
+        code = (
+            "import sys, aep\n"
+            "assert 'aep.callback' not in sys.modules\n"
+            "handler_cls = aep.AEPCallbackHandler\n"
+            "assert handler_cls.__module__ == 'aep.callback'\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code], cwd=SDK_ROOT, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_03_cli_startup_budget(self):
+        _run(["-m", "aep.cli", "--help"])  # Warm the bytecode and file caches.
+        baseline = _best_time(["-c", "pass"])
+        help_time = _best_time(["-m", "aep.cli", "--help"])
+        list_time = _best_time(["-m", "aep.cli", "--ledger-base-path", str(self.ledger_dir), "list"])
+        self.assertLess(help_time - baseline, CLI_BUDGET_S, f"aep --help took {help_time - baseline:.3f}s over startup")
+        self.assertLess(list_time - baseline, CLI_BUDGET_S, f"aep list took {list_time - baseline:.3f}s over startup")
+
+    def test_04_read_only_commands_do_not_lock_or_write(self):
+        missing_dir = self.test_dir / "missing"
+        for directory in (self.ledger_dir, self.legacy_dir, missing_dir):
+            for command in ("list", "inspect"):
+                before = _snapshot(directory) if directory.exists() else None
+                code = (
+                    "import sys\n"
+                    "from aep.cli import main\n"
+                    f"sys.argv = ['aep', '--ledger-base-path', {str(directory)!r}, {command!r}]\n"
+                    "try:\n"
+                    "    main()\n"
+                    "except SystemExit:\n"
+                    "    pass\n"
+                    "assert 'portalocker' not in sys.modules, 'portalocker was imported'\n"
+                )
+                result = subprocess.run([sys.executable, "-c", code], cwd=SDK_ROOT, capture_output=True, text=True)
+                self.assertEqual(result.returncode, 0, f"{command} {directory.name}: {result.stderr}")
+                after = _snapshot(directory) if directory.exists() else None
+                self.assertEqual(after, before, f"{command} {directory.name} changed the directory")
+
+if __name__ == '__main__':
+    unittest.main()
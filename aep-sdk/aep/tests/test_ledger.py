@@ -5,10 +5,25 @@ from pathlib import Path
 import msgpack
 import gzip
 import time
+import gc
+import weakref
 from datetime import datetime, timezone
 
+import multiprocessing
+
+from aep import framing
 from aep.ledger import AEPLedger # Assuming 'aep' is in PYTHONPATH or installed
 
+def _append_worker(ledger_dir, ledger_name, worker_index, count, shard):
+    ledger = AEPLedger(
+        ledger_base_path=ledger_dir,
+        ledger_name=ledger_name,
+        max_file_size_bytes=200,
+        shard=f"w{worker_index}" if shard else None,
+    )
+    for i in range(count):
+        ledger.append({"id": f"w{worker_index}_e{i}", "data": "x" * 20})
+
 class TestAEPLedger(unittest.TestCase):
 
     def setUp(self):
@@ -127,5 +142,95 @@ class TestAEPLedger(unittest.TestCase):
         for f_path in archived_files_only:
             self.assertTrue(f_path.name.endswith(".msgpack.gz"))
 
+    def _run_workers(self, shard: bool, workers: int = 4, count: int = 50):
+        processes = [
+            multiprocessing.Process(target=_append_worker, args=(self.test_dir, self.ledger_name, w, count, shard))
+            for w in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=60)
+            self.assertEqual(process.exitcode, 0)
+        ledger = self._create_ledger()
+        ids = []
+        for file_path in ledger.get_all_ledger_files(include_current=True):
+            ids.extend(event["id"] for event in ledger.read_events(file_path))
+        return ids
+
+    def test_06_concurrent_writers_with_rotation_lose_nothing(self):
+        ids = self._run_workers(shard=False)
+        self.assertEqual(len(ids), 200)
+        self.assertEqual(len(set(ids)), 200)
+        self.assertGreater(len(list(self.test_dir.glob(f"{self.ledger_name}.aep.*.msgpack.gz"))), 1)
+
+    def test_07_sharded_writers_are_merged_by_readers(self):
+        ids = self._run_workers(shard=True)
+        self.assertEqual(len(set(ids)), 200)
+        ledger = self._create_ledger()
+        self.assertEqual(len(ledger.get_current_ledger_files()), 4)
+        sharded = AEPLedger(ledger_base_path=self.test_dir, ledger_name=self.ledger_name, shard="w0")
+        self.assertTrue(sharded.current_ledger_file.name.endswith(".aep.w0.current"))
+
+    def test_08_framed_round_trip_and_rotation(self):
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name=self.ledger_name,
+                           max_file_size_bytes=300, framed=True)
+        for i in range(20):
+            ledger.append({"id": f"event_{i}", "data": "x" * 20})
+        with open(ledger.current_ledger_file, "rb") as f:
+            self.assertTrue(f.read().startswith(framing.FILE_MAGIC))
+        ids = [event["id"] for file_path in ledger.get_all_ledger_files() for event in ledger.read_events(file_path)]
+        self.assertEqual(ids, [f"event_{i}" for i in range(20)])
+
+    def test_09_torn_tail_is_truncated_before_the_first_write(self):
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name=self.ledger_name, framed=True)
+        for i in range(3):
+            ledger.append({"id": f"event_{i}"})
+        good_size = ledger.current_ledger_file.stat().st_size
+        with open(ledger.current_ledger_file, "ab") as f:
+            f.write(framing.encode_frame(msgpack.packb({"id": "torn"}))[:-3])  # Simulated crash mid-write.
+
+        reopened = AEPLedger(ledger_base_path=self.test_dir, ledger_name=self.ledger_name, framed=True)
+        torn_size = reopened.current_ledger_file.stat().st_size
+        self.assertGreater(torn_size, good_size)  # Opening a ledger, e.g. to read it, leaves the file alone.
+        self.assertEqual(reopened.recover(), torn_size - good_size)
+        self.assertEqual(reopened.current_ledger_file.stat().st_size, good_size)
+
+        with open(reopened.current_ledger_file, "ab") as f:
+            f.write(framing.encode_frame(msgpack.packb({"id": "torn"}))[:-3])
+        reopened = AEPLedger(ledger_base_path=self.test_dir, ledger_name=self.ledger_name, framed=True)
+        reopened.append({"id": "event_3"})
+        ids = [event["id"] for event in reopened.read_events(reopened.current_ledger_file)]
+        self.assertEqual(ids, ["event_0", "event_1", "event_2", "event_3"])
+
+    def test_10_legacy_file_keeps_its_format(self):
+        self._create_ledger().append({"id": "legacy"})
+        framed_writer = AEPLedger(ledger_base_path=self.test_dir, ledger_name=self.ledger_name, framed=True)
+        framed_writer.append({"id": "second"})
+        with open(framed_writer.current_ledger_file, "rb") as f:
+            ids = [event["id"] for event in msgpack.Unpacker(f, raw=False)]
+        self.assertEqual(ids, ["legacy", "second"])
+
+    def test_11_batch_durability_buffers_until_flush(self):
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name=self.ledger_name,
+                           framed=True, durability="batch", batch_size=4)
+        for i in range(6):
+            ledger.append({"id": f"event_{i}"})
+        self.assertEqual(len(ledger.read_events(ledger.current_ledger_file)), 4)
+        ledger.close()
+        self.assertEqual(len(ledger.read_events(ledger.current_ledger_file)), 6)
+        with self.assertRaises(ValueError):
+            AEPLedger(ledger_base_path=self.test_dir, ledger_name=self.ledger_name, durability="sometimes")
+
+    def test_12_batch_ledgers_are_not_kept_alive(self):
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name=self.ledger_name,
+                           durability="batch", batch_size=4)
+        ledger.append({"id": "event_0"})
+        current_ledger_file, ref = ledger.current_ledger_file, weakref.ref(ledger)
+        del ledger
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertEqual(len(self._create_ledger().read_events(current_ledger_file)), 1)  # Flushed when dropped.
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,67 @@
+import math
+import unittest
+
+from backend.fakes import HashingEmbeddings
+from backend.lexical import BM25_K1, BM25Index, tokenize
+from backend.rag_chain import (LEXICAL_FAST_PATH_MARGIN, LEXICAL_FAST_PATH_MIN_SCORE, RRF_K, VectorIndexConfig,
+                               _lexical_confident, _VectorStoreBuilder, reciprocal_rank_fusion)
+
+class TestBM25Index(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add(["apple banana", "apple apple cherry", "durian"])
+
+    def test_01_tokenize_drops_stopwords(self):
+        self.assertEqual(tokenize("How do I use the FAISS index?"), ["faiss", "index"])
+
+    def test_02_scores_and_ranking(self):
+        idf = math.log(1.0 + (3 - 2 + 0.5) / (2 + 0.5))
+        self.assertAlmostEqual(self.index.idf("apple"), idf)
+        hits = self.index.search("apple", 10)
+        self.assertEqual([chunk_id for chunk_id, _ in hits], [1, 0])  # Chunk 2 matches no term.
+        # Average length 2: chunk 0 (tf 1, length 2) and chunk 1 (tf 2, length 3).
+        self.assertAlmostEqual(hits[1][1], idf * 1 * (BM25_K1 + 1) / (1 + BM25_K1 * (0.25 + 0.75 * 2 / 2)))
+        self.assertAlmostEqual(hits[0][1], idf * 2 * (BM25_K1 + 1) / (2 + BM25_K1 * (0.25 + 0.75 * 3 / 2)))
+        self.assertEqual(self.index.search("apple", 1), hits[:1])
+        self.assertEqual(self.index.search("the kiwi", 10), [])
+        self.assertAlmostEqual(self.index.max_score("apple durian kiwi"),
+                               (self.index.idf("apple") + self.index.idf("durian")) * (BM25_K1 + 1))
+
+    def test_03_chunk_ids_match_the_vector_store(self):
+        texts = [f"document {i} mentions term{i} and shared words" for i in range(50)]
+        embeddings = HashingEmbeddings(dim=64)
+        builder = _VectorStoreBuilder(embeddings, VectorIndexConfig())
+        for offset in range(0, len(texts), 8):
+            batch = [(text, {}) for text in texts[offset:offset + 8]]
+            builder.add(batch, embeddings.embed_documents([text for text, _ in batch]))
+        store = builder.finish()
+        for i in (0, 9, 49):
+            (chunk_id, _), = builder.lexical_index.search(f"term{i}", 1)
+            self.assertEqual(store.docstore.search(store.index_to_docstore_id[chunk_id]).page_content, texts[i])
+
+class TestHybridRanking(unittest.TestCase):
+
+    def test_01_reciprocal_rank_fusion(self):
+        dense = [(1, 0.1), (2, 0.2), (3, 0.3)]
+        lexical = [(3, 9.0), (4, 8.0), (1, 7.0)]
+        fused = reciprocal_rank_fusion([dense, lexical], 10)
+        # 1: ranks 1 and 3; 3: ranks 3 and 1 (a tie, kept in first-seen order); 2 and 4: rank 2 once.
+        self.assertEqual([chunk_id for chunk_id, _ in fused], [1, 3, 2, 4])
+        self.assertAlmostEqual(fused[0][1], 1 / (RRF_K + 1) + 1 / (RRF_K + 3))
+        self.assertAlmostEqual(fused[2][1], 1 / (RRF_K + 2))
+        self.assertEqual(reciprocal_rank_fusion([dense, lexical], 2), fused[:2])
+
+    def test_02_lexical_fast_path_threshold_and_margin(self):
+        index = BM25Index()
+        index.add(["alpha beta", "gamma", "delta"])
+        max_score = index.max_score("alpha beta")
+        strong = LEXICAL_FAST_PATH_MIN_SCORE * max_score
+        self.assertTrue(_lexical_confident(index, "alpha beta", [(0, strong)]))
+        self.assertFalse(_lexical_confident(index, "alpha beta", [(0, strong * 0.99)]))
+        self.assertTrue(_lexical_confident(index, "alpha beta", [(0, strong), (1, strong / LEXICAL_FAST_PATH_MARGIN)]))
+        self.assertFalse(_lexical_confident(index, "alpha beta", [(0, strong), (1, strong / LEXICAL_FAST_PATH_MARGIN * 1.01)]))
+        self.assertFalse(_lexical_confident(index, "alpha beta", []))
+
+if __name__ == '__main__':
+    unittest.main()
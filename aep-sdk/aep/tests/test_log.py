@@ -0,0 +1,92 @@
+import unittest
+import io
+import json
+import logging
+import queue
+
+from aep.log import (
+    configure_logging, shutdown_logging, get_logger,
+    RateLimitFilter, StructuredFormatter, NonBlockingQueueHandler,
+)
+
+class _CountingArg:
+    """Counts how often it is formatted into a log message."""
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return "formatted"
+
+class TestAEPLog(unittest.TestCase):
+
+    def tearDown(self):
+        shutdown_logging()
+
+    def _record(self, msg="message", lineno=10, **extra):
+        record = logging.LogRecord("aep.test", logging.INFO, "/src/module.py", lineno, msg, (), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_01_rate_limit_per_call_site(self):
+        rate_filter = RateLimitFilter(interval_s=60, burst=3)
+        allowed = [rate_filter.filter(self._record()) for _ in range(10)]
+        self.assertEqual(allowed.count(True), 3)
+        # A different call site has its own budget.
+        self.assertTrue(rate_filter.filter(self._record(lineno=11)))
+
+    def test_02_suppressed_count_reported_after_window(self):
+        rate_filter = RateLimitFilter(interval_s=0.0, burst=1)
+        self.assertTrue(rate_filter.filter(self._record()))
+        rate_filter.interval_s = 60
+        self.assertFalse(rate_filter.filter(self._record()))
+        self.assertFalse(rate_filter.filter(self._record()))
+        rate_filter.interval_s = 0.0
+        record = self._record()
+        self.assertTrue(rate_filter.filter(record))
+        self.assertEqual(record.suppressed, 2)
+
+    def test_03_structured_formatter_includes_extra_fields(self):
+        line = StructuredFormatter().format(self._record(msg="hello", query_id="q1"))
+        entry = json.loads(line)
+        self.assertEqual(entry["msg"], "hello")
+        self.assertEqual(entry["query_id"], "q1")
+        self.assertEqual(entry["level"], "INFO")
+
+    def test_04_queue_handler_drops_instead_of_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        handler.handle(self._record())
+        handler.handle(self._record())
+        self.assertEqual(handler.dropped, 1)
+
+    def test_05_disabled_level_does_not_format(self):
+        stream = io.StringIO()
+        configure_logging(level="INFO", log_format="json", stream=stream)
+        arg = _CountingArg()
+        logger = get_logger("aep.test_log")
+        logger.debug("value=%s", arg)
+        logger.info("value=%s", arg, extra={"query_id": "q2"})
+        shutdown_logging()
+        self.assertEqual(arg.calls, 1)  # Only the INFO record is formatted, by the writer thread.
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["msg"], "value=formatted")
+        self.assertEqual(entries[0]["query_id"], "q2")
+
+    def test_06_shutdown_restores_the_loggers(self):
+        root_stream = io.StringIO()
+        root_handler = logging.StreamHandler(root_stream)
+        logging.getLogger().addHandler(root_handler)
+        try:
+            configure_logging(level="INFO", stream=io.StringIO())
+            shutdown_logging()
+            aep_logger = logging.getLogger("aep")
+            self.assertEqual(aep_logger.handlers, [])
+            self.assertTrue(aep_logger.propagate)
+            get_logger("aep.ledger").warning("after shutdown")
+        finally:
+            logging.getLogger().removeHandler(root_handler)
+        self.assertIn("after shutdown", root_stream.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
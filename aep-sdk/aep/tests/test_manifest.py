@@ -0,0 +1,76 @@
+import unittest
+import tempfile
+import shutil
+import gzip
+from pathlib import Path
+
+import msgpack
+
+from aep import manifest as manifest_module
+from aep.ledger import AEPLedger
+from aep.manifest import LedgerManifest
+
+class TestLedgerManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_aep_manifest_"))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_01_rotation_records_segments_in_seq_order(self):
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name="m", max_file_size_bytes=200)
+        for i in range(30):
+            ledger.append({"id": str(i), "ts": 1000.0 + i, "data": "x" * 30})
+        segments = ledger.segments()
+        self.assertGreater(len(segments), 2)
+        self.assertEqual([s["seq"] for s in segments], list(range(1, len(segments) + 1)))
+        self.assertEqual(segments[0]["file"], "m.aep.0000000001.msgpack.gz")
+        self.assertEqual(segments[0]["min_ts"], 1000.0)
+        self.assertEqual(sum(s["events"] for s in segments) + len(ledger.read_events(ledger.current_ledger_file)), 30)
+        # A second instance (e.g. another process) sees the same segments.
+        other = LedgerManifest(self.test_dir, "m")
+        self.assertEqual(other.segments(), segments)
+
+    def test_02_bootstrap_from_existing_archives(self):
+        for name, ts in (("m.aep.20250101T000000Z.msgpack.gz", 1.0), ("m.aep.20250102T000000Z.msgpack.gz", 2.0)):
+            with gzip.open(self.test_dir / name, "wb") as f:
+                msgpack.pack({"id": name, "ts": ts}, f)
+        (self.test_dir / "m.aep.pid42.current").touch()
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name="m")
+        files = [p.name for p in ledger.get_all_ledger_files()]
+        self.assertEqual(files, ["m.aep.20250101T000000Z.msgpack.gz", "m.aep.20250102T000000Z.msgpack.gz",
+                                 "m.aep.pid42.current"])
+        self.assertEqual(ledger.segments()[1]["max_ts"], 2.0)
+        self.assertFalse(ledger.manifest.path.exists())  # Reading scans the directory; only writers bootstrap.
+
+        writer = AEPLedger(ledger_base_path=self.test_dir, ledger_name="m", max_file_size_bytes=1)
+        writer.append({"id": "a", "ts": 3.0})
+        writer.append({"id": "b", "ts": 4.0})  # Rotates, bootstrapping the manifest first.
+        self.assertEqual([s["file"] for s in ledger.segments()],
+                         ["m.aep.20250101T000000Z.msgpack.gz", "m.aep.20250102T000000Z.msgpack.gz",
+                          "m.aep.0000000003.msgpack.gz"])
+        self.assertEqual(ledger.manifest.shards(), ["pid42"])
+
+    def test_03_checkpoint_keeps_state(self):
+        manifest = LedgerManifest(self.test_dir, "m")
+        for seq in range(1, 6):
+            manifest.commit(add=[{"seq": seq, "file": f"f{seq}", "bytes": 1, "events": 1,
+                                  "min_ts": None, "max_ts": None, "created": 0}])
+        manifest.commit(remove=["f2"], shards=["a"])
+        reader = LedgerManifest(self.test_dir, "m")
+        before = reader.segments()
+        original_threshold = manifest_module.CHECKPOINT_AFTER_RECORDS
+        manifest_module.CHECKPOINT_AFTER_RECORDS = 3
+        try:
+            self.assertTrue(manifest.checkpoint())
+        finally:
+            manifest_module.CHECKPOINT_AFTER_RECORDS = original_threshold
+        self.assertEqual(len(manifest.path.read_text().splitlines()), 1)
+        self.assertEqual(reader.segments(), before)
+        self.assertEqual([s["file"] for s in before], ["f1", "f3", "f4", "f5"])
+        self.assertEqual(reader.shards(), ["a"])
+        self.assertEqual(reader.next_seq(), 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import random
+
+from aep.metrics import Histogram, MetricsRegistry
+
+class TestHistogram(unittest.TestCase):
+
+    def test_01_quantiles_within_bucket_error(self):
+        hist = Histogram()
+        values = [random.uniform(1, 1000) for _ in range(5000)]
+        for value in values:
+            hist.observe(value)
+        values.sort()
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * len(values)) - 1]
+            self.assertAlmostEqual(hist.quantile(q) / exact, 1.0, delta=0.1)
+        self.assertEqual(hist.count, 5000)
+        self.assertEqual(hist.max, values[-1])
+
+    def test_02_empty_and_zero_values(self):
+        hist = Histogram()
+        self.assertIsNone(hist.quantile(0.5))
+        hist.observe(0)
+        self.assertEqual(hist.quantile(0.5), 0)
+
+    def test_03_merge_and_round_trip(self):
+        a, b = Histogram(), Histogram()
+        for value in range(1, 101):
+            a.observe(value)
+        for value in range(101, 201):
+            b.observe(value)
+        a.merge(b)
+        self.assertEqual(a.count, 200)
+        self.assertEqual(a.min, 1)
+        self.assertEqual(a.max, 200)
+        restored = Histogram.from_dict(a.to_dict())
+        self.assertEqual(restored.count, a.count)
+        self.assertEqual(restored.quantile(0.5), a.quantile(0.5))
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_01_prometheus_text(self):
+        registry = MetricsRegistry()
+        hist = registry.histogram("req_seconds", "Request latency.", path="/collect")
+        self.assertIs(registry.histogram("req_seconds", path="/collect"), hist)
+        hist.observe(0.002)
+        hist.observe(0.5)
+        registry.gauge("queue_depth", "Queued items.", fn=lambda: 3)
+        dropped = registry.counter("dropped_total", "Dropped items.")
+        dropped.inc()
+        dropped.inc(2)
+        with self.assertRaises(ValueError):
+            dropped.inc(-1)
+
+        text = registry.render_prometheus()
+        self.assertIn("# TYPE req_seconds histogram", text)
+        self.assertIn('req_seconds_bucket{path="/collect",le="+Inf"} 2', text)
+        self.assertIn('req_seconds_count{path="/collect"} 2', text)
+        self.assertIn("queue_depth 3.0", text)
+        self.assertIn("# TYPE queue_depth gauge", text)
+        self.assertIn("# TYPE dropped_total counter", text)
+        self.assertIn("dropped_total 3.0", text)
+        # Cumulative bucket counts never decrease.
+        counts = [int(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith("req_seconds_bucket")]
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(counts[-1], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+from unittest.mock import patch
+
+from aep.ledger import AEPLedger
+from aep.query import EventFilter, project
+
+class TestEventFilter(unittest.TestCase):
+
+    def test_01_from_where(self):
+        event_filter = EventFilter.from_where(["focus_kind=span", "ts>=2025-01-01T00:00:00Z", "focus_ms<100"])
+        self.assertEqual(event_filter.focus_kind, "span")
+        self.assertTrue(event_filter.matches({"focus_kind": "span", "ts": 1.8e9, "focus_ms": 5}))
+        self.assertFalse(event_filter.matches({"focus_kind": "span", "ts": 1.7e9, "focus_ms": 5}))
+        self.assertFalse(event_filter.matches({"focus_kind": "span", "ts": 1.8e9}))
+        for bad in ("color=red", "focus_kind>span", "nonsense"):
+            with self.assertRaises(ValueError):
+                EventFilter.from_where([bad])
+
+    def test_02_segment_pruning(self):
+        event_filter = EventFilter.from_where(["ts>=100", "ts<200"])
+        self.assertTrue(event_filter.may_match_segment({"min_ts": 150, "max_ts": 300}))
+        self.assertFalse(event_filter.may_match_segment({"min_ts": 10, "max_ts": 99}))
+        self.assertFalse(event_filter.may_match_segment({"min_ts": 200, "max_ts": 300}))
+        self.assertTrue(event_filter.may_match_segment({"min_ts": None, "max_ts": None}))
+
+    def test_03_project(self):
+        event = {"id": "a", "payload": {"doc_source": "x.md"}}
+        self.assertEqual(project(event, ["id", "payload.doc_source", "missing.deep"]),
+                         {"id": "a", "payload.doc_source": "x.md", "missing.deep": None})
+
+class TestFilteredReads(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_aep_query_"))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_01_framed_reads_skip_decoding_non_matching_events(self):
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name="q", framed=True)
+        for i in range(50):
+            ledger.append({"id": str(i), "trace_id": "wanted" if i == 7 else f"t{i}"})
+        with patch("aep.reader.msgpack.unpackb", wraps=__import__("msgpack").unpackb) as unpackb:
+            events = list(ledger.iter_events(ledger.current_ledger_file, EventFilter(trace_id="wanted")))
+        self.assertEqual([e["id"] for e in events], ["7"])
+        self.assertEqual(unpackb.call_count, 1)
+
+    def test_02_legacy_reads_still_filter(self):
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name="q")
+        for i in range(10):
+            ledger.append({"id": str(i), "focus_kind": "span" if i < 3 else "other"})
+        events = list(ledger.iter_events(ledger.current_ledger_file, EventFilter(focus_kind="span")))
+        self.assertEqual([e["id"] for e in events], ["0", "1", "2"])
+
+if __name__ == '__main__':
+    unittest.main()
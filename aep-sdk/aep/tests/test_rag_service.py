@@ -0,0 +1,65 @@
+import os
+import unittest
+import tempfile
+import shutil
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+from backend.fakes import HashingEmbeddings
+from backend.rag_chain import RAGService
+
+class BlockingEmbeddings(HashingEmbeddings):
+    """Blocks embed_documents on `release` once `block` is set."""
+
+    def __init__(self):
+        super().__init__(dim=64)
+        self.block = threading.Event()
+        self.blocked = threading.Event()
+        self.release = threading.Event()
+
+    def embed_documents(self, texts):
+        if self.block.is_set():
+            self.blocked.set()
+            self.release.wait(timeout=10)
+        return super().embed_documents(texts)
+
+class TestRAGService(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_rag_service_"))
+        docs_dir = self.test_dir / "docs"
+        docs_dir.mkdir()
+        for name in ("a", "b", "c"):
+            (docs_dir / f"{name}.md").write_text(f"# {name}\n\nAbout topic {name}.")
+        env = {name: str(self.test_dir / name) for name in
+               ("AEP_EMBED_CHECKPOINT_DIR", "AEP_VECTOR_STORE_DIR", "AEP_DOC_ID_DIR", "AEP_ANSWER_CACHE_DIR")}
+        self.env = patch.dict(os.environ, env)
+        self.env.start()
+        self.service = RAGService(docs_path=docs_dir, backend="stub", index_workers=1)
+        self.service._embeddings = BlockingEmbeddings()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_01_queries_are_served_during_a_rebuild(self):
+        embeddings = self.service._embeddings
+        first = self.service.vector_store
+        embeddings.block.set()
+        rebuild = threading.Thread(target=self.service.load_and_index_docs, kwargs={"force_reindex": True})
+        rebuild.start()
+        try:
+            self.assertTrue(embeddings.blocked.wait(timeout=10))
+            # The rebuild is stuck embedding; the current index and other components stay available.
+            self.assertIs(self.service.vector_store, first)
+            self.assertEqual(self.service.doc_sources, ["a.md", "b.md", "c.md"])
+            self.service.llm
+        finally:
+            embeddings.release.set()
+            rebuild.join(timeout=10)
+        self.assertIsNot(self.service.vector_store, first)
+        self.assertEqual(self.service._index_version, 2)
+
+if __name__ == '__main__':
+    unittest.main()
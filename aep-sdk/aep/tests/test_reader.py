@@ -0,0 +1,62 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+
+import msgpack
+
+from aep import framing
+from aep.ledger import AEPLedger
+from aep.reader import SegmentReader
+
+class TestSegmentReader(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_aep_reader_"))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _ledger(self, framed: bool) -> AEPLedger:
+        ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name=f"r{int(framed)}", framed=framed)
+        for i in range(10):
+            ledger.append({"id": f"event_{i}", "ts": float(i)})
+        return ledger
+
+    def test_01_offsets_and_random_access(self):
+        for framed in (True, False):
+            ledger = self._ledger(framed)
+            with SegmentReader(ledger.current_ledger_file) as reader:
+                self.assertEqual(reader.framed, framed)
+                offsets = reader.offsets()
+                self.assertEqual(len(offsets), 10)
+                self.assertEqual(reader.event_at(offsets[7])["id"], "event_7")
+                self.assertEqual(reader.end_offset, reader.size)
+                resumed = [event["id"] for _, event in reader.iter_events(start=offsets[8])]
+                self.assertEqual(resumed, ["event_8", "event_9"])
+
+    def test_02_partial_tail_is_not_yielded(self):
+        ledger = self._ledger(True)
+        complete_size = ledger.current_ledger_file.stat().st_size
+        with open(ledger.current_ledger_file, "ab") as f:
+            f.write(framing.encode_frame(msgpack.packb({"id": "in_flight"}))[:-4])
+        with SegmentReader(ledger.current_ledger_file) as reader:
+            ids = [event["id"] for _, event in reader.iter_events()]
+            self.assertEqual(len(ids), 10)
+            self.assertEqual(reader.end_offset, complete_size)
+            self.assertEqual(reader.stats.corrupt_regions, 0)
+
+    def test_03_close_after_partial_iteration_and_empty_file(self):
+        ledger = self._ledger(True)
+        reader = SegmentReader(ledger.current_ledger_file)
+        events = reader.iter_events()
+        next(events)
+        events.close()
+        reader.close()  # Must not raise BufferError from a live memoryview.
+        empty = self.test_dir / "empty.aep.current"
+        empty.touch()
+        with SegmentReader(empty) as reader:
+            self.assertEqual(list(reader.iter_events()), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import gzip
+import unittest
+import tempfile
+import shutil
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from aep import framing
+from aep.callback import AEPCallbackHandler
+from aep.ledger import AEPLedger
+from aep.retention import RetentionPolicy, apply_retention, compact, run_maintenance
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_aep_retention_"))
+        self.ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name="ret", max_file_size_bytes=200)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _fill(self, count: int, event_type: str = "span", ts: float = None):
+        for i in range(count):
+            self.ledger.append({"id": f"{event_type}_{i}", "event_type": event_type,
+                                "ts": ts if ts is not None else time.time(), "data": "x" * 40})
+        return self.ledger.get_all_ledger_files(include_current=False)
+
+    def test_01_count_size_and_age_limits(self):
+        archives = self._fill(30)
+        self.assertGreater(len(archives), 4)
+        dropped = apply_retention(self.ledger, RetentionPolicy(max_segments=2))
+        self.assertEqual(dropped, archives[:-2])
+        self.assertEqual(self.ledger.get_all_ledger_files(include_current=False), archives[-2:])
+
+        self.assertEqual(apply_retention(self.ledger, RetentionPolicy(max_total_bytes=0), dry_run=True), archives[-2:])
+        self.assertTrue(archives[-1].exists())
+        self.assertEqual(apply_retention(self.ledger, RetentionPolicy(max_age_s=3600)), [])
+        self.assertEqual(apply_retention(self.ledger, RetentionPolicy(max_age_s=3600), now=time.time() + 7200), archives[-2:])
+        self.assertEqual(self.ledger.get_all_ledger_files(include_current=False), [])
+        self.assertFalse(archives[-1].exists())
+
+    def test_02_cold_dir_keeps_dropped_segments(self):
+        archives = self._fill(20)
+        cold_dir = self.test_dir / "cold"
+        apply_retention(self.ledger, RetentionPolicy(max_segments=1, cold_dir=cold_dir))
+        self.assertEqual(sorted(p.name for p in cold_dir.iterdir()), [p.name for p in archives[:-1]])
+
+    def test_03_compaction_keeps_every_event(self):
+        archives = self._fill(30)
+        before = [e["id"] for p in self.ledger.get_all_ledger_files() for e in self.ledger.read_events(p)]
+        written = compact(self.ledger, RetentionPolicy(compact=True, compact_min_segments=2))
+        self.assertEqual(len(written), 1)
+        self.assertEqual(self.ledger.get_all_ledger_files(include_current=False), written)
+        after = [e["id"] for p in self.ledger.get_all_ledger_files() for e in self.ledger.read_events(p)]
+        self.assertEqual(sorted(after), sorted(before))
+        self.assertTrue(all(not p.exists() for p in archives if p != written[0]))
+
+    def _trace(self, handler: AEPCallbackHandler, query_id: str, fail: bool = False) -> None:
+        """One graph run as LangChain reports it: metadata reaches every run, but only spans carry query_id."""
+        root_id, node_id = uuid4(), uuid4()
+        metadata = {"query_id": query_id}
+        handler.on_chain_start({"name": "LangGraph"}, {"question": query_id}, run_id=root_id, metadata=metadata)
+        handler.on_chain_start({"name": "retrieve"}, {"question": query_id}, run_id=node_id,
+                               parent_run_id=root_id, metadata=metadata)
+        handler.on_chain_end({"context": []}, run_id=node_id, parent_run_id=root_id)
+        if fail:
+            handler.on_chain_error(ValueError("boom"), run_id=root_id)
+        else:
+            handler.on_chain_end({"answer": query_id}, run_id=root_id)
+
+    def test_04_downsampling_keeps_or_drops_whole_traces(self):
+        handler = AEPCallbackHandler(ledger=self.ledger)
+        for i in range(40):
+            self._trace(handler, f"q{i}", fail=i % 8 == 0)
+        self._fill(5, event_type="padding")  # Rotates the last trace out of the current file.
+        chain_types = ("chain_start", "chain_output")
+        by_trace = {}
+        for p in self.ledger.get_all_ledger_files():
+            for e in self.ledger.read_events(p):
+                if e["event_type"] in chain_types:
+                    self.assertNotIn("query_id", e)
+                    by_trace.setdefault(e["trace_id"], set()).add(e["id"])
+        self.assertEqual(len(by_trace), 40)
+
+        policy = RetentionPolicy(compact=True, compact_min_segments=2, downsample_after_s=3600, downsample_keep_every=4)
+        run_maintenance(self.ledger, policy, now=time.time() + 7200)
+        events = [e for p in self.ledger.get_all_ledger_files() for e in self.ledger.read_events(p)]
+        kept_chain = [e for e in events if e["event_type"] in chain_types]
+        self.assertTrue(0 < len({e["trace_id"] for e in kept_chain}) < 40)
+        self.assertTrue(all(e["sample_weight"] == 4 for e in kept_chain))
+        for trace_id, ids in by_trace.items():
+            kept_ids = {e["id"] for e in kept_chain if e["trace_id"] == trace_id}
+            self.assertIn(kept_ids, (set(), ids), trace_id)
+        # chain_error and span events are never downsampled.
+        self.assertEqual(len([e for e in events if e["event_type"] == "chain_error"]), 5)
+        self.assertEqual(len([e for e in events if e["event_type"] == "span"]), 80)
+
+    def _rewrite_archive(self, path: Path, transform) -> None:
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+        with gzip.open(path, "wb") as f:
+            f.write(transform(data))
+
+    def test_05_compaction_skips_runs_with_damaged_segments(self):
+        self.ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name="framed", max_file_size_bytes=200, framed=True)
+        archives = self._fill(30)
+        before, original = self.ledger.segments(), archives[1].read_bytes()
+        # A flipped byte inside the first frame: it fails its checksum and would be skipped.
+        self._rewrite_archive(archives[1], lambda data: data[:30] + bytes([data[30] ^ 0xFF]) + data[31:])
+        policy = RetentionPolicy(compact=True, compact_min_segments=2)
+        self.assertEqual(compact(self.ledger, policy), [])
+        self.assertEqual(self.ledger.segments(), before)
+        self.assertTrue(all(p.exists() for p in archives))
+
+        # A clean cut after the first frame reads fine but holds fewer events than the manifest says.
+        archives[1].write_bytes(original)
+        first_frame_end = len(framing.FILE_MAGIC) + framing.FRAME_HEADER_SIZE
+        self._rewrite_archive(archives[1], lambda data: data[:first_frame_end + int.from_bytes(
+            data[first_frame_end - 8:first_frame_end - 4], "little")])
+        self.assertEqual(compact(self.ledger, policy), [])
+        self.assertTrue(all(p.exists() for p in archives))
+        self.assertEqual(len(self.ledger.read_events(archives[1])), 1)
+
+    def test_06_compaction_skips_runs_with_truncated_legacy_segments(self):
+        archives = self._fill(30)
+        self._rewrite_archive(archives[2], lambda data: data[:-5])
+        self.assertEqual(compact(self.ledger, RetentionPolicy(compact=True, compact_min_segments=2)), [])
+        self.assertTrue(all(p.exists() for p in archives))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+
+from aep.ledger import AEPLedger
+from aep.stats import LedgerStats, aggregate_file, compute_stats, merge_partials, stats_report
+
+class TestLedgerStats(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_aep_stats_"))
+        self.ledger = AEPLedger(ledger_base_path=self.test_dir, ledger_name="stats", max_file_size_bytes=400, framed=True)
+        for i in range(60):
+            self.ledger.append({"id": f"e{i}", "ts": 1000.0 + i, "focus_ms": i + 1,
+                                "focus_kind": "span" if i % 3 else "human_dwell", "payload": {"node": f"n{i % 2}"}})
+        self.files = self.ledger.get_all_ledger_files(include_current=True)
+        self.assertGreater(len(self.files), 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_01_merged_partials_match_single_pass(self):
+        stats = compute_stats(self.ledger, self.files, workers=1)
+        report = stats_report(stats, ["focus_kind"], "focus_ms")
+        self.assertEqual(report["events"], 60)
+        groups = {row["focus_kind"]: row for row in report["groups"]}
+        self.assertEqual(groups["human_dwell"]["count"], 20)
+        self.assertEqual(groups["span"]["count"], 40)
+        self.assertEqual(groups["span"]["sum"] + groups["human_dwell"]["sum"], sum(range(1, 61)))
+        self.assertEqual(report["throughput"]["span_s"], 59.0)
+
+        # Partials survive the to_dict/from_dict round trip used between processes.
+        merged = merge_partials([
+            LedgerStats.from_dict(aggregate_file(self.ledger, file_path, ["focus_kind"], "focus_ms").to_dict())
+            for file_path in reversed(self.files)
+        ])
+        self.assertEqual(stats_report(merged, ["focus_kind"], "focus_ms"), report)
+
+    def test_02_parallel_matches_serial_with_filter_and_nested_group(self):
+        kwargs = dict(group_by=["focus_kind", "payload.node"], where=["ts>=1030"])
+        serial = stats_report(compute_stats(self.ledger, self.files, workers=1, **kwargs), kwargs["group_by"], "focus_ms")
+        parallel = stats_report(compute_stats(self.ledger, self.files, workers=2, **kwargs), kwargs["group_by"], "focus_ms")
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial["events"], 30)
+        self.assertEqual({(row["focus_kind"], row["payload.node"]) for row in serial["groups"]},
+                         {("human_dwell", "n0"), ("human_dwell", "n1"), ("span", "n0"), ("span", "n1")})
+
+    def test_03_inter_arrival_spans_file_boundaries(self):
+        stats = compute_stats(self.ledger, self.files, workers=1)
+        self.assertEqual(stats.inter_arrival_ms.count, 59)  # Every gap, including those between files.
+        self.assertEqual(stats.inter_arrival_ms.max, 1000.0)
+        self.assertEqual(stats.interleaved_files, 0)
+
+        # Two shards written at the same time overlap; only their own gaps are known.
+        shard_dir = self.test_dir / "shards"
+        for shard in ("a", "b"):
+            shard_ledger = AEPLedger(ledger_base_path=shard_dir, ledger_name="stats", shard=shard)
+            for i in range(10):
+                shard_ledger.append({"id": f"{shard}{i}", "ts": 2000.0 + 2 * i + (shard == "b"), "focus_kind": "span"})
+        reader = AEPLedger(ledger_base_path=shard_dir, ledger_name="stats")
+        report = stats_report(compute_stats(reader, reader.get_all_ledger_files(), workers=1), ["focus_kind"], "focus_ms")
+        self.assertEqual(report["throughput"]["interleaved_files"], 1)
+        self.assertEqual(report["throughput"]["inter_arrival_ms"]["p50"], 2000.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from backend.fakes import HashingEmbeddings
+from backend.rag_chain import ReservoirSample, VectorIndexConfig, _VectorStoreBuilder
+
+class TestReservoirSample(unittest.TestCase):
+
+    def test_01_sample_does_not_depend_on_batching(self):
+        x = np.arange(200 * 4, dtype="float32").reshape(200, 4)
+        whole = ReservoirSample(50)
+        whole.add(x)
+        batched = ReservoirSample(50)
+        for offset in range(0, 200, 7):
+            batched.add(x[offset:offset + 7])
+        np.testing.assert_array_equal(whole.rows, batched.rows)
+        self.assertEqual(whole.rows.shape, (50, 4))
+        self.assertGreater(whole.rows[:, 0].max(), 50 * 4)  # Not just the first rows.
+
+    def test_02_short_stream_keeps_every_row(self):
+        sample = ReservoirSample(50)
+        sample.add(np.ones((10, 4), dtype="float32"))
+        self.assertEqual(sample.rows.shape, (10, 4))
+
+class TestVectorStoreBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp(prefix="test_vector_index_"))
+        self.embeddings = HashingEmbeddings(dim=256)
+        self.texts = [f"chunk c{i} about topic t{i % 7} and w{i * 31 % 101}" for i in range(120)]
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _build(self, spec: str):
+        builder = _VectorStoreBuilder(self.embeddings, VectorIndexConfig.from_spec(spec), full_vectors_dir=self.test_dir)
+        for offset in range(0, len(self.texts), 16):
+            batch = [(text, {"doc_id": offset + i}) for i, text in enumerate(self.texts[offset:offset + 16])]
+            builder.add(batch, self.embeddings.embed_documents([text for text, _ in batch]))
+        return builder, builder.finish()
+
+    def test_01_trained_index_keeps_chunk_order(self):
+        for spec in ("flat", "ivf_flat:train_size=40,nlist=2,nprobe=2", "hnsw:bits=16,rescore=0"):
+            builder, store = self._build(spec)
+            self.assertEqual(store.index.ntotal, len(self.texts), spec)
+            self.assertEqual(len(builder.lexical_index), len(self.texts), spec)
+            for chunk_id in (0, 57, 119):
+                doc = store.docstore.search(store.index_to_docstore_id[chunk_id])
+                self.assertEqual(doc.page_content, self.texts[chunk_id], spec)
+                self.assertEqual(doc.metadata["doc_id"], chunk_id, spec)
+            _, ids = store.index.search(np.asarray([self.embeddings.embed_query(self.texts[57])], dtype="float32"), 1)
+            self.assertEqual(ids[0][0], 57, spec)
+        self.assertEqual(list(self.test_dir.iterdir()), [])  # The spill file is gone.
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+"""
+Recall-vs-latency report for the vector index types in backend.rag_chain (AEP_VECTOR_INDEX).
+
+Embeds the corpus once, then builds each candidate index from the same vectors and runs every
+qa/qa.yaml question against it, sweeping the search-time parameters (nprobe, efSearch). For
+each setting it reports Recall@K against the golden doc sources (computed like run_eval.py),
+overlap with exact search, query latency percentiles, build time and in-memory index size
+(for truncated/quantized indexes, the first stage; full-precision vectors for re-scoring are
+memory-mapped), and marks the settings that keep Recall@K at or above MIN_RECALL_THRESHOLD.
+
+Usage:
+    python analysis/ann_recall_report.py
+    AEP_RAG_BACKEND=stub python analysis/ann_recall_report.py --index ivf_pq:pq_m=32 --nprobe 1,4,16
+    python analysis/ann_recall_report.py --index flat --index flat:dims=512,bits=8 --index flat:dims=512,bits=8,rescore=0
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+SDK_ROOT = Path(__file__).parent.parent.resolve()
+if str(SDK_ROOT) not in sys.path:
+    sys.path.insert(0, str(SDK_ROOT))
+
+from backend.rag_chain import RETRIEVER_K, RAGService, ReservoirSample, VectorIndexConfig
+
+QA_FILE_PATH = SDK_ROOT / "qa" / "qa.yaml"
+DOCS_CORPUS_PATH = SDK_ROOT / "docs"
+RESULTS_DIR = SDK_ROOT / "data" / "evaluation_run"
+
+K_FOR_RECALL = 10
+MIN_RECALL_THRESHOLD = 0.68 # Same gate as run_eval.py
+
+DEFAULT_INDEXES = ["flat", "flat:bits=16", "flat:bits=8", "flat:dims=256,bits=8", "hnsw:m=16", "hnsw:m=32",
+                   "hnsw:m=32,bits=8", "ivf_flat", "ivf_flat:bits=8", "ivf_pq", "ivf_pq:pq_m=16"]
+DEFAULT_NPROBE = [1, 2, 4, 8, 16, 32]
+DEFAULT_EF_SEARCH = [16, 32, 64, 128, 256]
+
+
+def load_qa_dataset(file_path: Path) -> list:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or []
+
+def calculate_recall_at_k(retrieved_sources: list, golden_sources: list, k: int) -> float:
+    if not golden_sources:
+        return 1.0 if not retrieved_sources else 0.0
+    top_k_retrieved = retrieved_sources[:k]
+    hits = sum(1 for golden_source in golden_sources if golden_source in top_k_retrieved)
+    return hits / len(golden_sources)
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def embed_corpus(service: RAGService):
+    """Indexes the corpus exactly once and returns its vectors and doc source per row."""
+    store = service.load_and_index_docs()
+    index = store.index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    sources = [store.docstore.search(store.index_to_docstore_id[i]).metadata["doc_source"] for i in range(index.ntotal)]
+    return vectors, sources
+
+def search_all(index, query_vectors, sources: list, k: int):
+    """Runs each query on its own, as the service does, and returns retrieved sources, row ids and latencies."""
+    retrieved, ids, latencies = [], [], []
+    for query in query_vectors:
+        start = time.perf_counter()
+        _, row_ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        row_ids = [i for i in row_ids[0].tolist() if i != -1]
+        ids.append(row_ids)
+        retrieved.append([sources[i] for i in row_ids])
+    return retrieved, ids, latencies
+
+def search_settings(config: VectorIndexConfig, nprobe: list, ef_search: list) -> list:
+    """The config itself, or one copy per search-time value for the parameter its index type has."""
+    if config.index_type == "hnsw":
+        return [VectorIndexConfig.from_spec(f"{config},ef_search={ef}") for ef in ef_search]
+    if config.index_type in ("ivf_flat", "ivf_pq"):
+        return [VectorIndexConfig.from_spec(f"{config},nprobe={n}") for n in nprobe]
+    return [config]
+
+def evaluate(specs: list, nprobe: list, ef_search: list, qa_items: list, vectors, sources: list, query_vectors,
+             full_vectors_dir: Path) -> list:
+    import faiss
+
+    dim = vectors.shape[1]
+    k = max(RETRIEVER_K, K_FOR_RECALL)
+    golden = [item.get("golden_doc_sources") or [] for item in qa_items]
+    exact_index = VectorIndexConfig().build(dim)
+    exact_index.add(vectors)
+    _, exact_ids, _ = search_all(exact_index, query_vectors, sources, k)
+
+    rows = []
+    for spec in specs:
+        config = VectorIndexConfig.from_spec(spec)
+        # Trained on the same sample as the service's index (see _VectorStoreBuilder).
+        sample = ReservoirSample(config.train_size)
+        sample.add(vectors)
+        start = time.perf_counter()
+        index = config.build(dim, sample.rows if config.needs_training else None, full_vectors_dir=full_vectors_dir)
+        index.add(vectors)
+        build_s = time.perf_counter() - start
+        index_bytes = int(faiss.serialize_index(getattr(index, "first_stage", index)).size)
+        for setting in search_settings(config, nprobe, ef_search):
+            setting.apply_search_params(index)
+            retrieved, ids, latencies = search_all(index, query_vectors, sources, k)
+            recalls = [calculate_recall_at_k(r, g, K_FOR_RECALL) for r, g in zip(retrieved, golden)]
+            overlaps = [len(set(a[:K_FOR_RECALL]) & set(e[:K_FOR_RECALL])) / max(1, len(e[:K_FOR_RECALL]))
+                        for a, e in zip(ids, exact_ids)]
+            rows.append({
+                "index": str(setting),
+                "index_type": setting.index_type,
+                "recall_at_k": statistics.mean(recalls),
+                "exact_overlap_at_k": statistics.mean(overlaps),
+                "p50_ms": statistics.median(latencies),
+                "p99_ms": percentile(latencies, 0.99),
+                "build_s": build_s,
+                "index_bytes": index_bytes,
+                "meets_threshold": statistics.mean(recalls) >= MIN_RECALL_THRESHOLD,
+            })
+    return rows
+
+def recommend(rows: list):
+    """The fastest setting (by p50, then size) whose Recall@K stays at or above the threshold."""
+    passing = [row for row in rows if row["meets_threshold"]]
+    return min(passing, key=lambda row: (row["p50_ms"], row["index_bytes"])) if passing else None
+
+def print_report(rows: list, chunk_count: int, question_count: int) -> None:
+    print(f"\nRecall@{K_FOR_RECALL} vs latency: {chunk_count} chunks, {question_count} questions, "
+          f"threshold {MIN_RECALL_THRESHOLD:.2f}\n")
+    width = max(len(row["index"]) for row in rows)
+    header = f"{'index':<{width}} {'recall':>7} {'exact':>6} {'p50 ms':>7} {'p99 ms':>7} {'build s':>8} {'size KB':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        mark = "" if row["meets_threshold"] else "  < threshold"
+        print(f"{row['index']:<{width}} {row['recall_at_k']:>7.4f} {row['exact_overlap_at_k']:>6.2f} {row['p50_ms']:>7.3f} "
+              f"{row['p99_ms']:>7.3f} {row['build_s']:>8.3f} {row['index_bytes'] / 1024:>9.1f}{mark}")
+    best = recommend(rows)
+    if best:
+        print(f"\nRecommended: AEP_VECTOR_INDEX='{best['index']}' "
+              f"(Recall@{K_FOR_RECALL} {best['recall_at_k']:.4f}, p50 {best['p50_ms']:.3f}ms)")
+    else:
+        print(f"\nNo setting reaches Recall@{K_FOR_RECALL} >= {MIN_RECALL_THRESHOLD:.2f}.")
+
+def _int_list(value: str) -> list:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@K vs query latency for the FAISS index types.")
+    parser.add_argument("--index", action="append", dest="indexes",
+                        help=f"Index spec to evaluate (repeatable). Default: {' '.join(DEFAULT_INDEXES)}")
+    parser.add_argument("--nprobe", type=_int_list, default=DEFAULT_NPROBE, help="IVF nprobe values to sweep, comma-separated.")
+    parser.add_argument("--ef-search", type=_int_list, default=DEFAULT_EF_SEARCH, help="HNSW efSearch values to sweep, comma-separated.")
+    parser.add_argument("--qa", type=Path, default=QA_FILE_PATH)
+    parser.add_argument("--docs", type=Path, default=DOCS_CORPUS_PATH)
+    parser.add_argument("--output", type=Path, help="JSON results path. Default: data/evaluation_run/ann_recall_<time>.json")
+    args = parser.parse_args()
+
+    import numpy as np
+
+    qa_items = load_qa_dataset(args.qa)
+    if not qa_items:
+        print(f"No QA items loaded from {args.qa}.", file=sys.stderr)
+        sys.exit(1)
+    service = RAGService(docs_path=args.docs, index_config=VectorIndexConfig())
+    vectors, sources = embed_corpus(service)
+    query_vectors = np.asarray([service.embeddings.embed_query(item["question"]) for item in qa_items], dtype="float32")
+
+    with tempfile.TemporaryDirectory(prefix="ann_recall_") as full_vectors_dir:
+        rows = evaluate(args.indexes or DEFAULT_INDEXES, args.nprobe, args.ef_search, qa_items, vectors, sources,
+                        query_vectors, Path(full_vectors_dir))
+    print_report(rows, len(sources), len(qa_items))
+
+    output = args.output or RESULTS_DIR / f"ann_recall_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"k": K_FOR_RECALL, "threshold": MIN_RECALL_THRESHOLD, "backend": service.backend,
+                   "chunks": len(sources), "questions": len(qa_items), "results": rows,
+                   "recommended": (recommend(rows) or {}).get("index")}, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
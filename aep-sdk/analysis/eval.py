@@ -27,7 +27,7 @@ import sys
 module_root = Path(_dh[0]).parent.parent # In Jupyter, _dh[0] is notebook dir
 sys.path.insert(0, str(module_root))
 
-from backend.rag_chain import get_initialized_rag_graph, RAGState # For RAG graph
+from backend.rag_chain import get_initialized_rag_graph, read_retrieval_log, RAGState # For RAG graph
 from aep.ledger import AEPLedger               # For potential ledger interaction
 from aep.callback import AEPCallbackHandler    # For RAG AEP events
 
@@ -42,10 +42,9 @@ EVAL_RAG_LEDGER_NAME = "evaluation_rag_llm_events"
 eval_rag_ledger = AEPLedger(ledger_name=EVAL_RAG_LEDGER_NAME)
 aep_eval_callback_handler = AEPCallbackHandler(ledger=eval_rag_ledger)
 
-# Retrieval log for this evaluation run
-EVAL_RETRIEVAL_LOG_DIR = module_root / "data" / "evaluation_run"
-EVAL_RETRIEVAL_LOG_DIR.mkdir(parents=True, exist_ok=True)
-eval_retrieval_log_file = EVAL_RETRIEVAL_LOG_DIR / f"retrieval_log_{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+# Retrieval log ledger for this evaluation run, passed to the RAG graph with each query
+EVAL_RETRIEVAL_LOG_DIR = module_root / "data" / "evaluation_run" / f"retrieval_log_{time.strftime('%Y%m%d-%H%M%S')}"
+eval_retrieval_log = AEPLedger(ledger_base_path=EVAL_RETRIEVAL_LOG_DIR, ledger_name="retrieval_log", durability="batch")
 
 # Ensure OpenAI API key is available
 if not os.environ.get("OPENAI_API_KEY"):
@@ -56,7 +55,7 @@ print(f"SDK modules root: {module_root}")
 print(f"QA file: {QA_FILE_PATH}")
 print(f"Docs corpus: {DOCS_CORPUS_PATH}")
 print(f"Eval RAG LLM event ledger: {eval_rag_ledger.current_ledger_file}")
-print(f"Eval retrieval log: {eval_retrieval_log_file}")
+print(f"Eval retrieval log: {EVAL_RETRIEVAL_LOG_DIR}")
 
 
 # %% [markdown]
@@ -218,18 +217,6 @@ def calculate_recall_at_k(retrieved_sources: list, golden_sources: list, k: int)
 K_FOR_RECALL = 10 # Recall@10 as per prod.md
 baseline_results = []
 
-# Ensure the retrieval log specific to this eval run is empty if it exists
-if eval_retrieval_log_file.exists():
-    eval_retrieval_log_file.unlink()
-
-# Modify rag_chain.DEFAULT_RETRIEVAL_LOG_PATH for this run
-# This is a hacky way to point the RAG chain's logging to our eval log.
-# A cleaner solution would be to pass the log path to the RAG chain initialization.
-import backend.rag_chain as rag_chain_module
-original_rag_log_path = rag_chain_module.DEFAULT_RETRIEVAL_LOG_PATH
-rag_chain_module.DEFAULT_RETRIEVAL_LOG_PATH = eval_retrieval_log_file
-print(f"Temporarily changed RAG chain retrieval log to: {eval_retrieval_log_file}")
-
 if rag_app and qa_dataset:
     print(f"\nRunning baseline evaluation for {len(qa_dataset)} questions...")
     for i, qa_item in enumerate(qa_dataset):
@@ -239,11 +226,12 @@ if rag_app and qa_dataset:
         
         print(f"  {i+1}/{len(qa_dataset)}: QID {query_id} - {question[:50]}...", end=" ")
         
-        # Invoking the RAG graph. This will populate `eval_retrieval_log_file` via the `retrieve_documents` node.
+        # Invoking the RAG graph. Its `retrieve_documents` node appends a retrieval event to `eval_retrieval_log`.
         # And it will also trigger the aep_eval_callback_handler for LLM AEP events.
         invocation_config = {
             "callbacks": [aep_eval_callback_handler],
-            "metadata": {"query_id": query_id} 
+            "metadata": {"query_id": query_id},
+            "configurable": {"retrieval_log": eval_retrieval_log},
         }
         initial_state = {"question": question, "query_id": query_id, "context": [], "answer": ""}
         try:
@@ -260,20 +248,11 @@ if rag_app and qa_dataset:
         # time.sleep(0.1)
 
     print("\nBaseline RAG invocations complete.")
-    print(f"Retrieval data logged to: {eval_retrieval_log_file}")
+    print(f"Retrieval data logged to: {EVAL_RETRIEVAL_LOG_DIR}")
 
     # --- Now parse the retrieval log to calculate recall ---
     # This log was generated by the `retrieve_documents` node in the RAG chain.
-    all_retrieval_log_entries = []
-    if eval_retrieval_log_file.exists():
-        with open(eval_retrieval_log_file, 'r') as f_log:
-            for line in f_log:
-                try:
-                    all_retrieval_log_entries.append(json.loads(line))
-                except json.JSONDecodeError:
-                    print(f"Warning: Could not parse line in retrieval log: {line.strip()}")
-    else:
-        print(f"Error: Evaluation retrieval log file not found: {eval_retrieval_log_file}")
+    all_retrieval_log_entries = read_retrieval_log(eval_retrieval_log)
 
     # Create a DataFrame from the retrieval log for easier processing
     df_retrieval_log = pd.DataFrame(all_retrieval_log_entries)
@@ -320,10 +299,6 @@ if rag_app and qa_dataset:
 else:
     print("Skipping baseline evaluation as RAG app or QA dataset is not available.")
 
-# Restore original rag_chain log path if modified
-rag_chain_module.DEFAULT_RETRIEVAL_LOG_PATH = original_rag_log_path
-print(f"Restored RAG chain retrieval log to: {original_rag_log_path}")
-
 
 # %% [markdown]
 # ## 5. AEP Data Collection & Processing (Placeholder)
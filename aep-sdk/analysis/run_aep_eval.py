@@ -1,6 +1,6 @@
 import os
+import logging
 import yaml
-import json
 import time
 import uuid
 from pathlib import Path
@@ -11,16 +11,16 @@ SDK_ROOT = Path(__file__).parent.parent.resolve()
 if str(SDK_ROOT) not in sys.path:
     sys.path.insert(0, str(SDK_ROOT))
 
-from backend.rag_chain import get_initialized_rag_graph, RAGState
+from backend.rag_chain import get_initialized_rag_graph, normalize_doc_source, read_retrieval_log, RAGState
 from aep.ledger import AEPLedger
 from aep.callback import AEPCallbackHandler
+from aep.log import configure_logging, get_logger
 
 # --- Configuration ---
 QA_FILE_PATH = SDK_ROOT / "qa" / "qa.yaml"
 DOCS_CORPUS_PATH = SDK_ROOT / "docs"
-# Note: The original EVAL_RETRIEVAL_LOG_PATH for the rag_chain's internal logging might still be useful
-# for direct comparison or if AEP doesn't capture identical retriever details.
-# For now, we'll let rag_chain log to its default/modified path, and AEP will have its own ledger.
+# The rag_chain's retrieval log events (focus_kind "retrieval") go to the run's AEP ledger too and
+# give the baseline retriever recall, next to the AEP grounded metrics.
 AEP_RUNS_DIR = SDK_ROOT / "data" / "aep_runs"
 AEP_RUNS_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -28,9 +28,8 @@ AEP_RUNS_DIR.mkdir(parents=True, exist_ok=True)
 K_FOR_RECALL = 10
 MIN_RECALL_THRESHOLD = 0.68 # As per run-book for baseline
 
-PRINT_DEBUG_EXTRACT_PAYLOAD = True # Control verbosity
-DEBUG_EXTRACT_PAYLOAD_COUNT = 0
-MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS = 20 # Limit prints per run of extract_doc_sources_from_payload
+# Debug output goes through aep.log; run with AEP_LOG_LEVEL=DEBUG to see per-event details.
+logger = get_logger("analysis.run_aep_eval")
 
 def load_qa_dataset(file_path: Path) -> list:
     if not file_path.exists():
@@ -84,93 +83,37 @@ def calculate_precision_at_k(retrieved_sources: list, golden_sources: list, k: i
     return hits / len(top_k_retrieved_unique)
 
 def extract_doc_sources_from_payload(logged_sources: list, query_id_for_debug: str) -> list:
-    global DEBUG_EXTRACT_PAYLOAD_COUNT
-    DEBUG_EXTRACT_PAYLOAD_COUNT = 0 # Reset for each call to this function if it's per QA item
-
-    extracted_paths = []
+    """
+    The doc sources (relative to docs/, as in qa.yaml) of logged context or retrieval items, read
+    from the 'doc_source' that indexing stores in each chunk's metadata. Items logged before
+    chunks carried it fall back to normalizing their source path.
+    """
+    extracted_sources = []
     if not isinstance(logged_sources, list):
-        if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-            print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}): logged_sources is not a list. Type: {type(logged_sources)}")
-            DEBUG_EXTRACT_PAYLOAD_COUNT +=1
+        logger.debug("logged_sources is not a list. Type: %s", type(logged_sources), extra={"query_id": query_id_for_debug})
         return []
         
     for item_idx, item in enumerate(logged_sources):
-        path = None
-        if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-            print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Processing item: {type(item)} - {str(item)[:100]}...")
-            DEBUG_EXTRACT_PAYLOAD_COUNT +=1
-
+        doc_source = None
         if isinstance(item, dict):
-            if 'doc_source' in item:
-                path = item['doc_source']
-                if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-                    print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Found 'doc_source': {path}")
-                    DEBUG_EXTRACT_PAYLOAD_COUNT +=1
-            elif 'metadata' in item and isinstance(item.get('metadata'), dict) and 'source' in item['metadata']:
-                path = item['metadata']['source']
-                if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-                    print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Found 'metadata.source': {path}")
-                    DEBUG_EXTRACT_PAYLOAD_COUNT +=1
-            else:
-                if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-                    print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): No path found in dict item.")
-                    DEBUG_EXTRACT_PAYLOAD_COUNT +=1
+            metadata = item.get('metadata') if isinstance(item.get('metadata'), dict) else {}
+            doc_source = item.get('doc_source') or metadata.get('doc_source')
+            if doc_source is None and metadata.get('source'):
+                doc_source = normalize_doc_source(str(Path(metadata['source']).resolve()))
+            if doc_source is None:
+                logger.debug("Item %d: no doc_source found in dict item.", item_idx, extra={"query_id": query_id_for_debug})
         elif isinstance(item, str):
-            path = item
-            if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-                print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Item is a string path: {path}")
-                DEBUG_EXTRACT_PAYLOAD_COUNT +=1
+            doc_source = item
         else:
-            if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-                print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Item is not dict or str. Type: {type(item)}")
-                DEBUG_EXTRACT_PAYLOAD_COUNT +=1
+            logger.debug("Item %d is not dict or str. Type: %s", item_idx, type(item), extra={"query_id": query_id_for_debug})
         
-        if path and Path(path).name != "None":
-            original_path_from_log = str(path)
-            path_str = str(Path(path).resolve()) 
-            if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-                print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Path to normalize: '{original_path_from_log}', Resolved: '{path_str}'")
-                DEBUG_EXTRACT_PAYLOAD_COUNT +=1
-
-            sdk_root_str_with_sep = str(SDK_ROOT) + os.sep
-            corrected_path_str = path_str # Start with resolved path
-
-            if path_str.startswith(sdk_root_str_with_sep):
-                path_relative_to_sdk_root = path_str[len(sdk_root_str_with_sep):]
-                # Target: "docs/actual_file.mdx"
-                # Problematic: "docs/docs/actual_file.mdx"
-                double_docs_prefix = os.path.join("docs", "docs") + os.sep
-                single_docs_prefix = "docs" + os.sep
-
-                if path_relative_to_sdk_root.startswith(double_docs_prefix):
-                    corrected_relative_path = path_relative_to_sdk_root.replace(double_docs_prefix, single_docs_prefix, 1)
-                    corrected_path_str = os.path.join(sdk_root_str_with_sep, corrected_relative_path)
-                    if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-                        print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Corrected double 'docs': '{path_str}' -> '{corrected_path_str}'")
-                        DEBUG_EXTRACT_PAYLOAD_COUNT +=1
-                # else: # Path relative to SDK root does not start with "docs/docs/", so no correction needed for this specific issue
-                #    if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-                #        print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Path '{path_relative_to_sdk_root}' does not start with double 'docs'. No correction.")
-                #        DEBUG_EXTRACT_PAYLOAD_COUNT +=1
-            # else: # Path from log does not start with SDK_ROOT, cannot apply relative correction
-            #    if PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-            #        print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Path '{path_str}' not under SDK_ROOT. Not correcting.")
-            #        DEBUG_EXTRACT_PAYLOAD_COUNT +=1
-            
-            extracted_paths.append(corrected_path_str)
-        elif PRINT_DEBUG_EXTRACT_PAYLOAD and DEBUG_EXTRACT_PAYLOAD_COUNT < MAX_DEBUG_EXTRACT_PAYLOAD_PRINTS:
-            if path is None:
-                print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Path is None. Skipping.")
-            else:
-                print(f"DEBUG_EXTRACT (QID: {query_id_for_debug}, Item {item_idx}): Path is '{path}' (filename None). Skipping.")
-            DEBUG_EXTRACT_PAYLOAD_COUNT +=1
+        if doc_source:
+            extracted_sources.append(doc_source)
             
-    return extracted_paths
-
+    return extracted_sources
 
 def run_evaluation_with_aep(rag_graph, qa_data: list, run_id: str) -> tuple[float, float, float, float]:
     """Runs RAG evaluation with AEP, returns Mean Baseline Recall@K, Mean AEP Grounded Recall@K, Mean AEP Grounded Precision@K, Avg AEP Context Length."""
-    global PRINT_DEBUG_EXTRACT_PAYLOAD # Allow modification for specific calls if needed
     if not rag_graph or not qa_data:
         print("Error: RAG graph or QA data not available for evaluation.", file=sys.stderr)
         return 0.0, 0.0, 0.0, 0.0
@@ -180,21 +123,6 @@ def run_evaluation_with_aep(rag_graph, qa_data: list, run_id: str) -> tuple[floa
     aep_callbacks = [AEPCallbackHandler(ledger=aep_ledger)]
     print(f"AEP Ledger initialized for ledger_name: {ledger_name_for_run}. Current log file: {aep_ledger.current_ledger_file}")
 
-    # For baseline retriever recall, we might need the original log from rag_chain.
-    # Let's temporarily redirect rag_chain's logging like in the original script.
-    # This part is for the "Baseline Recall" which relies on the rag_chain's direct logging.
-    eval_retrieval_log_filename = f"ci_retrieval_log_{run_id}.jsonl"
-    eval_retrieval_log_path = SDK_ROOT / "data" / "evaluation_run" / eval_retrieval_log_filename
-    eval_retrieval_log_path.parent.mkdir(parents=True, exist_ok=True)
-    if eval_retrieval_log_path.exists():
-        eval_retrieval_log_path.unlink() # Clear previous log for this run
-    
-    import backend.rag_chain as rag_chain_module
-    original_rag_log_path = getattr(rag_chain_module, 'DEFAULT_RETRIEVAL_LOG_PATH', None)
-    if original_rag_log_path:
-        rag_chain_module.DEFAULT_RETRIEVAL_LOG_PATH = eval_retrieval_log_path
-        print(f"Temporarily changed RAG chain retrieval log to: {eval_retrieval_log_path} for baseline recall.")
-
 
     print(f"Running RAG evaluation with AEP for {len(qa_data)} questions...")
     for i, qa_item in enumerate(qa_data):
@@ -209,7 +137,8 @@ def run_evaluation_with_aep(rag_graph, qa_data: list, run_id: str) -> tuple[floa
         
         try:
             # Invoke with AEP callbacks
-            rag_graph.invoke(initial_state, config={"callbacks": aep_callbacks, "metadata": invocation_metadata})
+            rag_graph.invoke(initial_state, config={"callbacks": aep_callbacks, "metadata": invocation_metadata,
+                                                    "configurable": {"retrieval_log": aep_ledger}})
             print(f"Done.")
         except Exception as e:
             print(f"ERROR invoking RAG for QID {query_id}: {e}", file=sys.stderr)
@@ -223,38 +152,27 @@ def run_evaluation_with_aep(rag_graph, qa_data: list, run_id: str) -> tuple[floa
             continue
     
     print(f"Evaluation RAG invocations complete. AEP data logged to directory: {AEP_RUNS_DIR} with ledger name: {ledger_name_for_run}")
-    if original_rag_log_path:
-        rag_chain_module.DEFAULT_RETRIEVAL_LOG_PATH = original_rag_log_path # Restore
-        print(f"Restored RAG chain retrieval log to: {original_rag_log_path}")
 
-    # --- Calculate Baseline Retriever Recall (from rag_chain's log) ---
+    # --- Calculate Baseline Retriever Recall (from rag_chain's retrieval log events) ---
     baseline_retriever_recalls_at_k = []
-    if eval_retrieval_log_path.exists():
-        retrieval_log_entries = []
-        with open(eval_retrieval_log_path, 'r', encoding='utf-8') as f_log:
-            for line in f_log:
-                try:
-                    retrieval_log_entries.append(json.loads(line))
-                except json.JSONDecodeError:
-                    print(f"Warning: Could not parse line in original retrieval log: {line.strip()}", file=sys.stderr)
+    retrieval_log_entries = read_retrieval_log(aep_ledger)
+    if retrieval_log_entries:
+        # Create a map from query_id to retrieved_items for quick lookup
+        retrieved_items_map = {}
+        for entry in retrieval_log_entries:
+            qid = entry.get("query_id")
+            items = entry.get("retrieved_items", []) # list of dicts with 'doc_source'
+            if qid:
+                retrieved_items_map.setdefault(qid, []).extend([item['doc_source'] for item in items if 'doc_source' in item])
         
-        if retrieval_log_entries:
-            # Create a map from query_id to retrieved_items for quick lookup
-            retrieved_items_map = {}
-            for entry in retrieval_log_entries:
-                qid = entry.get("query_id")
-                items = entry.get("retrieved_items", []) # list of dicts with 'doc_source'
-                if qid:
-                    retrieved_items_map.setdefault(qid, []).extend([item['doc_source'] for item in items if 'doc_source' in item])
-            
-            for qa_item in qa_data:
-                qid = qa_item["id"]
-                golden_sources = [str(Path(gs)) for gs in qa_item.get("golden_doc_sources", []) if gs]
-                retrieved_for_qid = retrieved_items_map.get(qid, [])
-                recall = calculate_recall_at_k(retrieved_for_qid, golden_sources, K_FOR_RECALL)
-                baseline_retriever_recalls_at_k.append(recall)
+        for qa_item in qa_data:
+            qid = qa_item["id"]
+            golden_sources = [gs for gs in qa_item.get("golden_doc_sources", []) if gs]
+            retrieved_for_qid = retrieved_items_map.get(qid, [])
+            recall = calculate_recall_at_k(retrieved_for_qid, golden_sources, K_FOR_RECALL)
+            baseline_retriever_recalls_at_k.append(recall)
     else:
-        print(f"Warning: Original retrieval log file not found: {eval_retrieval_log_path}. Baseline recall will be 0.", file=sys.stderr)
+        print("Warning: No retrieval log events found in the AEP ledger. Baseline recall will be 0.", file=sys.stderr)
 
     mean_baseline_recall = sum(baseline_retriever_recalls_at_k) / len(baseline_retriever_recalls_at_k) if baseline_retriever_recalls_at_k else 0.0
 
@@ -279,18 +197,17 @@ def run_evaluation_with_aep(rag_graph, qa_data: list, run_id: str) -> tuple[floa
 
     # For debugging: create a set of QIDs from the QA dataset
     qa_dataset_qids = {item["id"] for item in qa_data if "id" in item}
-    print(f"DEBUG: Loaded {len(qa_dataset_qids)} QIDs from QA dataset for matching: {sorted(list(qa_dataset_qids))[:5]}...") # Print a few
+    logger.debug("Loaded %d QIDs from QA dataset for matching: %s...", len(qa_dataset_qids), sorted(qa_dataset_qids)[:5])
 
     final_chain_outputs_by_qid = {}
-    print("DEBUG: Starting to process AEP events to find final chain outputs...")
+    logger.debug("Starting to process AEP events to find final chain outputs...")
     for i, event in enumerate(aep_events):
         event_type = event.get("event_type")
 
         if event_type == "chain_output":
             # Basic check for the event structure we expect for chain_output
             if not isinstance(event.get("payload"), dict) or not isinstance(event["payload"].get("outputs"), dict):
-                if i < 200: # Print only for the first few events to avoid spam for non-dict payloads
-                    print(f"DEBUG: Event {i}, type {event_type}, has malformed payload/outputs (not a dict). Skipping.")
+                logger.debug("Event %d, type %s, has malformed payload/outputs (not a dict). Skipping.", i, event_type)
                 continue
             
             payload = event.get("payload", {})
@@ -304,58 +221,45 @@ def run_evaluation_with_aep(rag_graph, qa_data: list, run_id: str) -> tuple[floa
                 has_context = "context" in outputs
 
                 # Print detailed debug info for relevant events
-                if original_qa_qid_from_event in qa_dataset_qids: # Only print if QID matches one from our QA set
-                    print(f"DEBUG: Event {i}: type='{event_type}', event_trace_id='{event.get('trace_id')}', event_run_id='{event.get('run_id')}', event_parent_run_id='{event_parent_run_id}'")
-                    print(f"         outputs_qid='{original_qa_qid_from_event}', has_context={has_context}, outputs_keys={list(outputs.keys())}")
+                if original_qa_qid_from_event in qa_dataset_qids and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Event %d: type='%s', event_trace_id='%s', event_run_id='%s', event_parent_run_id='%s', "
+                                 "outputs_qid='%s', has_context=%s, outputs_keys=%s",
+                                 i, event_type, event.get('trace_id'), event.get('run_id'), event_parent_run_id,
+                                 original_qa_qid_from_event, has_context, list(outputs.keys()))
 
                 if original_qa_qid_from_event and has_context: 
                     if original_qa_qid_from_event in qa_dataset_qids: # Check if this QID is one we care about for eval
                         if event_parent_run_id is None:
-                            if original_qa_qid_from_event in final_chain_outputs_by_qid:
-                                print(f"DEBUG: QID {original_qa_qid_from_event} (root event): Overwriting previous entry.")
-                            else:
-                                print(f"DEBUG: QID {original_qa_qid_from_event} (root event): Storing new entry.")
+                            logger.debug("QID %s (root event): %s entry.", original_qa_qid_from_event,
+                                         "Overwriting previous" if original_qa_qid_from_event in final_chain_outputs_by_qid else "Storing new")
                             final_chain_outputs_by_qid[original_qa_qid_from_event] = outputs
                         elif original_qa_qid_from_event not in final_chain_outputs_by_qid: 
-                            print(f"DEBUG: QID {original_qa_qid_from_event} (non-root event, no prior root): Storing new entry (fallback).")
+                            logger.debug("QID %s (non-root event, no prior root): Storing new entry (fallback).", original_qa_qid_from_event)
                             final_chain_outputs_by_qid[original_qa_qid_from_event] = outputs
                         else:
-                            print(f"DEBUG: QID {original_qa_qid_from_event} (non-root event, root exists): Ignoring fallback, root entry for this QID already exists.")
+                            logger.debug("QID %s (non-root event, root exists): Ignoring fallback, root entry for this QID already exists.", original_qa_qid_from_event)
                     # else: # QID from event not in our QA dataset, so we ignore it for eval
                     #    pass 
     
-    print(f"DEBUG: Processed {len(aep_events)} AEP events. Found final outputs for {len(final_chain_outputs_by_qid)} QIDs: {list(final_chain_outputs_by_qid.keys())[:10]}...")
-
-    # For specific QID debugging of extract_doc_sources_from_payload:
-    # QIDS_TO_DEBUG_EXTRACTION = ["Q000", "Q001"] # Example
-    QIDS_TO_DEBUG_EXTRACTION = [] 
+    logger.debug("Processed %d AEP events. Found final outputs for %d QIDs: %s...",
+                 len(aep_events), len(final_chain_outputs_by_qid), list(final_chain_outputs_by_qid.keys())[:10])
 
     for qa_item_idx, qa_item in enumerate(qa_data):
         query_id = qa_item["id"]
         raw_golden_sources = qa_item.get("golden_doc_sources", [])
-        # Construct golden_sources by assuming paths in qa.yaml are relative to the SDK_ROOT/docs/ directory
-        golden_sources = [str(SDK_ROOT / "docs" / gs) for gs in raw_golden_sources if gs and isinstance(gs, str)]
+        # Paths in qa.yaml are relative to the docs directory, like the doc_source of indexed chunks
+        golden_sources = [gs for gs in raw_golden_sources if gs and isinstance(gs, str)]
         aep_logged_output = final_chain_outputs_by_qid.get(query_id)
-        
-        original_print_debug_flag = PRINT_DEBUG_EXTRACT_PAYLOAD
-        # For QID specific debugging of extract_doc_sources_from_payload if needed by populating QIDS_TO_DEBUG_EXTRACTION
-        # For now, PRINT_DEBUG_EXTRACT_PAYLOAD global flag will control initial burst for first few calls to extract_doc_sources_from_payload
-        if query_id in QIDS_TO_DEBUG_EXTRACTION: 
-            PRINT_DEBUG_EXTRACT_PAYLOAD = True 
-            # These prints are already inside extract_doc_sources_from_payload based on its internal counters
-        # else: PRINT_DEBUG_EXTRACT_PAYLOAD = False # Reset if not in specific list
+
 
         if aep_logged_output:
             raw_logged_sources_from_aep = aep_logged_output.get("context", [])
             aep_final_doc_sources = extract_doc_sources_from_payload(raw_logged_sources_from_aep, query_id)
             
-            # Explicitly print the lists being compared for a few QIDs
-            # Ensure QIDS_TO_PRINT_COMPARISON is defined or default as needed for broader use.
-            # For now, hardcoding a few relevant QIDs for this specific debug session.
-            if query_id in ["Q000", "Q017", "Q071", "Q072", "Q107", "Q108", "Q109"]:
-                print(f"\nDEBUG_METRIC_INPUT (QID: {query_id}):")
-                print(f"  Golden Sources ({len(golden_sources)}): {sorted(golden_sources)}")
-                print(f"  AEP Extracted Sources ({len(aep_final_doc_sources)}): {sorted(list(set(aep_final_doc_sources)))}") # Print unique sorted for easier comparison
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Metric input: golden sources (%d): %s; AEP extracted sources (%d): %s",
+                             len(golden_sources), sorted(golden_sources),
+                             len(aep_final_doc_sources), sorted(set(aep_final_doc_sources)), extra={"query_id": query_id})
             
             grounded_recall = calculate_recall_at_k(aep_final_doc_sources, golden_sources, K_FOR_RECALL)
             grounded_precision = calculate_precision_at_k(aep_final_doc_sources, golden_sources, K_FOR_RECALL)
@@ -367,9 +271,6 @@ def run_evaluation_with_aep(rag_graph, qa_data: list, run_id: str) -> tuple[floa
         aep_grounded_recalls_at_k.append(grounded_recall)
         aep_grounded_precisions_at_k.append(grounded_precision)
 
-        # Restore original debug flag state
-        PRINT_DEBUG_EXTRACT_PAYLOAD = original_print_debug_flag
-
     mean_aep_grounded_recall = sum(aep_grounded_recalls_at_k) / len(aep_grounded_recalls_at_k) if aep_grounded_recalls_at_k else 0.0
     mean_aep_grounded_precision = sum(aep_grounded_precisions_at_k) / len(aep_grounded_precisions_at_k) if aep_grounded_precisions_at_k else 0.0
     
@@ -388,11 +289,11 @@ def run_evaluation_with_aep(rag_graph, qa_data: list, run_id: str) -> tuple[floa
 
 
 def main():
+    configure_logging()
     print("--- Starting AEP Enhanced Evaluation Script ---")
     
     try:
         import openai
-        import logging
         logging.getLogger("openai").setLevel(logging.WARNING)
         logging.getLogger("httpx").setLevel(logging.WARNING)
     except ImportError:
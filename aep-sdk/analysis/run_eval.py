@@ -1,6 +1,5 @@
 import os
 import yaml
-import json
 import time
 import uuid
 from pathlib import Path
@@ -21,14 +20,15 @@ SDK_ROOT = Path(__file__).parent.parent.resolve()
 if str(SDK_ROOT) not in sys.path:
     sys.path.insert(0, str(SDK_ROOT))
 
-from backend.rag_chain import get_initialized_rag_graph, RAGState # For RAG graph
+from aep.ledger import AEPLedger
+from backend.rag_chain import get_initialized_rag_graph, read_retrieval_log, RAGState # For RAG graph
 # AEPLedger and AEPCallbackHandler are not strictly needed for baseline recall script as per run-book.
 
 # --- Configuration ---
 QA_FILE_PATH = SDK_ROOT / "qa" / "qa.yaml"
 DOCS_CORPUS_PATH = SDK_ROOT / "docs"
-EVAL_RETRIEVAL_LOG_PATH = SDK_ROOT / "data" / "evaluation_run" / f"ci_retrieval_log_{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
-EVAL_RETRIEVAL_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+# Retrieval log ledger for this run (a directory; read it with `aep inspect` or read_retrieval_log).
+EVAL_RETRIEVAL_LOG_DIR = SDK_ROOT / "data" / "evaluation_run" / f"ci_retrieval_log_{time.strftime('%Y%m%d-%H%M%S')}"
 
 K_FOR_RECALL = 10
 MIN_RECALL_THRESHOLD = 0.68 # As per run-book
@@ -52,24 +52,12 @@ def calculate_recall_at_k(retrieved_sources: list, golden_sources: list, k: int)
             hits += 1
     return hits / len(golden_sources)
 
-def run_evaluation(rag_graph, qa_data: list, retrieval_log_path: Path) -> float:
-    """Runs RAG evaluation and returns mean Recall@K."""
+def run_evaluation(rag_graph, qa_data: list, retrieval_log: AEPLedger) -> float:
+    """Runs RAG evaluation, logging retrievals to `retrieval_log`, and returns mean Recall@K."""
     if not rag_graph or not qa_data:
         print("Error: RAG graph or QA data not available for evaluation.", file=sys.stderr)
         return 0.0
 
-    # Clear previous log for this run if any
-    if retrieval_log_path.exists():
-        retrieval_log_path.unlink()
-
-    # Temporarily redirect rag_chain's logging to our eval log for this run
-    # This requires rag_chain.py to be importable and its global var accessible.
-    # This is a bit of a hack. A cleaner way is for rag_chain functions to accept log_path.
-    import backend.rag_chain as rag_chain_module
-    original_rag_log_path = rag_chain_module.DEFAULT_RETRIEVAL_LOG_PATH
-    rag_chain_module.DEFAULT_RETRIEVAL_LOG_PATH = retrieval_log_path
-    print(f"Temporarily changed RAG chain retrieval log to: {retrieval_log_path}")
-
     print(f"Running RAG evaluation for {len(qa_data)} questions...")
     for i, qa_item in enumerate(qa_data):
         question = qa_item["question"]
@@ -79,7 +67,7 @@ def run_evaluation(rag_graph, qa_data: list, retrieval_log_path: Path) -> float:
         
         # For CI, no AEP callback is specified for the RAG call itself.
         # The query_id is still important for the retrieval log.
-        invocation_config = {"metadata": {"query_id": query_id}}
+        invocation_config = {"metadata": {"query_id": query_id}, "configurable": {"retrieval_log": retrieval_log}}
         initial_state = {"question": question, "query_id": query_id, "context": [], "answer": ""}
         
         try:
@@ -89,22 +77,10 @@ def run_evaluation(rag_graph, qa_data: list, retrieval_log_path: Path) -> float:
             print(f"ERROR invoking RAG for QID {query_id}: {e}", file=sys.stderr)
             continue
     
-    print(f"\nEvaluation RAG invocations complete. Retrieval data logged to: {retrieval_log_path}")
-    rag_chain_module.DEFAULT_RETRIEVAL_LOG_PATH = original_rag_log_path # Restore
-    print(f"Restored RAG chain retrieval log to: {original_rag_log_path}")
-
-    # --- Parse the retrieval log to calculate recall ---
-    all_retrieval_log_entries = []
-    if retrieval_log_path.exists():
-        with open(retrieval_log_path, 'r', encoding='utf-8') as f_log:
-            for line in f_log:
-                try:
-                    all_retrieval_log_entries.append(json.loads(line))
-                except json.JSONDecodeError:
-                    print(f"Warning: Could not parse line in retrieval log: {line.strip()}", file=sys.stderr)
-    else:
-        print(f"Error: Evaluation retrieval log file not found: {retrieval_log_path}", file=sys.stderr)
-        return 0.0
+    print(f"\nEvaluation RAG invocations complete. Retrieval data logged to: {retrieval_log.ledger_base_path}")
+
+    # --- Read the retrieval log to calculate recall ---
+    all_retrieval_log_entries = read_retrieval_log(retrieval_log)
 
     if not all_retrieval_log_entries:
         print("No entries found in retrieval log. Cannot calculate recall.", file=sys.stderr)
@@ -189,7 +165,8 @@ def main():
         sys.exit(1)
     print("RAG system initialized successfully.")
 
-    recall_result = run_evaluation(rag_application, qa_items, EVAL_RETRIEVAL_LOG_PATH)
+    retrieval_log = AEPLedger(ledger_base_path=EVAL_RETRIEVAL_LOG_DIR, ledger_name="retrieval_log", durability="batch")
+    recall_result = run_evaluation(rag_application, qa_items, retrieval_log)
     
     print(f"Final Mean Recall@{K_FOR_RECALL}: {recall_result:.4f}")
     
@@ -0,0 +1,274 @@
+"""
+Semantic answer cache for the RAG chain (see RAGService.generate_answer).
+
+An answer is reused for a new question when the two query embeddings are close (cosine
+similarity at or above `threshold`) and the question retrieved the same context, as captured
+by a fingerprint of the context chunks, prompt and model. Questions retrieved without an
+embedding (the lexical fast path) only match the same normalized question over the same
+context, so the cache never adds an embedding call. Entries live in a small FAISS
+inner-product index, are evicted least recently used first, and are persisted to an
+append-only MsgPack file so they survive restarts.
+
+Each process keeps its own copy in memory; server workers sharing a file see each other's
+answers after a restart. Entry ids are random 63-bit integers, so workers never reuse each
+other's ids. Appends and compaction hold an exclusive lock on a sidecar '.lock' file, and a
+writer reopens the file when compaction elsewhere has replaced it.
+"""
+import os
+import random
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import msgpack
+
+from aep.log import get_logger
+
+if TYPE_CHECKING:
+    import portalocker
+
+logger = get_logger(__name__)
+
+DEFAULT_ANSWER_CACHE_SIZE = 1024
+DEFAULT_ANSWER_CACHE_THRESHOLD = 0.95
+# Neighbours checked per lookup: a paraphrase may sit closest to an entry for other context.
+LOOKUP_NEIGHBOURS = 8
+# The file is rewritten with only the newest max_entries records once it holds this many times more.
+COMPACT_RATIO = 2
+FILE_LOCK_TIMEOUT_S = 10
+
+
+class SemanticAnswerCache:
+    """
+    Thread-safe nearest-neighbour cache of generated answers.
+
+    Args:
+        path: MsgPack file the entries are persisted to and loaded from. None keeps them in memory only.
+        max_entries: Entries kept; the least recently used is evicted first. 0 disables the cache.
+        threshold: Minimum cosine similarity between query embeddings for a hit.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_entries: int = DEFAULT_ANSWER_CACHE_SIZE,
+                 threshold: float = DEFAULT_ANSWER_CACHE_THRESHOLD):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        self._dim: Optional[int] = None
+        # Entry id -> (fingerprint, answer, question, question key, has embedding), least recently
+        # used first. The embeddings live only in the index.
+        self._entries: "OrderedDict[int, Tuple[str, str, str, Optional[str], bool]]" = OrderedDict()
+        self._exact: Dict[Tuple[str, str], int] = {}  # (question key, fingerprint) -> entry id
+        self._records = 0  # Records in the file, as far as this process knows.
+        self._file = None
+        self._lock = threading.Lock()
+        if self.enabled and self.path is not None:
+            self._load()
+
+    @classmethod
+    def from_env(cls, path: Optional[Path] = None) -> "SemanticAnswerCache":
+        return cls(
+            path=path,
+            max_entries=int(os.environ.get("AEP_ANSWER_CACHE_SIZE", DEFAULT_ANSWER_CACHE_SIZE)),
+            threshold=float(os.environ.get("AEP_ANSWER_CACHE_THRESHOLD", DEFAULT_ANSWER_CACHE_THRESHOLD)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]):
+        import faiss
+        import numpy as np
+
+        vector = np.array([embedding], dtype="float32")
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, embedding: Optional[Sequence[float]], fingerprint: str,
+               question_key: Optional[str] = None) -> Optional[str]:
+        """
+        The cached answer for the same question (by question_key) or, given its embedding, a
+        similar one, with the same context fingerprint; None if there is none.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            answer = None
+            entry_id = self._exact.get((question_key, fingerprint)) if question_key is not None else None
+            if entry_id is not None:
+                self._entries.move_to_end(entry_id)
+                answer = self._entries[entry_id][1]
+            elif embedding is not None and self._index is not None and self._index.ntotal and len(embedding) == self._dim:
+                similarities, ids = self._index.search(self._normalize(embedding), min(LOOKUP_NEIGHBOURS, self._index.ntotal))
+                for similarity, entry_id in zip(similarities[0].tolist(), ids[0].tolist()):
+                    if similarity < self.threshold:
+                        break
+                    entry = self._entries.get(entry_id)
+                    if entry is not None and entry[0] == fingerprint:
+                        self._entries.move_to_end(entry_id)
+                        answer = entry[1]
+                        break
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return answer
+
+    def store(self, question: str, embedding: Optional[Sequence[float]], fingerprint: str, answer: str,
+              question_key: Optional[str] = None) -> None:
+        """Caches `answer`. Without an embedding it can only be found again by question_key."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry_id = random.getrandbits(63)
+            while entry_id in self._entries:
+                entry_id = random.getrandbits(63)
+            vector = self._normalize(embedding)[0].tolist() if embedding is not None else None
+            self._add(entry_id, fingerprint, answer, question, question_key, vector)
+            if self._file is not None:
+                with self._file_lock():
+                    self._reopen_if_replaced()
+                    self._write(entry_id, fingerprint, answer, question, question_key, vector)
+                    if self._records > COMPACT_RATIO * max(self.max_entries, len(self._entries)):
+                        self._compact()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # --- Internals (called with the lock held) ---
+
+    def _add(self, entry_id: int, fingerprint: str, answer: str, question: str, question_key: Optional[str],
+             vector: Optional[List[float]]) -> None:
+        import faiss
+        import numpy as np
+
+        if vector is not None:
+            if self._index is None or len(vector) != self._dim:
+                if self._index is not None:
+                    logger.warning("Embedding dimension changed (%s -> %d); clearing the answer cache.", self._dim, len(vector))
+                    self._entries.clear()
+                    self._exact.clear()
+                self._dim = len(vector)
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self._dim))
+            self._index.add_with_ids(np.array([vector], dtype="float32"), np.array([entry_id], dtype="int64"))
+        if question_key is not None:
+            replaced = self._exact.get((question_key, fingerprint))
+            if replaced is not None:
+                self._evict(replaced)
+            self._exact[(question_key, fingerprint)] = entry_id
+        self._entries[entry_id] = (fingerprint, answer, question, question_key, vector is not None)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, entry_id: int) -> None:
+        import numpy as np
+
+        fingerprint, _, _, question_key, has_vector = self._entries.pop(entry_id)
+        if has_vector:
+            self._index.remove_ids(np.array([entry_id], dtype="int64"))
+        if question_key is not None and self._exact.get((question_key, fingerprint)) == entry_id:
+            del self._exact[(question_key, fingerprint)]
+
+    def _write(self, entry_id: int, fingerprint: str, answer: str, question: str, question_key: Optional[str],
+               vector: Optional[Sequence[float]]) -> None:
+        self._write_record({"id": entry_id, "fp": fingerprint, "a": answer, "q": question, "k": question_key,
+                            "v": array("f", vector).tobytes() if vector is not None else None, "ts": time.time()})
+
+    def _write_record(self, record: Dict[str, Any]) -> None:
+        self._file.write(msgpack.packb(record))
+        self._file.flush()
+        self._records += 1
+
+    # --- File internals (called with the file lock held) ---
+
+    def _file_lock(self) -> "portalocker.Lock":
+        """Exclusive across processes sharing the file: appends and compaction never interleave."""
+        import portalocker
+        return portalocker.Lock(self.path.with_suffix(self.path.suffix + ".lock"), "a", timeout=FILE_LOCK_TIMEOUT_S)
+
+    def _read_records(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """Every record in the file, oldest first, and whether an unreadable tail was dropped."""
+        records = []
+        if not self.path.exists():
+            return records, False
+        unpacker = msgpack.Unpacker(raw=False)
+        with open(self.path, "rb") as f:
+            unpacker.feed(f.read())
+        try:
+            for record in unpacker:
+                records.append(record)
+        except (ValueError, TypeError, msgpack.ExtraData) as e:
+            logger.warning("Ignoring the unreadable tail of answer cache %s: %s", self.path, e)
+            return records, True
+        return records, False
+
+    def _reopen_if_replaced(self) -> None:
+        """Another process compacted the file: later appends must go to the new one, not the unlinked inode."""
+        try:
+            replaced = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            replaced = True
+        if replaced:
+            self._file.close()
+            self._file = open(self.path, "ab")
+            self._records = 0
+
+    def _load(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._file_lock():
+            records, torn = self._read_records()
+            try:
+                for record in records:
+                    vector = array("f", record["v"]).tolist() if record["v"] is not None else None
+                    self._add(record["id"], record["fp"], record["a"], record["q"], record.get("k"), vector)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning("Ignoring malformed records in answer cache %s: %s", self.path, e)
+                torn = True
+            if records:
+                logger.info("Loaded %d cached answers from %s", len(self._entries), self.path)
+            self._records = len(records)
+            # Rewriting drops evicted entries and a torn tail, which would otherwise hide later appends.
+            if torn or self._records > len(self._entries):
+                self._compact()
+            else:
+                self._file = open(self.path, "ab")
+
+    def _compact(self) -> None:
+        """
+        Rewrites the file with its newest max_entries records (one per question key and
+        fingerprint), read back from the file so other workers' appends are kept, and swaps
+        it in atomically.
+        """
+        if self._file is not None:
+            self._file.close()
+        records, _ = self._read_records()
+        newest, seen = [], set()
+        for record in reversed(records):
+            exact_key = (record.get("k"), record.get("fp"))
+            if record.get("k") is not None and exact_key in seen:
+                continue
+            seen.add(exact_key)
+            newest.append(record)
+            if len(newest) >= self.max_entries:
+                break
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        self._file = open(tmp_path, "wb")
+        self._records = 0
+        for record in reversed(newest):
+            self._write_record(record)
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
@@ -0,0 +1,107 @@
+"""
+Local stand-ins for the OpenAI models used by rag_chain, for load tests and offline runs.
+
+Select them with AEP_RAG_BACKEND=stub (see rag_chain). They cost nothing, need no API key
+and behave the same on every run:
+- StubChatModel answers after a fixed latency (AEP_STUB_LLM_LATENCY_MS, default 300ms), so
+  the server's concurrency behaviour under slow LLM calls can be measured. When streamed, the
+  latency is spread evenly over the answer's words.
+- HashingEmbeddings maps text to a normalized hashed bag-of-words vector. Texts sharing words
+  end up close together, so retrieval still returns plausible documents.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_STUB_LLM_LATENCY_MS = 300.0
+DEFAULT_STUB_EMBEDDING_DIM = 384
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that sleeps for `latency_ms` and returns a short answer derived from the prompt."""
+
+    latency_ms: float = DEFAULT_STUB_LLM_LATENCY_MS
+
+    @classmethod
+    def from_env(cls) -> "StubChatModel":
+        return cls(latency_ms=float(os.environ.get("AEP_STUB_LLM_LATENCY_MS", DEFAULT_STUB_LLM_LATENCY_MS)))
+
+    @property
+    def _llm_type(self) -> str:
+        return "aep-stub-chat"
+
+    @staticmethod
+    def _answer_text(messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return f"Stub answer {digest} ({len(prompt)} prompt characters)."
+
+    def _answer(self, messages: List[BaseMessage]) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer_text(messages)))])
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        return re.findall(r"\S+\s*", self._answer_text(messages))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_ms / 1000)
+        return self._answer(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._answer(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        for token in tokens:
+            time.sleep(self.latency_ms / 1000 / len(tokens))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        for token in tokens:
+            await asyncio.sleep(self.latency_ms / 1000 / len(tokens))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic embeddings: each lower-cased word is hashed into one of `dim` buckets with a
+    hash-derived sign, and the resulting vector is L2-normalized.
+
+    Args:
+        dim: Vector dimension. Defaults to AEP_STUB_EMBEDDING_DIM or 384.
+    """
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim or int(os.environ.get("AEP_STUB_EMBEDDING_DIM", DEFAULT_STUB_EMBEDDING_DIM))
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in _TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
@@ -0,0 +1,87 @@
+"""
+In-process BM25 index over the document chunks, built next to the FAISS store (see rag_chain).
+
+Postings are kept per term in two parallel typed arrays (chunk ids ascending, term
+frequencies), so the index costs a few bytes per posting instead of a Python object each.
+Chunk ids are positions in insertion order, the same positions the FAISS index assigns.
+"""
+import heapq
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_MAX_TF = 0xFFFF  # Term frequencies are stored as unsigned 16-bit values.
+# Question words and function words that match nearly every chunk.
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it its of on or should that the "
+    "their them there these this to use using what when where which who why will with would you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric words, without stopwords."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an append-only collection of chunks.
+
+    Args:
+        k1: Term frequency saturation.
+        b: Document length normalization.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._ids: Dict[str, array] = {}
+        self._tfs: Dict[str, array] = {}
+        self._lengths = array("I")
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, texts: Iterable[str]) -> None:
+        """Indexes `texts` as the next chunk ids."""
+        for text in texts:
+            chunk_id = len(self._lengths)
+            tokens = tokenize(text)
+            for term, tf in Counter(tokens).items():
+                if term not in self._ids:
+                    self._ids[term] = array("I")
+                    self._tfs[term] = array("H")
+                self._ids[term].append(chunk_id)
+                self._tfs[term].append(min(tf, _MAX_TF))
+            self._lengths.append(len(tokens))
+            self._total_length += len(tokens)
+
+    def idf(self, term: str) -> float:
+        df = len(self._ids.get(term, ()))
+        return math.log(1.0 + (len(self._lengths) - df + 0.5) / (df + 0.5))
+
+    def max_score(self, query: str) -> float:
+        """Upper bound of any chunk's score for `query`: every term present with saturated frequency."""
+        return sum(self.idf(term) * (self.k1 + 1) for term in set(tokenize(query)) if term in self._ids)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """The `k` best (chunk id, score) pairs for `query`, best first. Chunks matching no term are left out."""
+        if not self._lengths:
+            return []
+        avg_length = self._total_length / len(self._lengths) or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            ids = self._ids.get(term)
+            if ids is None:
+                continue
+            idf = self.idf(term)
+            for chunk_id, tf in zip(ids, self._tfs[term]):
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
@@ -1,6 +1,9 @@
-from fastapi import FastAPI, HTTPException, Body, Depends
+from fastapi import FastAPI, HTTPException, Body, Depends, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, Optional, Sequence, Tuple
+import asyncio
+import json
 import time
 import hashlib
 # import msgpack # Not directly used here anymore
@@ -9,31 +12,42 @@ import uuid # For generating query_id
 import os # For checking OPENAI_API_KEY
 from contextlib import asynccontextmanager # Added for lifespan
 
+from langchain_core.callbacks.base import BaseCallbackHandler
 from langgraph.graph import StateGraph # For type hinting the graph
 
 # Assuming the aep package is installed or in PYTHONPATH
 try:
-    from aep.ledger import AEPLedger
+    from aep.ledger import AEPLedger, process_shard_id
     from aep.callback import AEPCallbackHandler
-    from .rag_chain import get_initialized_rag_graph, RAGState, DEFAULT_DOCS_PATH as RAG_DEFAULT_DOCS_PATH
+    from aep.metrics import REGISTRY
+    from aep.log import configure_logging, get_logger, shutdown_logging
+    from aep.retention import LedgerMaintenance, RetentionPolicy
+    from .rag_chain import get_rag_service, RAGState, DEFAULT_DOCS_PATH as RAG_DEFAULT_DOCS_PATH, RETRIEVAL_LOG_NAME, USE_STUB_MODELS
 except ImportError:
     import sys
     # This fallback is for when running main.py directly and backend isn't seen as a package part of aep-sdk
     # This setup assumes that `aep-sdk` is in sys.path or `aep` and `backend` are sibling packages.
     sdk_root = Path(__file__).parent.parent.resolve()
     sys.path.insert(0, str(sdk_root)) 
-    from aep.ledger import AEPLedger
+    from aep.ledger import AEPLedger, process_shard_id
     from aep.callback import AEPCallbackHandler
-    from backend.rag_chain import get_initialized_rag_graph, RAGState, DEFAULT_DOCS_PATH as RAG_DEFAULT_DOCS_PATH
+    from aep.metrics import REGISTRY
+    from aep.log import configure_logging, get_logger, shutdown_logging
+    from aep.retention import LedgerMaintenance, RetentionPolicy
+    from backend.rag_chain import get_rag_service, RAGState, DEFAULT_DOCS_PATH as RAG_DEFAULT_DOCS_PATH, RETRIEVAL_LOG_NAME, USE_STUB_MODELS
+
+logger = get_logger(__name__)
 
 # --- Environment Check ---
-if not os.environ.get("OPENAI_API_KEY"):
-    print("WARNING: OPENAI_API_KEY not set. RAG functionality will likely fail.")
+if not USE_STUB_MODELS and not os.environ.get("OPENAI_API_KEY"):
+    logger.warning("OPENAI_API_KEY not set. RAG functionality will likely fail.")
 
 # --- Lifespan for resource management ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("FastAPI startup: Initializing resources...")
+    # Route aep/backend logging through the non-blocking queue writer (level/format via AEP_LOG_LEVEL/AEP_LOG_FORMAT).
+    configure_logging()
+    logger.info("FastAPI startup: Initializing resources...")
     # Ledger for /collect endpoint (human dwell time)
     # Using a relative path from where the backend might be run, or an absolute path.
     # For consistency with AEPLedger defaults, let's use its default base path and a specific name.
@@ -41,43 +55,76 @@ async def lifespan(app: FastAPI):
     # This implies a specific file, not a ledger name for rotation. AEPLedger expects a dir & name.
     # Let's assume data/.aep/ is relative to aep-sdk root for now.
     sdk_root_path = Path(__file__).parent.parent
-    human_ledger_base = sdk_root_path / "data" / ".aep" # Consistent with prod.md example intent
-    app.state.collect_ledger = AEPLedger(ledger_base_path=human_ledger_base, ledger_name="human_dwell_events")
-    print(f"Collect ledger initialized: {app.state.collect_ledger.current_ledger_file}")
+    # AEP_LEDGER_DIR overrides the ledger directory (e.g. a scratch directory for load tests).
+    ledger_dir = Path(os.environ["AEP_LEDGER_DIR"]) if os.environ.get("AEP_LEDGER_DIR") else sdk_root_path / "data" / ".aep"
+    human_ledger_base = ledger_dir # Consistent with prod.md example intent
+    # With `uvicorn --workers N` every worker runs this lifespan. AEP_LEDGER_SHARD_PER_PROCESS=1 gives
+    # each worker its own current file (no cross-worker lock contention); readers merge all shards.
+    ledger_shard = process_shard_id() if os.environ.get("AEP_LEDGER_SHARD_PER_PROCESS") == "1" else None
+    # AEP_LEDGER_FRAMED=1 writes new files in the checksummed frame format (torn writes are recovered
+    # before the first write); AEP_LEDGER_DURABILITY picks fsync (default), flush or batch.
+    ledger_options = {
+        "shard": ledger_shard,
+        "framed": os.environ.get("AEP_LEDGER_FRAMED") == "1",
+        "durability": os.environ.get("AEP_LEDGER_DURABILITY", "fsync"),
+    }
+    app.state.collect_ledger = AEPLedger(ledger_base_path=human_ledger_base, ledger_name="human_dwell_events", **ledger_options)
+    logger.info("Collect ledger initialized: %s", app.state.collect_ledger.current_ledger_file)
 
     # Ledger and Callback Handler for RAG LLM events
-    rag_llm_ledger_base = sdk_root_path / "data" / ".aep"
-    app.state.rag_llm_ledger = AEPLedger(ledger_base_path=rag_llm_ledger_base, ledger_name="rag_llm_events")
+    rag_llm_ledger_base = ledger_dir
+    app.state.rag_llm_ledger = AEPLedger(ledger_base_path=rag_llm_ledger_base, ledger_name="rag_llm_events", **ledger_options)
     app.state.aep_rag_callback_handler = AEPCallbackHandler(ledger=app.state.rag_llm_ledger)
-    print(f"RAG LLM ledger initialized: {app.state.rag_llm_ledger.current_ledger_file}")
-
-    # RAG Graph Initialization
-    # The run-book example: rag_graph = get_initialized_rag_graph(ledger_llm)
-    # My get_initialized_rag_graph doesn't take a ledger for LLM events directly,
-    # it uses a global llm and the callback handler is passed during .invoke().
-    # The important part is that the docs are loaded.
-    print("Initializing RAG graph...")
+    logger.info("RAG LLM ledger initialized: %s", app.state.rag_llm_ledger.current_ledger_file)
+    # Retrieval log, passed to the graph with each query. Batched by default: one buffered append per
+    # query, written every batch_size queries and at shutdown (AEP_RETRIEVAL_LOG_DURABILITY overrides).
+    app.state.retrieval_ledger = AEPLedger(
+        ledger_base_path=ledger_dir, ledger_name=RETRIEVAL_LOG_NAME,
+        **{**ledger_options, "durability": os.environ.get("AEP_RETRIEVAL_LOG_DURABILITY", "batch")})
+    logger.info("Retrieval log ledger initialized: %s", app.state.retrieval_ledger.current_ledger_file)
+
+    # Background retention/compaction, configured via AEP_RETENTION_* and AEP_COMPACT* (off by default).
+    retention_policy = RetentionPolicy.from_env()
+    app.state.ledger_maintenance = None
+    if retention_policy.enabled:
+        interval_s = float(os.environ.get("AEP_LEDGER_MAINTENANCE_INTERVAL_S", "300"))
+        app.state.ledger_maintenance = LedgerMaintenance(
+            [app.state.collect_ledger, app.state.rag_llm_ledger, app.state.retrieval_ledger], retention_policy,
+            interval_s=interval_s
+        ).start()
+        logger.info("Ledger maintenance every %.0fs: %s", interval_s, retention_policy)
+
+    # RAG service initialization
+    # The service builds its models, prompt, vector store and graph lazily; the callback
+    # handler is passed during .invoke(). The important part is that the docs are loaded.
+    logger.info("Initializing RAG service...")
     # Ensure docs path is correct, relative to aep-sdk root
     docs_path_for_rag = sdk_root_path / "docs" 
     if not docs_path_for_rag.exists() or not list(docs_path_for_rag.glob("**/*.md*x")):
-        print(f"WARNING: RAG documents directory '{docs_path_for_rag}' is empty or missing.")
+        logger.warning("RAG documents directory '%s' is empty or missing.", docs_path_for_rag)
         docs_path_for_rag.mkdir(parents=True, exist_ok=True)
         with open(docs_path_for_rag / "_placeholder.md", "w") as f:
             f.write("# Placeholder Document\nFor RAG initialization.")
-        print(f"Created a placeholder document in {docs_path_for_rag}")
-    app.state.rag_graph_instance = get_initialized_rag_graph(docs_path_str=str(docs_path_for_rag))
-    print("RAG graph initialized.")
+        logger.info("Created a placeholder document in %s", docs_path_for_rag)
+    app.state.rag_service = get_rag_service(docs_path_for_rag)
+    # Warm up during startup (index the docs, build the graph) so the first query does not pay
+    # for it. Runs in a thread to keep the event loop free. AEP_RAG_WARMUP=0 defers it to first use.
+    if os.environ.get("AEP_RAG_WARMUP", "1") != "0":
+        await asyncio.to_thread(app.state.rag_service.warmup)
+        logger.info("RAG service ready.")
     
     yield
     
-    print("FastAPI shutdown: Cleaning up resources...")
-    # AEPLedger doesn't have an explicit close() method for file handles as it opens/closes on append.
-    # If it did, e.g., for flushing a buffer or closing a continuously open file, it would be called here.
-    # print(f"Closing collect ledger: {app.state.collect_ledger.current_ledger_file}")
-    # app.state.collect_ledger.close() # If AEPLedger had a close()
-    # print(f"Closing RAG LLM ledger: {app.state.rag_llm_ledger.current_ledger_file}")
-    # app.state.rag_llm_ledger.close() # If AEPLedger had a close()
-    print("Ledger cleanup (if any) handled by AEPLedger's append/rotate logic.")
+    logger.info("FastAPI shutdown: Cleaning up resources...")
+    if app.state.ledger_maintenance is not None:
+        app.state.ledger_maintenance.stop(timeout=30)
+    app.state.rag_service.close()
+    # Writes out events still buffered in 'batch' durability mode.
+    app.state.collect_ledger.close()
+    app.state.rag_llm_ledger.close()
+    app.state.retrieval_ledger.close()
+    logger.info("Ledgers flushed.")
+    shutdown_logging()
 
 # --- Application Setup ---
 app = FastAPI(
@@ -86,6 +133,33 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# --- Metrics ---
+# Only the ingest and query endpoints are timed; everything else (docs, /metrics itself) is skipped.
+INSTRUMENTED_PATHS = ("/collect", "/rag/query")
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    path = request.url.path
+    if path not in INSTRUMENTED_PATHS:
+        return await call_next(request)
+    in_flight = REGISTRY.gauge("aep_http_requests_in_flight", "Requests currently being handled.", path=path)
+    in_flight.inc()
+    start = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        in_flight.dec()
+        REGISTRY.histogram(
+            "aep_http_request_seconds", "Request latency by path and status.", path=path, status=status
+        ).observe(time.perf_counter() - start)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # --- Models ---
 class CollectAEPPayload(BaseModel):
     doc_source: str = Field(..., description="Source identifier for the document, e.g., path or URL.")
@@ -98,12 +172,14 @@ class HumanDwellEventRequest(BaseModel):
 
 class RAGQueryRequest(BaseModel):
     question: str
+    bypass_cache: bool = Field(False, description="Generate a fresh answer instead of reusing a cached one.")
     # session_id: Optional[str] = None # Could be used for session-specific context later
 
 class RAGQueryResponse(BaseModel):
     query_id: str
     question: str
     answer: str
+    cached: bool = Field(False, description="Whether the answer came from the semantic answer cache.")
     # context: Optional[List[Dict[str, Any]]] = None # Optionally return context sources
 
 # --- Endpoints ---
@@ -125,48 +201,118 @@ async def collect_aep_event(event_data: HumanDwellEventRequest = Body(...), app_
         app.state.collect_ledger.append(ledger_event) # Use ledger from app.state
         return {"message": "AEP event accepted", "event_id": event_id, "timestamp": current_ts}
     except Exception as e:
-        print(f"Error writing to collect_ledger: {e}")
+        logger.error("Error writing to collect_ledger: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to record AEP event: {str(e)}")
 
-@app.post("/rag/query", response_model=RAGQueryResponse)
-async def query_rag_endpoint(request_data: RAGQueryRequest = Body(...), app_state: FastAPI = Depends(lambda: app)):
-    if not hasattr(app.state, 'rag_graph_instance') or app.state.rag_graph_instance is None:
-        print("Error: RAG graph not initialized. Please wait or check server logs.")
+def _start_rag_query(request_data: RAGQueryRequest, extra_callbacks: Sequence[BaseCallbackHandler] = (),
+                     stream: bool = False) -> Tuple[str, Dict[str, Any], RAGState]:
+    """Checks the RAG service is usable and returns a new query's id, invocation config and initial graph state."""
+    if getattr(app.state, 'rag_service', None) is None:
+        logger.error("RAG service not initialized. Please wait or check server logs.")
         raise HTTPException(status_code=503, detail="RAG service not yet available.")
+    if not USE_STUB_MODELS and not os.environ.get("OPENAI_API_KEY"):
+        raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured on server.")
 
     query_id = f"rag_query_{uuid.uuid4()}"
     
     invocation_config = {
-        "callbacks": [app.state.aep_rag_callback_handler], # Use handler from app.state
-        "metadata": {"query_id": query_id}
+        "callbacks": [app.state.aep_rag_callback_handler, *extra_callbacks], # Use handler from app.state
+        "metadata": {"query_id": query_id},
+        "configurable": {"retrieval_log": app.state.retrieval_ledger},
     }
     
     initial_rag_state: RAGState = {
         "question": request_data.question,
         "query_id": query_id,
         "context": [], 
-        "answer": ""
+        "answer": "",
+        "bypass_answer_cache": request_data.bypass_cache,
+        "stream_answer": stream,
     }
+    return query_id, invocation_config, initial_rag_state
 
-    try:
-        if not os.environ.get("OPENAI_API_KEY"):
-            raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured on server.")
-        
-        result_state = app.state.rag_graph_instance.invoke(initial_rag_state, config=invocation_config)
-        answer = result_state.get("answer", "No answer generated.")
-        if not answer:
-             answer = "The RAG chain could not generate an answer for this query."
+def _answer_from_state(result_state: Dict[str, Any]) -> str:
+    answer = result_state.get("answer", "No answer generated.")
+    if not answer:
+         answer = "The RAG chain could not generate an answer for this query."
+    return answer
 
+@app.post("/rag/query", response_model=RAGQueryResponse)
+async def query_rag_endpoint(request_data: RAGQueryRequest = Body(...), app_state: FastAPI = Depends(lambda: app)):
+    query_id, invocation_config, initial_rag_state = _start_rag_query(request_data)
+    try:
+        result_state = app.state.rag_service.graph.invoke(initial_rag_state, config=invocation_config)
         return RAGQueryResponse(
             query_id=query_id,
             question=request_data.question,
-            answer=answer
+            answer=_answer_from_state(result_state),
+            cached=bool(result_state.get("answer_cached")),
         )
     except Exception as e:
-        print(f"Error during RAG query processing: {e}")
+        logger.exception("Error during RAG query processing", extra={"query_id": query_id})
         # Consider more specific error handling based on exception types
         raise HTTPException(status_code=500, detail=f"Error processing RAG query: {str(e)}")
 
+class _TokenQueueHandler(BaseCallbackHandler):
+    """Hands streamed LLM tokens from the graph's worker thread to the event loop through a queue."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: "asyncio.Queue[Tuple[str, Any]]"):
+        self._loop = loop
+        self._queue = queue
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if token:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, ("token", token))
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/rag/query/stream")
+async def query_rag_stream_endpoint(request_data: RAGQueryRequest = Body(...)):
+    """
+    Streaming variant of /rag/query as server-sent events. Retrieval runs first; the answer is
+    then sent as 'token' events while the LLM generates it, and a final 'done' event carries the
+    same fields as RAGQueryResponse. A cached answer arrives as a single token. Errors after the
+    stream has started are reported as an 'error' event.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+    query_id, invocation_config, initial_rag_state = _start_rag_query(
+        request_data, extra_callbacks=[_TokenQueueHandler(loop, queue)], stream=True)
+
+    def run_graph() -> None:
+        try:
+            result_state = app.state.rag_service.graph.invoke(initial_rag_state, config=invocation_config)
+            loop.call_soon_threadsafe(queue.put_nowait, ("done", result_state))
+        except Exception as e:
+            logger.exception("Error during streaming RAG query processing", extra={"query_id": query_id})
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+
+    async def events() -> AsyncIterator[str]:
+        # The graph keeps running if the client disconnects, so its answer is still logged and cached.
+        graph_task = asyncio.create_task(asyncio.to_thread(run_graph))
+        yield _sse("start", {"query_id": query_id})
+        streamed = False
+        while True:
+            kind, value = await queue.get()
+            if kind == "token":
+                streamed = True
+                yield _sse("token", {"token": value})
+            elif kind == "done":
+                answer = _answer_from_state(value)
+                if not streamed:
+                    yield _sse("token", {"token": answer})
+                yield _sse("done", {"query_id": query_id, "question": request_data.question, "answer": answer,
+                                    "cached": bool(value.get("answer_cached"))})
+                break
+            else:
+                yield _sse("error", {"query_id": query_id, "detail": f"Error processing RAG query: {value}"})
+                break
+        await graph_task
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/")
 async def read_root():
     return {"message": "AEP SDK Backend is running. Use /docs for API details."}
@@ -0,0 +1,328 @@
+"""
+Write- and read-throughput benchmarks for AEPLedger.
+
+Measures events/s and per-append latency percentiles for AEPLedger.append across payload
+sizes, durability modes, writer threads and processes, and rotation sizes, plus read and
+merge throughput for current files and gzip archives. Results are written as JSON so runs
+from different versions can be compared:
+
+    python benchmarks/bench_ledger.py                       # full suite
+    python benchmarks/bench_ledger.py --quick --only write  # smoke run
+    python benchmarks/bench_ledger.py --compare benchmarks/results/<baseline>.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import msgpack
+
+# Ensure aep-sdk root is in PYTHONPATH for imports
+SDK_ROOT = Path(__file__).parent.parent.resolve()
+if str(SDK_ROOT) not in sys.path:
+    sys.path.insert(0, str(SDK_ROOT))
+
+from aep.ledger import AEPLedger, DEFAULT_MAX_FILE_SIZE_BYTES  # noqa: E402
+from aep.stats import compute_stats  # noqa: E402
+
+RESULTS_DIR = SDK_ROOT / "benchmarks" / "results"
+PAYLOAD_SIZES = (128, 1024, 16 * 1024)
+DURABILITY_MODES = ("fsync", "flush", "batch")
+WRITER_COUNTS = (1, 4, 8)
+ROTATION_SIZES = (64 * 1024, DEFAULT_MAX_FILE_SIZE_BYTES, 16 * 1024 * 1024)
+# A regression is reported when throughput drops by more than this fraction.
+REGRESSION_THRESHOLD = 0.10
+
+
+def make_event(i: int, payload_bytes: int) -> Dict[str, Any]:
+    """A callback-shaped event whose packed size is roughly `payload_bytes`."""
+    return {
+        "id": f"bench-{os.getpid()}-{threading.get_ident()}-{i}",
+        "ts": time.time(),
+        "focus_ms": float(i % 1000),
+        "focus_kind": "exec_latency" if i % 2 else "human_dwell",
+        "event_type": "llm_end",
+        "payload": {"text": "x" * max(0, payload_bytes - 120)},
+    }
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _latency_summary(latencies_us: List[float]) -> Dict[str, Any]:
+    latencies_us.sort()
+    return {
+        "p50_us": percentile(latencies_us, 0.5),
+        "p99_us": percentile(latencies_us, 0.99),
+        "max_us": latencies_us[-1] if latencies_us else None,
+        "mean_us": statistics.fmean(latencies_us) if latencies_us else None,
+    }
+
+
+def _append_events(ledger: AEPLedger, count: int, payload_bytes: int, latencies_us: List[float]) -> None:
+    events = [make_event(i, payload_bytes) for i in range(count)]
+    for event in events:
+        start = time.perf_counter_ns()
+        ledger.append(event)
+        latencies_us.append((time.perf_counter_ns() - start) / 1000)
+
+
+def _process_writer(base_path: str, count: int, payload_bytes: int, ledger_kwargs: Dict[str, Any], ready, go, queue) -> None:
+    ledger = AEPLedger(ledger_base_path=base_path, ledger_name="bench", **ledger_kwargs)
+    latencies_us: List[float] = []
+    ready.set()
+    go.wait()
+    _append_events(ledger, count, payload_bytes, latencies_us)
+    ledger.close()
+    queue.put(latencies_us)
+
+
+def bench_write(work_dir: Path, events: int, payload_bytes: int = 1024, durability: str = "fsync",
+                writers: int = 1, use_processes: bool = False, max_file_size_bytes: int = DEFAULT_MAX_FILE_SIZE_BYTES,
+                framed: bool = True, sharded: bool = False) -> Dict[str, Any]:
+    """
+    Appends `events` events in total, split across `writers` threads or processes that
+    share one ledger directory, and reports throughput and append latency.
+    """
+    base_path = Path(tempfile.mkdtemp(prefix="write_", dir=work_dir))
+    ledger_kwargs = dict(max_file_size_bytes=max_file_size_bytes, framed=framed, durability=durability)
+    per_writer = max(1, events // writers)
+    latencies_us: List[float] = []
+
+    if use_processes:
+        ctx = multiprocessing.get_context("spawn")
+        queue = ctx.Queue()
+        go = ctx.Event()
+        ready_events, procs = [], []
+        for w in range(writers):
+            ready = ctx.Event()
+            kwargs = dict(ledger_kwargs, shard=f"w{w}") if sharded else ledger_kwargs
+            proc = ctx.Process(target=_process_writer, args=(str(base_path), per_writer, payload_bytes, kwargs, ready, go, queue))
+            proc.start()
+            ready_events.append(ready)
+            procs.append(proc)
+        for ready in ready_events:
+            ready.wait()
+        start = time.perf_counter()
+        go.set()
+        for _ in procs:
+            latencies_us.extend(queue.get())
+        elapsed = time.perf_counter() - start
+        for proc in procs:
+            proc.join()
+    else:
+        if sharded:
+            ledgers = [AEPLedger(ledger_base_path=base_path, ledger_name="bench", shard=f"w{w}", **ledger_kwargs)
+                       for w in range(writers)]
+        else:
+            # Threads share one instance, as they do in the backend.
+            ledgers = [AEPLedger(ledger_base_path=base_path, ledger_name="bench", **ledger_kwargs)] * writers
+        per_thread: List[List[float]] = [[] for _ in range(writers)]
+        threads = [threading.Thread(target=_append_events, args=(ledgers[w], per_writer, payload_bytes, per_thread[w]))
+                   for w in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for ledger in set(ledgers):
+            ledger.close()
+        elapsed = time.perf_counter() - start
+        for thread_latencies in per_thread:
+            latencies_us.extend(thread_latencies)
+
+    reader = AEPLedger(ledger_base_path=base_path, ledger_name="bench")
+    files = reader.get_all_ledger_files(include_current=True)
+    written = sum(len(reader.read_events(path)) for path in files)
+    total = per_writer * writers
+    result = {
+        "events": total,
+        "events_written": written,
+        "seconds": elapsed,
+        "events_per_s": total / elapsed if elapsed else None,
+        "mb_per_s": sum(path.stat().st_size for path in files) / elapsed / 1e6 if elapsed else None,
+        "files": len(files),
+    }
+    result.update(_latency_summary(latencies_us))
+    shutil.rmtree(base_path, ignore_errors=True)
+    return result
+
+
+def _populate(base_path: Path, events: int, payload_bytes: int, max_file_size_bytes: int) -> AEPLedger:
+    ledger = AEPLedger(ledger_base_path=base_path, ledger_name="bench", max_file_size_bytes=max_file_size_bytes,
+                       framed=True, durability="batch", batch_size=256)
+    for i in range(events):
+        ledger.append(make_event(i, payload_bytes))
+    ledger.close()
+    return ledger
+
+
+def _read_result(events: int, total_bytes: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        "events": events,
+        "bytes": total_bytes,
+        "seconds": elapsed,
+        "events_per_s": events / elapsed if elapsed else None,
+        "mb_per_s": total_bytes / elapsed / 1e6 if elapsed else None,
+    }
+
+
+def bench_read(work_dir: Path, events: int, payload_bytes: int = 1024) -> Dict[str, Dict[str, Any]]:
+    """Read throughput for one large current file, for gzip archives, and for a merge of the archives."""
+    results: Dict[str, Dict[str, Any]] = {}
+
+    # Current file: rotation disabled so everything stays in one uncompressed file.
+    base_path = Path(tempfile.mkdtemp(prefix="read_current_", dir=work_dir))
+    ledger = _populate(base_path, events, payload_bytes, max_file_size_bytes=1 << 40)
+    current = ledger.current_ledger_file
+    start = time.perf_counter()
+    count = sum(1 for _ in ledger.iter_events(current))
+    results["read_current"] = _read_result(count, current.stat().st_size, time.perf_counter() - start)
+    shutil.rmtree(base_path, ignore_errors=True)
+
+    # Archives: small rotation size so the events end up in many gzip segments.
+    base_path = Path(tempfile.mkdtemp(prefix="read_archives_", dir=work_dir))
+    ledger = _populate(base_path, events, payload_bytes, max_file_size_bytes=256 * 1024)
+    archives = ledger.get_all_ledger_files(include_current=False)
+    total_bytes = sum(path.stat().st_size for path in archives)
+    start = time.perf_counter()
+    count = sum(1 for path in archives for _ in ledger.iter_events(path))
+    results["read_gzip_segments"] = _read_result(count, total_bytes, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    stats = compute_stats(ledger, archives, workers=1)
+    results["stats_serial"] = _read_result(stats.events, total_bytes, time.perf_counter() - start)
+    workers = min(4, os.cpu_count() or 1)
+    if workers > 1:
+        start = time.perf_counter()
+        stats = compute_stats(ledger, archives, workers=workers)
+        results[f"stats_{workers}_workers"] = _read_result(stats.events, total_bytes, time.perf_counter() - start)
+
+    # Merge: the same work 'aep merge' does (read, dedupe, sort, write one gzip file).
+    merged_path = base_path / "merged.msgpack.gz"
+    start = time.perf_counter()
+    from aep.cli import handle_merge
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            handle_merge(argparse.Namespace(output_file=str(merged_path), input_files=[str(path) for path in archives]))
+        finally:
+            sys.stdout = stdout
+    results["merge_gzip_segments"] = _read_result(count, total_bytes, time.perf_counter() - start)
+    shutil.rmtree(base_path, ignore_errors=True)
+    return results
+
+
+def run_suite(work_dir: Path, events: int, only: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    scenarios: Dict[str, Any] = {}
+    for size in PAYLOAD_SIZES:
+        scenarios[f"write/payload_{size}B"] = lambda size=size: bench_write(work_dir, events, payload_bytes=size)
+    for mode in DURABILITY_MODES:
+        scenarios[f"write/durability_{mode}"] = lambda mode=mode: bench_write(work_dir, events, durability=mode)
+    scenarios["write/durability_fsync_legacy_format"] = lambda: bench_write(work_dir, events, framed=False)
+    for writers in WRITER_COUNTS:
+        scenarios[f"write/threads_{writers}"] = lambda w=writers: bench_write(work_dir, events, writers=w)
+        if writers > 1:
+            scenarios[f"write/processes_{writers}_shared"] = lambda w=writers: bench_write(
+                work_dir, events, writers=w, use_processes=True)
+            scenarios[f"write/processes_{writers}_sharded"] = lambda w=writers: bench_write(
+                work_dir, events, writers=w, use_processes=True, sharded=True)
+    for rotation in ROTATION_SIZES:
+        scenarios[f"write/rotation_{rotation // 1024}KB"] = lambda r=rotation: bench_write(
+            work_dir, events, durability="flush", max_file_size_bytes=r)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, run in scenarios.items():
+        if only and not name.startswith(only):
+            continue
+        print(f"{name} ...", end=" ", flush=True)
+        results[name] = run()
+        print(f"{results[name]['events_per_s']:.0f} events/s, p50={results[name]['p50_us']:.0f}us, p99={results[name]['p99_us']:.0f}us")
+    if not only or "read".startswith(only) or only.startswith("read"):
+        print("read ...", flush=True)
+        for name, result in bench_read(work_dir, events * 5).items():
+            results[f"read/{name}"] = result
+            print(f"  read/{name}: {result['events_per_s']:.0f} events/s, {result['mb_per_s']:.1f} MB/s")
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SDK_ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "msgpack": ".".join(map(str, msgpack.version)),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> int:
+    """Prints the events/s ratio against a baseline run; returns the number of regressions."""
+    regressions = 0
+    print(f"\n{'scenario':<40} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name, result in results.items():
+        before = baseline.get(name, {}).get("events_per_s")
+        after = result.get("events_per_s")
+        if not before or not after:
+            continue
+        ratio = after / before
+        flag = ""
+        if ratio < 1 - REGRESSION_THRESHOLD:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{name:<40} {before:>12.0f} {after:>12.0f} {ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="AEPLedger write/read throughput benchmarks.")
+    parser.add_argument("--events", type=int, default=5000, help="Events appended per write scenario. Default: 5000")
+    parser.add_argument("--quick", action="store_true", help="Run with 500 events per scenario.")
+    parser.add_argument("--only", default=None, help="Only run scenarios whose name starts with this prefix (e.g. 'write/durability', 'read').")
+    parser.add_argument("--work-dir", default=None, help="Directory for the benchmark ledgers (the disk being measured). Default: a temp dir.")
+    parser.add_argument("--output", default=None, help="JSON results file. Default: benchmarks/results/ledger-<commit>-<time>.json")
+    parser.add_argument("--compare", default=None, help="Baseline JSON results to compare events/s against.")
+    args = parser.parse_args()
+
+    events = 500 if args.quick else args.events
+    work_dir = Path(tempfile.mkdtemp(prefix="aep_bench_", dir=args.work_dir))
+    try:
+        results = run_suite(work_dir, events, args.only)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    env = environment()
+    report = {"benchmark": "ledger", "events_per_scenario": events, "environment": env, "results": results}
+    output = Path(args.output) if args.output else RESULTS_DIR / f"ledger-{env['git_commit'] or 'unknown'}-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(results, baseline.get("results", {})):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
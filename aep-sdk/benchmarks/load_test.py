@@ -0,0 +1,317 @@
+"""
+End-to-end load test for the FastAPI backend (/collect, /rag/query and /rag/query/stream).
+
+Starts `backend.main:app` under uvicorn with the stub models (AEP_RAG_BACKEND=stub: fixed-latency
+LLM, deterministic embeddings; no OpenAI quota is used) and a scratch ledger directory, then
+drives an open-loop mix of dwell beacons and RAG queries at a target rate with an async HTTP
+client. Reports throughput, latency percentiles, error rates and ledger bytes written per
+request, and writes the report as JSON. For streamed queries (rag_stream) it also reports the
+time to the first token event (over a real server only: with --in-process, httpx delivers the
+whole response body at once):
+
+    python benchmarks/load_test.py --rps 100 --duration 30 --mix collect=0.9,rag=0.1
+    python benchmarks/load_test.py --workers 4 --server-env AEP_LEDGER_SHARD_PER_PROCESS=1
+    python benchmarks/load_test.py --url http://localhost:8000 --ledger-dir data/.aep   # existing server
+    python benchmarks/load_test.py --in-process --rps 20 --duration 5                  # no uvicorn needed
+    python benchmarks/load_test.py --rps 20 --mix rag=0.5,rag_stream=0.5               # streamed vs. not
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import yaml
+
+SDK_ROOT = Path(__file__).parent.parent.resolve()
+if str(SDK_ROOT) not in sys.path:
+    sys.path.insert(0, str(SDK_ROOT))
+
+RESULTS_DIR = SDK_ROOT / "benchmarks" / "results"
+QA_FILE_PATH = SDK_ROOT / "qa" / "qa.yaml"
+ENDPOINTS = {"collect": "/collect", "rag": "/rag/query", "rag_stream": "/rag/query/stream"}
+FALLBACK_QUESTIONS = ["What is LangChain?", "Explain the concept of a LangChain Agent."]
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'collect=0.9,rag=0.1' -> normalized weights per request kind."""
+    weights: Dict[str, float] = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in ENDPOINTS:
+            raise ValueError(f"Unknown request kind '{kind}'; expected one of {', '.join(ENDPOINTS)}.")
+        weights[kind] = float(weight or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("The request mix needs a positive weight.")
+    return {kind: weight / total for kind, weight in weights.items()}
+
+
+def load_questions() -> List[str]:
+    if not QA_FILE_PATH.exists():
+        return FALLBACK_QUESTIONS
+    with open(QA_FILE_PATH, "r", encoding="utf-8") as f:
+        return [item["question"] for item in yaml.safe_load(f) or [] if item.get("question")] or FALLBACK_QUESTIONS
+
+
+def make_request(kind: str, i: int, rng: random.Random, questions: List[str]) -> Tuple[str, Dict[str, Any]]:
+    if kind == "collect":
+        return ENDPOINTS[kind], {
+            "focus_ms": rng.randint(200, 30000),
+            "payload": {"doc_source": f"concepts/doc_{rng.randint(0, 199)}.mdx"},
+            "focus_kind": "human_dwell",
+            "session_id": f"load-{i}",
+        }
+    return ENDPOINTS[kind], {"question": questions[i % len(questions)]}
+
+
+def _directory_bytes(path: Optional[Path]) -> int:
+    if path is None or not path.exists():
+        return 0
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def run_server(port: int, env: Dict[str, str], workers: int, startup_timeout_s: float):
+    """Runs uvicorn with backend.main:app in a subprocess until the block exits."""
+    cmd = [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=SDK_ROOT, env=dict(os.environ, **env))
+    try:
+        deadline = time.monotonic() + startup_timeout_s
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Server exited during startup with code {proc.returncode}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server did not start within {startup_timeout_s:.0f}s")
+            time.sleep(0.25)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextlib.asynccontextmanager
+async def in_process_client(env: Dict[str, str], timeout_s: float):
+    """Serves the app through httpx's ASGI transport in this process (smoke tests; shares the CPU with the client)."""
+    os.environ.update(env)
+    from backend.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout_s) as client:
+            yield client
+
+
+async def drive(client: httpx.AsyncClient, rps: float, duration_s: float, mix: Dict[str, float],
+                seed: int, warmup: int) -> Tuple[List[Dict[str, Any]], float, float]:
+    """
+    Sends requests open-loop: request i is issued at start + i / rps whether or not earlier
+    ones have completed, so a saturated server shows up as rising latency, not a lower send rate.
+
+    Returns:
+        (samples, elapsed seconds, worst scheduling lag in seconds).
+    """
+    rng = random.Random(seed)
+    questions = load_questions()
+    kinds, weights = zip(*mix.items())
+    for i in range(warmup):
+        for kind in kinds:
+            path, body = make_request(kind, -1 - i, rng, questions)
+            await client.post(path, json=body)
+
+    samples: List[Dict[str, Any]] = []
+
+    async def send(kind: str, i: int) -> None:
+        path, body = make_request(kind, i, rng, questions)
+        start = time.perf_counter()
+        sample: Dict[str, Any] = {"kind": kind}
+        try:
+            if kind == "rag_stream":
+                async with client.stream("POST", path, json=body) as response:
+                    sample["status"] = response.status_code
+                    async for line in response.aiter_lines():
+                        if line == "event: token" and "ttft_ms" not in sample:
+                            sample["ttft_ms"] = (time.perf_counter() - start) * 1000
+            else:
+                response = await client.post(path, json=body)
+                sample["status"] = response.status_code
+        except httpx.HTTPError as e:
+            sample["status"] = None
+            sample["error"] = type(e).__name__
+        sample["latency_ms"] = (time.perf_counter() - start) * 1000
+        samples.append(sample)
+
+    total = int(rps * duration_s)
+    tasks = []
+    max_lag = 0.0
+    start = time.perf_counter()
+    for i in range(total):
+        target = start + i / rps
+        delay = target - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            max_lag = max(max_lag, -delay)
+        tasks.append(asyncio.create_task(send(rng.choices(kinds, weights)[0], i)))
+    await asyncio.gather(*tasks)
+    return samples, time.perf_counter() - start, max_lag
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": _percentile(latencies, 0.5),
+        "p90": _percentile(latencies, 0.9),
+        "p99": _percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else None,
+        "mean": statistics.fmean(latencies) if latencies else None,
+    }
+
+
+def summarize(samples: List[Dict[str, Any]], elapsed_s: float) -> Dict[str, Any]:
+    latencies = sorted(sample["latency_ms"] for sample in samples)
+    ttfts = sorted(sample["ttft_ms"] for sample in samples if "ttft_ms" in sample)
+    ok = [sample for sample in samples if sample.get("status") is not None and sample["status"] < 400]
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        key = str(sample.get("status") or sample.get("error"))
+        statuses[key] = statuses.get(key, 0) + 1
+    summary = {
+        "requests": len(samples),
+        "ok": len(ok),
+        "error_rate": 1 - len(ok) / len(samples) if samples else None,
+        "throughput_rps": len(ok) / elapsed_s if elapsed_s else None,
+        "latency_ms": _latency_summary(latencies),
+        "statuses": statuses,
+    }
+    if ttfts:
+        summary["ttft_ms"] = _latency_summary(ttfts)
+    return summary
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\nSent {report['target_rps']:.0f} rps for {report['duration_s']:.0f}s "
+          f"(elapsed {report['elapsed_s']:.1f}s, worst send lag {report['max_send_lag_ms']:.0f}ms)")
+    print(f"{'kind':<10} {'requests':>9} {'ok rps':>9} {'errors':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind, summary in report["by_kind"].items():
+        latency = summary["latency_ms"]
+        print(f"{kind:<10} {summary['requests']:>9} {summary['throughput_rps']:>9.1f} {summary['error_rate']:>8.1%} "
+              f"{latency['p50']:>9.1f} {latency['p90']:>9.1f} {latency['p99']:>9.1f} {latency['max']:>9.1f}")
+        ttft = summary.get("ttft_ms")
+        if ttft:
+            print(f"{'  ttft':<10} {'':>9} {'':>9} {'':>8} "
+                  f"{ttft['p50']:>9.1f} {ttft['p90']:>9.1f} {ttft['p99']:>9.1f} {ttft['max']:>9.1f}")
+    ledger = report.get("ledger")
+    if ledger:
+        print(f"\nLedger bytes written: {ledger['bytes_written']} ({ledger['bytes_per_request']:.1f} per request)")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    scratch = None if args.url else Path(tempfile.mkdtemp(prefix="aep_load_"))
+    ledger_dir = Path(args.ledger_dir) if args.ledger_dir else (scratch / "ledger" if scratch else None)
+    env = dict(item.split("=", 1) for item in args.server_env)
+    env.update({"AEP_RAG_BACKEND": "stub", "AEP_STUB_LLM_LATENCY_MS": str(args.llm_latency_ms)})
+    if scratch is not None:
+        env.setdefault("AEP_LEDGER_DIR", str(ledger_dir))
+        env.setdefault("AEP_ANSWER_CACHE_DIR", str(scratch / "answer_cache"))
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+
+    try:
+        async with contextlib.AsyncExitStack() as stack:
+            if args.in_process:
+                client = await stack.enter_async_context(in_process_client(env, args.timeout))
+            else:
+                base_url = args.url or stack.enter_context(run_server(_free_port(), env, args.workers, args.startup_timeout))
+                client = await stack.enter_async_context(httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits))
+            bytes_before = _directory_bytes(ledger_dir)
+            samples, elapsed_s, max_lag = await drive(client, args.rps, args.duration, mix, args.seed, args.warmup)
+        # Measured after shutdown, once events buffered in 'batch' durability mode are on disk.
+        bytes_written = _directory_bytes(ledger_dir) - bytes_before
+    finally:
+        if scratch is not None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    report: Dict[str, Any] = {
+        "benchmark": "load",
+        "target_rps": args.rps,
+        "duration_s": args.duration,
+        "mix": mix,
+        "llm_latency_ms": args.llm_latency_ms,
+        "workers": None if args.in_process or args.url else args.workers,
+        "server_env": env,
+        "elapsed_s": elapsed_s,
+        "max_send_lag_ms": max_lag * 1000,
+        "overall": summarize(samples, elapsed_s),
+        "by_kind": {kind: summarize([s for s in samples if s["kind"] == kind], elapsed_s) for kind in mix},
+    }
+    if ledger_dir is not None:
+        report["ledger"] = {"bytes_written": bytes_written, "bytes_per_request": bytes_written / len(samples) if samples else 0}
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test for the AEP backend with stub LLM and embeddings.")
+    parser.add_argument("--rps", type=float, default=50, help="Target requests per second. Default: 50")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to send requests for. Default: 30")
+    parser.add_argument("--mix", default="collect=0.9,rag=0.1", help="Request mix as kind=weight pairs. Default: collect=0.9,rag=0.1")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Latency of the stub LLM. Default: 300")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes. Default: 1")
+    parser.add_argument("--server-env", action="append", default=[], help="Extra KEY=VALUE environment for the server (repeatable).")
+    parser.add_argument("--url", default=None, help="Target an already running server instead of starting one.")
+    parser.add_argument("--ledger-dir", default=None, help="Ledger directory to measure bytes written in (with --url).")
+    parser.add_argument("--in-process", action="store_true", help="Serve the app in this process via ASGI instead of uvicorn.")
+    parser.add_argument("--warmup", type=int, default=3, help="Unrecorded requests of each kind sent first. Default: 3")
+    parser.add_argument("--max-connections", type=int, default=500, help="Client connection pool size. Default: 500")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds. Default: 60")
+    parser.add_argument("--startup-timeout", type=float, default=180, help="Seconds to wait for the server to start. Default: 180")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request mix and payloads. Default: 0")
+    parser.add_argument("--output", default=None, help="JSON report path. Default: benchmarks/results/load-<time>.json")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(run(args))
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print_report(report)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Report written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())